@@ -1,22 +1,36 @@
+import asyncio
 import json
-from datetime import timedelta, datetime
+import shutil
+import uuid
+from datetime import timedelta, datetime, date, time
 from zoneinfo import ZoneInfo
-from typing import Optional, Any
+from typing import Optional, Any, List
 from io import BytesIO
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Query, Header
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, undefer_group
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
 
 from weasyprint import HTML
 
-from .db import models
+from .db import models, cie10, rollups, panel, busqueda, outbox, versiones, usuarios, idempotencia, auditoria, serie_signos, exportacion_fhir, sincronizacion, censo, administraciones
 from .db.session import SessionLocal, engine
 from .db.base import Base
 from . import schemas
+from .core.eventos import despachador, Suscripcion
+from .core.auditoria import auditor
+from .core.exportacion_fhir import exportador
+from .core import fhir
+from .core import condicional, signos_vitales
+from .core.compresion import CompresionMiddleware
+from .core.cache_pacientes import cache_pacientes, HISTORIA, ADMISION
+from .core.disponibilidad import BaseDatosNoDisponible, abrir_sesion, circuito, consulta_cancelada, monitor
+from .core.modo_degradado import ModoDegradadoMiddleware
+from .core import perfilador, trazas, control_carga
+from .core.config import settings
 from .core.security import (
     authenticate_user,
     create_access_token,
@@ -38,6 +52,31 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Modo degradado: respuestas guardadas sin comprimir (dentro de la compresión)
+if settings.MODO_DEGRADADO:
+    app.add_middleware(
+        ModoDegradadoMiddleware,
+        ttl_segundos=settings.DEGRADADO_TTL_SEGUNDOS,
+        max_entradas=settings.DEGRADADO_MAX_ENTRADAS,
+        max_bytes=settings.DEGRADADO_MAX_BYTES,
+    )
+
+# Perfilado de una petición con X-Perfilar (solo si está habilitado: sin costo en otro caso)
+if settings.PERFILADOR_HABILITADO:
+    app.add_middleware(perfilador.PerfiladorMiddleware)
+
+# Span de servidor por petición con contexto W3C (solo con un exportador configurado)
+if trazas.habilitadas():
+    app.add_middleware(trazas.TrazasMiddleware)
+
+# Compresión brotli/gzip negociada por Accept-Encoding para respuestas grandes
+app.add_middleware(CompresionMiddleware, minimo_bytes=settings.COMPRESION_MINIMO_BYTES)
+
+# Control de admisión (el más externo): lo que excede el presupuesto de su clase
+# de ruta se rechaza con 503 antes de ocupar un hilo o una conexión
+if settings.CONTROL_CARGA_HABILITADO:
+    app.add_middleware(control_carga.ControlCargaMiddleware)
+
 @app.on_event("startup")
 async def startup_event():
     """Intenta crear tablas si no existen."""
@@ -45,19 +84,70 @@ async def startup_event():
         Base.metadata.create_all(bind=engine)
     except Exception as e:
         print(f"[ADVERTENCIA] No se pudieron crear tablas en startup: {e}")
+    trazas.configurar(engine)
+    despachador.iniciar()
+    auditor.iniciar()
+    monitor.iniciar()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await despachador.detener()
+    await auditor.detener()
+    await monitor.detener()
+    await asyncio.to_thread(exportador.detener)
+    await asyncio.to_thread(trazas.cerrar)
+
+def bd_no_disponible(reintentar_en: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Base de datos no disponible temporalmente. Intente de nuevo."},
+        headers={"Retry-After": str(reintentar_en)},
+    )
+
+@app.exception_handler(BaseDatosNoDisponible)
+async def circuito_abierto_handler(request: Request, exc: BaseDatosNoDisponible):
+    return bd_no_disponible(exc.reintentar_en)
+
+@app.exception_handler(OperationalError)
+async def error_operacional_handler(request: Request, exc: OperationalError):
+    if consulta_cancelada(exc):
+        # statement_timeout: la BD está disponible, la consulta fue demasiado costosa
+        return JSONResponse(
+            status_code=504,
+            content={"detail": "La consulta excedió el tiempo máximo. Acote el rango o los filtros."},
+        )
+    # Conexión caída; el circuito ya lo contó (handle_error)
+    return bd_no_disponible(settings.CIRCUITO_ESPERA_SEGUNDOS)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_agotado_handler(request: Request, exc: PoolTimeoutError):
+    # No pasa por el motor: el pool se agotó esperando a una BD lenta
+    circuito.registrar_fallo()
+    return bd_no_disponible(settings.CIRCUITO_ESPERA_SEGUNDOS)
 
 templates = Jinja2Templates(directory="backend/templates", autoescape=True)
+trazas.instrumentar_plantillas(templates)
 
 # ==========================================
 # UTILIDADES
 # ==========================================
 def get_db():
-    db = SessionLocal()
+    db = abrir_sesion(settings.BD_TIMEOUT_CONSULTA_MS)
     try:
         yield db
     finally:
         db.close()
 
+def get_db_con_limite(milisegundos: int):
+    """Como get_db, con un statement_timeout propio para la ruta."""
+    def dependencia():
+        db = abrir_sesion(milisegundos)
+        try:
+            yield db
+        finally:
+            db.close()
+    return dependencia
+
 def calcular_edad_real(fecha_nacimiento):
     """Calcula la edad precisa basada en la fecha actual de Colombia."""
     if not fecha_nacimiento:
@@ -65,6 +155,114 @@ def calcular_edad_real(fecha_nacimiento):
     hoy = datetime.now(COLOMBIA_TZ).date()
     return hoy.year - fecha_nacimiento.year - ((hoy.month, hoy.day) < (fecha_nacimiento.month, fecha_nacimiento.day))
 
+def validadores_paciente(vista: str, documento_id: int, version):
+    """
+    ETag y Last-Modified de la ficha del paciente. La edad se calcula al leer
+    (``calcular_edad_real``), así que la respuesta también cambia con el día:
+    el ETag incluye la fecha de Colombia y Last-Modified no es anterior a la
+    medianoche de hoy.
+    """
+    ahora = datetime.now(COLOMBIA_TZ)
+    inicio_dia = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    etag = condicional.calcular_etag(vista, documento_id, *version.partes(), ahora.date())
+    ultima = version.ultima_modificacion
+    return etag, max(ultima, inicio_dia) if ultima else inicio_dia
+
+def preparar_atencion_medico(db: Session, atencion, nombres_profesionales: dict):
+    """Ajusta una atención para la vista del médico: hora de Colombia y nombre del profesional."""
+    # Corrección de Zona Horaria para la vista del médico
+    if atencion.fecha_hora_atencion:
+         if atencion.fecha_hora_atencion.tzinfo is None:
+            atencion.fecha_hora_atencion = atencion.fecha_hora_atencion.replace(tzinfo=ZoneInfo("UTC")).astimezone(COLOMBIA_TZ)
+         else:
+            atencion.fecha_hora_atencion = atencion.fecha_hora_atencion.astimezone(COLOMBIA_TZ)
+
+    if atencion.profesional_responsable:
+        # Caché por petición: profesional_salud es tabla de referencia, pero evitamos una consulta por atención
+        if atencion.profesional_responsable not in nombres_profesionales:
+            profesional = db.query(models.ProfesionalSalud).filter(
+                models.ProfesionalSalud.id_personal_salud == atencion.profesional_responsable
+            ).first()
+            nombres_profesionales[atencion.profesional_responsable] = profesional.nombre_completo if profesional else "Desconocido"
+        atencion.profesional_responsable_nombre = nombres_profesionales[atencion.profesional_responsable]
+        # También inyectamos este campo para usarlo en el frontend si es necesario
+        atencion.responsable_registro = atencion.profesional_responsable_nombre
+    else:
+        atencion.profesional_responsable_nombre = "No especificado"
+
+def historia_en_flujo(documento_id: int):
+    """
+    Serializa `schemas.Usuario` por partes: primero los datos del paciente y luego
+    cada atención, leídas en lotes desde un cursor del servidor (yield_per), sin
+    materializar la historia completa. Usa su propia sesión porque el generador
+    sigue ejecutándose después de que la dependencia get_db se cerró; pasa por
+    el circuito y limita cada lectura del cursor a BD_TIMEOUT_HISTORIA_FLUJO_MS.
+    """
+    db = abrir_sesion(settings.BD_TIMEOUT_HISTORIA_FLUJO_MS)
+    try:
+        paciente = db.query(models.Usuario).filter(models.Usuario.documento_id == documento_id).first()
+        if paciente is None:  # Eliminado entre la validación y la lectura
+            yield "null"
+            return
+        if paciente.fecha_nacimiento:
+            paciente.edad = calcular_edad_real(paciente.fecha_nacimiento)
+        cabecera = schemas.UsuarioBase.model_validate(paciente).model_dump_json()
+        yield cabecera[:-1] + ',"atenciones":['
+
+        atenciones = db.query(models.Atencion).filter(
+            models.Atencion.documento_id == documento_id
+        ).order_by(*models.Usuario.atenciones.property.order_by).execution_options(
+            yield_per=settings.HISTORIA_STREAMING_LOTE
+        )
+        nombres_profesionales = {}
+        for i, atencion in enumerate(atenciones):
+            preparar_atencion_medico(db, atencion, nombres_profesionales)
+            yield ("," if i else "") + schemas.AtencionResumen.model_validate(atencion).model_dump_json()
+            db.expunge(atencion)  # Libera la atención ya enviada del identity map
+        yield "]}"
+    finally:
+        db.close()
+
+def respuesta_json(cuerpo: bytes, etag: str, ultima_modificacion) -> Response:
+    """Cuerpo JSON ya serializado (p. ej. desde la caché de pacientes) con sus validadores."""
+    respuesta = Response(content=cuerpo, media_type="application/json")
+    condicional.aplicar_validadores(respuesta, etag, ultima_modificacion)
+    return respuesta
+
+# ==========================================
+# ENDPOINTS SALUD (PROBES)
+# ==========================================
+
+@app.get("/healthz", tags=["Salud"])
+def healthz():
+    """Liveness: el proceso responde. No consulta la BD, para que una caída de la BD no reinicie los pods."""
+    return {"estado": "ok"}
+
+@app.get("/readyz", tags=["Salud"])
+def readyz():
+    """
+    Readiness a partir de la última verificación del monitor (sin consultar la
+    BD). 503 si el coordinador no responde o el circuito está abierto, salvo
+    en modo degradado, donde el pod sigue recibiendo tráfico para servir
+    lecturas guardadas. Los workers caídos se informan como `degradado`.
+    """
+    estado = monitor.estado
+    if not monitor.listo():
+        estado_general = "degradado" if settings.MODO_DEGRADADO else "no_disponible"
+    elif not all(w["disponible"] for w in estado["workers"]):
+        estado_general = "degradado"
+    else:
+        estado_general = "listo"
+    return JSONResponse(
+        status_code=503 if estado_general == "no_disponible" else 200,
+        content={**estado, "estado": estado_general, "circuito": circuito.estado},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Salud"], include_in_schema=False)
+def metrics():
+    """Ocupación y colas del control de admisión de este proceso (formato Prometheus)."""
+    return PlainTextResponse(control_carga.metricas(), media_type="text/plain; version=0.0.4")
+
 # ==========================================
 # ENDPOINTS API (JSON)
 # ==========================================
@@ -72,9 +270,34 @@ def calcular_edad_real(fecha_nacimiento):
 @app.get("/api/pacientes/{documento_id}", response_model=schemas.Usuario, tags=["API Médicos"])
 def buscar_paciente_por_id(
     documento_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Any = Depends(check_role("medico"))
 ):
+    # Validación condicional antes de cargar la historia
+    version = versiones.version_paciente(db, documento_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    # Un 304 también es un acceso: el médico ve la historia que ya tenía en caché
+    auditor.registrar(auditoria.CONSULTA_HISTORIA, documento_id, current_user, request)
+    etag, ultima_modificacion = validadores_paciente("medico-resumen", documento_id, version)
+    no_modificado = condicional.respuesta_no_modificada(request, etag, ultima_modificacion)
+    if no_modificado:
+        return no_modificado
+    condicional.aplicar_validadores(response, etag, ultima_modificacion)
+    guardada = cache_pacientes.obtener(HISTORIA, documento_id, etag)
+    if guardada is not None:
+        return respuesta_json(guardada, etag, ultima_modificacion)
+
+    # Historias muy largas: se emiten atención por atención desde un cursor
+    if version.atenciones >= settings.HISTORIA_STREAMING_MIN_ATENCIONES:
+        # Con el circuito abierto, 503 antes de empezar a enviar el cuerpo
+        circuito.permitir()
+        respuesta = StreamingResponse(historia_en_flujo(documento_id), media_type="application/json")
+        condicional.aplicar_validadores(respuesta, etag, ultima_modificacion)
+        return respuesta
+
     paciente = db.query(models.Usuario).options(
         joinedload(models.Usuario.atenciones)
     ).filter(models.Usuario.documento_id == documento_id).first()
@@ -87,49 +310,187 @@ def buscar_paciente_por_id(
         paciente.edad = calcular_edad_real(paciente.fecha_nacimiento)
     
     # Procesar nombres de profesionales en el historial
+    nombres_profesionales = {}
     for atencion in paciente.atenciones:
-        # Corrección de Zona Horaria para la vista del médico
-        if atencion.fecha_hora_atencion:
-             if atencion.fecha_hora_atencion.tzinfo is None:
-                atencion.fecha_hora_atencion = atencion.fecha_hora_atencion.replace(tzinfo=ZoneInfo("UTC")).astimezone(COLOMBIA_TZ)
-             else:
-                atencion.fecha_hora_atencion = atencion.fecha_hora_atencion.astimezone(COLOMBIA_TZ)
+        preparar_atencion_medico(db, atencion, nombres_profesionales)
 
-        if atencion.profesional_responsable:
-            profesional = db.query(models.ProfesionalSalud).filter(
-                models.ProfesionalSalud.id_personal_salud == atencion.profesional_responsable
-            ).first()
-            atencion.profesional_responsable_nombre = profesional.nombre_completo if profesional else "Desconocido"
-            # También inyectamos este campo para usarlo en el frontend si es necesario
-            atencion.responsable_registro = atencion.profesional_responsable_nombre
-        else:
-            atencion.profesional_responsable_nombre = "No especificado"
+    cuerpo = schemas.Usuario.model_validate(paciente).model_dump_json().encode()
+    cache_pacientes.guardar(HISTORIA, documento_id, etag, cuerpo)
+    return respuesta_json(cuerpo, etag, ultima_modificacion)
 
-    return paciente
+@app.get("/api/pacientes/{documento_id}/atenciones/{atencion_id}", response_model=schemas.AtencionDetalle, tags=["API Médicos"])
+def detalle_atencion(
+    documento_id: int,
+    atencion_id: uuid.UUID,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role(["medico", "paciente"]))
+):
+    """
+    Atención completa (todas las secciones de texto clínico). La historia del
+    paciente solo trae el resumen de cada atención; este endpoint carga el
+    resto cuando se abre una, con una consulta a un único shard.
+    """
+    if current_user.tipo_usuario == "paciente" and int(current_user.documento_id) != int(documento_id):
+        raise HTTPException(status_code=403, detail="No puede acceder a historias de otros pacientes.")
+
+    atencion = db.query(models.Atencion).options(undefer_group("detalle")).filter(
+        models.Atencion.documento_id == documento_id,
+        models.Atencion.atencion_id == atencion_id,
+    ).first()
+    if not atencion:
+        raise HTTPException(status_code=404, detail="Atención no encontrada")
+    auditor.registrar(auditoria.CONSULTA_HISTORIA, documento_id, current_user, request)
+
+    if isinstance(atencion.signos_vitales, str):
+        atencion.signos_vitales = signos_vitales.como_dict(atencion.signos_vitales)
+    preparar_atencion_medico(db, atencion, {})
+    return atencion
+
+@app.post("/api/pacientes/{documento_id}/atenciones/{atencion_id}/cierre", response_model=schemas.AtencionResumen, tags=["API Médicos"])
+def cerrar_atencion(
+    documento_id: int,
+    atencion_id: uuid.UUID,
+    cierre: schemas.CierreAtencion,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role("medico"))
+):
+    """Registra el egreso de una atención abierta y la retira del censo."""
+    atencion = db.query(models.Atencion).filter(
+        models.Atencion.documento_id == documento_id,
+        models.Atencion.atencion_id == atencion_id,
+    ).first()
+    if not atencion:
+        raise HTTPException(status_code=404, detail="Atención no encontrada")
+    if not censo.abierta(atencion):
+        raise HTTPException(status_code=409, detail="La atención ya está cerrada.")
+
+    fecha_hora_cierre = cierre.fecha_hora_cierre or datetime.now(COLOMBIA_TZ)
+    if fecha_hora_cierre.tzinfo is None:
+        fecha_hora_cierre = fecha_hora_cierre.replace(tzinfo=COLOMBIA_TZ)
+    if fecha_hora_cierre < atencion.fecha_hora_atencion:
+        raise HTTPException(status_code=422, detail="La fecha de cierre es anterior a la de la atención.")
+
+    atencion.estado_egreso = cierre.estado_egreso
+    atencion.fecha_hora_cierre = fecha_hora_cierre
+    if cierre.diagnostico_definitivo:
+        atencion.diagnostico_definitivo = cierre.diagnostico_definitivo
+    censo.registrar_cierre(db, atencion_id)
+    db.commit()
+    db.refresh(atencion)
+    cache_pacientes.invalidar(documento_id)
+
+    preparar_atencion_medico(db, atencion, {})
+    return atencion
+
+@app.get("/api/censo/atenciones-abiertas", response_model=schemas.CensoAtencionesAbiertas, tags=["API Médicos"])
+def censo_atenciones_abiertas(
+    tipo_atencion: Optional[str] = Query(None, max_length=80),
+    profesional: Optional[uuid.UUID] = Query(None, description="id_personal_salud del profesional responsable"),
+    propias: bool = Query(False, description="Solo las del profesional autenticado"),
+    limite: int = Query(500, ge=1, le=2000),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_INTERACTIVO_MS)),
+    current_user: Any = Depends(check_role(["medico", "admisionista"]))
+):
+    """
+    Atenciones abiertas de todos los pacientes (tableros de servicio). Lee el
+    censo mantenido al abrir y cerrar atenciones, sin recorrer los shards.
+    """
+    if propias:
+        propio = panel.profesional_de_usuario(db, current_user)
+        if propio is None:
+            return {"total": 0, "por_tipo": {}, "atenciones": []}
+        profesional = propio.id_personal_salud
+    return censo.listar(db, tipo_atencion, profesional, limite)
 
 @app.get("/api/admision/pacientes/{documento_id}", response_model=schemas.Usuario, tags=["API Admisionistas"])
 def buscar_paciente_para_admision(
     documento_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: Any = Depends(check_role("admisionista"))
 ):
+    version = versiones.version_paciente(db, documento_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    etag, ultima_modificacion = validadores_paciente("admision", documento_id, version)
+    no_modificado = condicional.respuesta_no_modificada(request, etag, ultima_modificacion)
+    if no_modificado:
+        return no_modificado
+    condicional.aplicar_validadores(response, etag, ultima_modificacion)
+    guardada = cache_pacientes.obtener(ADMISION, documento_id, etag)
+    if guardada is not None:
+        return respuesta_json(guardada, etag, ultima_modificacion)
+
     paciente = db.query(models.Usuario).filter(models.Usuario.documento_id == documento_id).first()
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    cuerpo = schemas.Usuario.model_validate(paciente).model_dump_json().encode()
+    cache_pacientes.guardar(ADMISION, documento_id, etag, cuerpo)
+    return respuesta_json(cuerpo, etag, ultima_modificacion)
+
+@app.post("/api/admision/pacientes/lote", response_model=schemas.ResultadoLotePacientes, tags=["API Admisionistas"])
+def buscar_pacientes_lote(
+    consulta: schemas.ConsultaLotePacientes,
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_INTERACTIVO_MS)),
+    current_user: Any = Depends(check_role(["admisionista", "medico"]))
+):
+    """
+    Datos demográficos de hasta 500 pacientes en una sola petición (p. ej. la
+    agenda del día). Los documentos se agrupan por shard y cada grupo se consulta
+    con `documento_id = ANY(...)` en un solo shard, en paralelo.
+    """
+    pacientes = usuarios.buscar_lote(
+        db,
+        consulta.documento_ids,
+        consulta.incluir_ultima_atencion,
+        paralelismo=settings.LOTE_CONSULTAS_PARALELAS,
+        milisegundos=settings.BD_TIMEOUT_INTERACTIVO_MS,
+    )
+    for paciente in pacientes:
+        paciente["edad"] = calcular_edad_real(paciente["fecha_nacimiento"])
+
+    # Respetar el orden de la petición
+    posicion = {doc: i for i, doc in enumerate(dict.fromkeys(consulta.documento_ids))}
+    pacientes.sort(key=lambda p: posicion[p["documento_id"]])
+    encontrados = {p["documento_id"] for p in pacientes}
+    return {
+        "pacientes": pacientes,
+        "no_encontrados": [doc for doc in posicion if doc not in encontrados],
+    }
+
+def respuesta_idempotente(db: Session, previo: models.Idempotencia, huella: str, response: Response):
+    """Resultado original de una petición repetida con la misma Idempotency-Key."""
+    if previo.huella != huella:
+        raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con una petición distinta.")
+    paciente = db.query(models.Usuario).filter(models.Usuario.documento_id == previo.documento_id).first()
+    if not paciente:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    response.headers["Idempotent-Replayed"] = "true"
     return paciente
 
 @app.post("/api/pacientes/", response_model=schemas.Usuario, tags=["API Admisionistas"])
 async def crear_paciente(
     paciente_in: schemas.UsuarioCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=idempotencia.LONGITUD_MAXIMA_CLAVE),
     db: Session = Depends(get_db),
     current_user: Any = Depends(check_role("admisionista"))
 ):
-    # Validaciones de existencia
-    if db.query(models.Usuario).filter(models.Usuario.documento_id == paciente_in.documento_id).first():
-        raise HTTPException(status_code=409, detail="Ya existe un paciente con este documento.")
-    
-    if db.query(models.Usuario).filter(models.Usuario.correo_electronico == paciente_in.correo_electronico).first():
-        raise HTTPException(status_code=409, detail="Ya existe un paciente con este correo.")
+    """
+    Crea el paciente con un único INSERT ... ON CONFLICT ... RETURNING (la unicidad
+    del correo la garantiza hcd.usuario_correo). Con la cabecera Idempotency-Key,
+    un reintento devuelve el paciente ya creado sin volver a procesar la petición.
+    """
+    huella = None
+    if idempotency_key:
+        huella = idempotencia.calcular_huella(
+            "crear_paciente", current_user.correo_electronico, paciente_in.model_dump(mode="json")
+        )
+        previo = idempotencia.buscar(db, idempotency_key)
+        if previo:
+            return respuesta_idempotente(db, previo, huella, response)
 
     hashed_password = get_password_hash(paciente_in.password)
     
@@ -141,22 +502,41 @@ async def crear_paciente(
         except:
             pass
 
-    db_paciente = models.Usuario(
+    datos = {
         **paciente_in.model_dump(exclude={"password", "tipo_usuario"}, exclude_none=True),
-        hashed_password=hashed_password,
-        tipo_usuario="paciente",
-        edad=edad_inicial
-    )
+        "hashed_password": hashed_password,
+        "tipo_usuario": "paciente",
+        "edad": edad_inicial,
+    }
     
     try:
-        db.add(db_paciente)
+        fila = usuarios.crear_usuario(db, datos)
+        if fila is None:
+            db.rollback()
+            # Un reintento concurrente con la misma clave pudo crearlo primero
+            previo = idempotencia.buscar(db, idempotency_key) if idempotency_key else None
+            if previo:
+                return respuesta_idempotente(db, previo, huella, response)
+            raise HTTPException(
+                status_code=409,
+                detail=usuarios.motivo_conflicto(db, paciente_in.documento_id, paciente_in.correo_electronico),
+            )
+        if idempotency_key and not idempotencia.registrar(
+            db, idempotency_key, "crear_paciente", huella, fila["documento_id"]
+        ):
+            db.rollback()
+            previo = idempotencia.buscar(db, idempotency_key)
+            if not previo:
+                raise HTTPException(status_code=409, detail="Petición concurrente con la misma Idempotency-Key.")
+            return respuesta_idempotente(db, previo, huella, response)
         db.commit()
-        db.refresh(db_paciente)
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=409, detail="Error de integridad al guardar.")
+    # Ninguna réplica debe conservar una proyección anterior de este documento
+    cache_pacientes.invalidar(fila["documento_id"])
     
-    return db_paciente
+    return {**fila, "atenciones": []}
 
 @app.put("/api/pacientes/{documento_id}", response_model=schemas.Usuario, tags=["API Admisionistas"])
 async def actualizar_paciente(
@@ -170,6 +550,10 @@ async def actualizar_paciente(
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
 
     update_data = paciente_in.model_dump(exclude_unset=True)
+    if 'correo_electronico' in update_data:
+        if not usuarios.cambiar_correo(db, documento_id, db_paciente.correo_electronico, update_data['correo_electronico']):
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Ya existe un paciente con este correo.")
     for field, value in update_data.items():
         setattr(db_paciente, field, value)
     
@@ -184,6 +568,7 @@ async def actualizar_paciente(
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=409, detail="Error al actualizar.")
+    cache_pacientes.invalidar(documento_id)
         
     return db_paciente
 
@@ -198,25 +583,616 @@ async def crear_atencion(
         raise HTTPException(status_code=404, detail="El paciente no existe.")
 
     atencion_data = atencion_in.model_dump(exclude_none=True)
+    if isinstance(atencion_data.get("signos_vitales"), str):
+        atencion_data["signos_vitales"] = signos_vitales.como_dict(atencion_data["signos_vitales"])
+    profesional = panel.profesional_de_usuario(db, current_user)
     
     # Registrar con HORA COLOMBIANA
     db_atencion = models.Atencion(
         **atencion_data,
         fecha_hora_atencion=datetime.now(COLOMBIA_TZ),
-        profesional_responsable=current_user.id_personal_salud if hasattr(current_user, 'id_personal_salud') else None,
-        responsable_registro=f"Dr. {current_user.primer_nombre} {current_user.primer_apellido}" # Guardamos nombre legible también
+        profesional_responsable=profesional.id_personal_salud if profesional else None,
+        responsable_registro=panel.nombre_registro(current_user) # Guardamos nombre legible también
+    )
+    
+    db_atencion.profesional_responsable_nombre = (
+        profesional.nombre_completo if profesional else db_atencion.responsable_registro
     )
     
     try:
         db.add(db_atencion)
+        db.flush()
+        # Serie de signos vitales en la misma transacción (y shard) que la atención
+        serie_signos.registrar(db, db_atencion)
+        # Censo de atenciones abiertas (tabla de referencia) en la misma transacción
+        censo.registrar_apertura(db, db_atencion, paciente)
+        # Panel del médico y outbox en la misma transacción (y shard) que la atención
+        panel.registrar(db, db_atencion.documento_id, current_user.documento_id)
+        outbox.registrar_evento(
+            db,
+            documento_id=db_atencion.documento_id,
+            tipo=outbox.ATENCION_CREADA,
+            payload=schemas.Atencion.model_validate(db_atencion).model_dump(mode="json"),
+            responsable_registro=db_atencion.responsable_registro,
+            medico_documento_id=current_user.documento_id,
+        )
         db.commit()
         db.refresh(db_atencion)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(status_code=409, detail=f"Error al guardar atención: {e}")
+    cache_pacientes.invalidar(db_atencion.documento_id)
         
     return db_atencion
 
+@app.get("/api/pacientes/{documento_id}/signos-vitales/tendencia", response_model=schemas.TendenciaSignosVitales, tags=["API Médicos"])
+def tendencia_signos_vitales(
+    documento_id: int,
+    request: Request,
+    variables: List[str] = Query(list(signos_vitales.VARIABLES), description="Variables a incluir"),
+    desde: Optional[datetime] = Query(None, description="Por defecto, un año antes de 'hasta'"),
+    hasta: Optional[datetime] = Query(None, description="Por defecto, ahora"),
+    puntos: int = Query(200, ge=10, le=2000, description="Máximo de puntos por variable"),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_INTERACTIVO_MS)),
+    current_user: Any = Depends(check_role(["medico", "paciente"]))
+):
+    """
+    Tendencia de signos vitales (p. ej. tensión arterial o peso a lo largo de
+    los años) sin cargar las atenciones: lee la serie tipada del paciente y la
+    reduce a lo sumo a `puntos` intervalos con promedio, mínimo y máximo.
+    """
+    if current_user.tipo_usuario == "paciente" and int(current_user.documento_id) != int(documento_id):
+        raise HTTPException(status_code=403, detail="No puede acceder a historias de otros pacientes.")
+    desconocidas = [v for v in variables if v not in signos_vitales.VARIABLES]
+    if desconocidas:
+        raise HTTPException(status_code=400, detail=f"Variables no válidas: {', '.join(desconocidas)}")
+
+    hasta = hasta or datetime.now(COLOMBIA_TZ)
+    desde = desde or hasta - timedelta(days=365)
+    if desde.tzinfo is None:
+        desde = desde.replace(tzinfo=COLOMBIA_TZ)
+    if hasta.tzinfo is None:
+        hasta = hasta.replace(tzinfo=COLOMBIA_TZ)
+    if desde >= hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'.")
+
+    auditor.registrar(auditoria.CONSULTA_SIGNOS_VITALES, documento_id, current_user, request)
+    variables = list(dict.fromkeys(variables))
+    return {
+        "documento_id": documento_id,
+        "desde": desde,
+        "hasta": hasta,
+        "series": serie_signos.tendencia(db, documento_id, variables, desde, hasta, puntos),
+    }
+
+@app.post("/api/pacientes/{documento_id}/medicamentos/administraciones", response_model=schemas.ResultadoLoteAdministraciones, tags=["API Médicos"])
+def registrar_administraciones(
+    documento_id: int,
+    lote: schemas.LoteAdministraciones,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role("medico"))
+):
+    """
+    Registra un lote de dosis administradas (p. ej. la ronda de medicamentos de
+    un paciente) como eventos nuevos, sin reescribir el medicamento. Reenviar
+    el lote con los mismos `administracion_id` no duplica dosis.
+    """
+    faltantes = administraciones.tecnologias_faltantes(
+        db, documento_id, (a.tecnologia_id for a in lote.administraciones)
+    )
+    if faltantes:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Medicamentos no encontrados para el paciente: {', '.join(sorted(map(str, faltantes)))}",
+        )
+
+    profesional = panel.profesional_de_usuario(db, current_user)
+    responsable = panel.nombre_registro(current_user)
+    ahora = datetime.now(COLOMBIA_TZ)
+    filas = [
+        {
+            **a.model_dump(exclude_none=True),
+            "documento_id": documento_id,
+            "administrado_en": a.administrado_en or ahora,
+            "id_personal_salud": profesional.id_personal_salud if profesional else None,
+            "responsable_registro": responsable,
+        }
+        for a in lote.administraciones
+    ]
+    insertadas = administraciones.insertar_lote(db, filas)
+    db.commit()
+
+    tecnologias = {a.tecnologia_id for a in lote.administraciones}
+    return {
+        "registradas": len(insertadas),
+        "repetidas": len(filas) - len(insertadas),
+        "totales": [
+            {"tecnologia_id": tecnologia_id, **total}
+            for tecnologia_id, total in administraciones.totales(db, documento_id, tecnologias).items()
+        ],
+    }
+
+@app.get("/api/pacientes/{documento_id}/medicamentos", response_model=List[schemas.MedicamentoPaciente], tags=["API Médicos"])
+def medicamentos_paciente(
+    documento_id: int,
+    request: Request,
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_INTERACTIVO_MS)),
+    current_user: Any = Depends(check_role(["medico", "paciente"]))
+):
+    """Medicamentos del paciente con las unidades aplicadas, derivadas de las administraciones."""
+    if current_user.tipo_usuario == "paciente" and int(current_user.documento_id) != int(documento_id):
+        raise HTTPException(status_code=403, detail="No puede acceder a historias de otros pacientes.")
+    auditor.registrar(auditoria.CONSULTA_MEDICAMENTOS, documento_id, current_user, request)
+    resultado = []
+    for total in administraciones.totales(db, documento_id).values():
+        tecnologia = total.pop("tecnologia")
+        resultado.append({**schemas.MedicamentoSync.model_validate(tecnologia).model_dump(), **total})
+    return resultado
+
+@app.get("/api/pacientes/{documento_id}/medicamentos/administraciones", response_model=List[schemas.AdministracionMedicamento], tags=["API Médicos"])
+def listar_administraciones(
+    documento_id: int,
+    request: Request,
+    tecnologia_id: Optional[uuid.UUID] = Query(None, description="Solo las dosis de este medicamento"),
+    desde: Optional[datetime] = Query(None),
+    hasta: Optional[datetime] = Query(None),
+    limite: int = Query(200, ge=1, le=2000),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_INTERACTIVO_MS)),
+    current_user: Any = Depends(check_role(["medico", "paciente"]))
+):
+    """Dosis administradas al paciente, de la más reciente a la más antigua."""
+    if current_user.tipo_usuario == "paciente" and int(current_user.documento_id) != int(documento_id):
+        raise HTTPException(status_code=403, detail="No puede acceder a historias de otros pacientes.")
+    auditor.registrar(auditoria.CONSULTA_MEDICAMENTOS, documento_id, current_user, request)
+    return administraciones.listar(db, documento_id, tecnologia_id, desde, hasta, limite)
+
+@app.get("/api/atenciones/buscar", response_model=List[schemas.ResultadoBusquedaAtencion], tags=["API Médicos"])
+def buscar_atenciones(
+    q: str = Query(..., min_length=2, max_length=200),
+    documento_id: Optional[int] = None,
+    limite: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_INTERACTIVO_MS)),
+    current_user: Any = Depends(check_role("medico"))
+):
+    """
+    Busca en la narrativa clínica (motivo, enfermedad actual, impresión
+    diagnóstica, plan y medicamentos) sin distinguir tildes. Acepta la sintaxis
+    de buscadores web: "frase exacta", OR y -exclusión. Con `documento_id`
+    busca en la historia de ese paciente; sin él, en los pacientes del médico.
+    """
+    return busqueda.buscar_atenciones(db, q, current_user, documento_id=documento_id, limite=limite)
+
+# ==========================================
+# ENDPOINTS SINCRONIZACIÓN
+# ==========================================
+
+@app.get("/api/sincronizacion/cambios", response_model=schemas.CambiosSincronizacion, tags=["Sincronización"])
+def sincronizar_cambios(
+    request: Request,
+    token: Optional[str] = Query(None, description="Token de la respuesta anterior; sin él, descarga completa"),
+    documento_id: Optional[int] = Query(None, description="Solo médicos: un paciente en lugar de su panel"),
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role(["medico", "paciente"]))
+):
+    """
+    Cambios desde la última sincronización para clientes con copia local
+    (apps móviles, sedes con conectividad intermitente).
+
+    Sin `token` entrega todo el alcance (el propio paciente, un paciente o el
+    panel del médico) por páginas. Cada respuesta trae un `token` nuevo: si
+    `hay_mas` es true se pide la siguiente página de inmediato; si no, el token
+    se guarda para la próxima sincronización. Reenviar un token ya usado es
+    seguro (reanuda desde ese punto). Las filas eliminadas llegan en
+    `eliminaciones`. Un token demasiado antiguo responde 410: el cliente debe
+    descartar su copia y sincronizar sin token.
+
+    Los pacientes que entran al panel del médico después de su última
+    sincronización reciben su historia completa en las páginas siguientes.
+    """
+    es_panel = current_user.tipo_usuario == "medico" and documento_id is None
+    if current_user.tipo_usuario == "paciente":
+        alcance = f"paciente:{current_user.documento_id}"
+        filtro = lambda columna: columna == current_user.documento_id
+    elif not es_panel:
+        alcance = f"paciente:{documento_id}"
+        filtro = lambda columna: columna == documento_id
+    else:
+        alcance = f"panel:{current_user.documento_id}"
+        panel_medico = panel.subconsulta_panel(db, current_user)
+        filtro = lambda columna: columna.in_(panel_medico)
+
+    try:
+        estado = sincronizacion.decodificar_token(token, alcance) if token else sincronizacion.EstadoToken()
+    except sincronizacion.TokenVencido as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except sincronizacion.TokenInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    hasta = sincronizacion.horizonte(db)
+    limite = settings.SINCRONIZACION_LIMITE
+    if es_panel:
+        if estado.panel_hasta is None:
+            # Descarga completa: ya incluye a todos los pacientes actuales del panel
+            estado.panel_hasta = hasta
+        elif estado.incorporacion is None and panel.hay_incorporados(db, current_user, estado.panel_hasta, hasta):
+            estado.incorporacion = sincronizacion.Incorporacion(desde=estado.panel_hasta, hasta=hasta)
+
+    respuesta, hay_mas = sincronizacion.recorrer(db, sincronizacion.ENTIDADES, filtro, estado.cursores, hasta, limite)
+    if estado.incorporacion is not None:
+        incorporacion = estado.incorporacion
+        nuevos = panel.subconsulta_incorporados(current_user, incorporacion.desde, incorporacion.hasta)
+        historia, quedan = sincronizacion.recorrer(
+            db, sincronizacion.ENTIDADES_INCORPORACION, lambda columna: columna.in_(nuevos),
+            incorporacion.cursores, hasta, limite,
+        )
+        for entidad in sincronizacion.ENTIDADES_INCORPORACION:
+            # Una fila reciente puede llegar por las dos pasadas
+            vistas = {getattr(fila, entidad.clave) for fila in respuesta[entidad.nombre]}
+            respuesta[entidad.nombre] += [f for f in historia[entidad.nombre] if getattr(f, entidad.clave) not in vistas]
+        if quedan:
+            hay_mas = True
+        else:
+            estado.panel_hasta, estado.incorporacion = incorporacion.hasta, None
+    respuesta["hay_mas"] = hay_mas
+    documentos = {fila.documento_id for entidad in sincronizacion.ENTIDADES for fila in respuesta[entidad.nombre]}
+
+    nombres_profesionales = {}
+    for atencion in respuesta["atenciones"]:
+        preparar_atencion_medico(db, atencion, nombres_profesionales)
+    for documento in documentos:
+        auditor.registrar(auditoria.SINCRONIZACION, documento, current_user, request)
+
+    respuesta["token"] = sincronizacion.codificar_token(alcance, hasta, estado)
+    return respuesta
+
+# ==========================================
+# ENDPOINTS AUDITORÍA
+# ==========================================
+
+@app.get("/api/auditoria/accesos", response_model=List[schemas.AccesoAuditoria], tags=["API Auditoría"])
+def consultar_auditoria_accesos(
+    documento_id: Optional[int] = Query(None, description="Historia consultada"),
+    usuario_documento_id: Optional[int] = Query(None, description="Usuario que accedió"),
+    desde: Optional[datetime] = Query(None),
+    hasta: Optional[datetime] = Query(None),
+    limite: int = Query(200, ge=1, le=5000),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_ANALITICO_MS)),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    """
+    Informe de accesos a historias clínicas, del más reciente al más antiguo.
+    Los accesos se escriben por lotes, así que los de los últimos segundos
+    pueden no aparecer todavía.
+    """
+    if documento_id is None and usuario_documento_id is None:
+        raise HTTPException(status_code=400, detail="Indique documento_id o usuario_documento_id.")
+    return auditoria.consultar_accesos(db, documento_id, usuario_documento_id, desde, hasta, limite)
+
+# ==========================================
+# ENDPOINTS EVENTOS (SSE)
+# ==========================================
+
+@app.get("/api/eventos/atenciones", tags=["Eventos"], response_class=StreamingResponse)
+async def eventos_atenciones(
+    request: Request,
+    documento_id: Optional[int] = None,
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Flujo Server-Sent Events con las atenciones nuevas (evento `atencion_creada`,
+    datos = `schemas.Atencion`). El paciente recibe las de su propia historia; el
+    médico, las del paciente `documento_id` o, sin él, las que él mismo registra.
+    """
+    # Autenticación con una sesión propia que se cierra antes de transmitir: la
+    # conexión SSE dura minutos y no debe retener una conexión del pool.
+    db = SessionLocal()
+    try:
+        current_user = await get_current_user(token=token, db=db)
+        rol = current_user.tipo_usuario
+        if rol == "paciente":
+            suscripcion = Suscripcion(documento_id=int(current_user.documento_id))
+        elif rol == "medico":
+            suscripcion = Suscripcion(
+                documento_id=documento_id,
+                medico_documento_id=int(current_user.documento_id),
+            )
+        else:
+            raise HTTPException(status_code=403, detail="No tiene permisos para recibir eventos.")
+    finally:
+        db.close()
+
+    despachador.suscribir(suscripcion)
+
+    async def flujo():
+        try:
+            yield f"retry: {settings.EVENTOS_LATIDO_SEGUNDOS * 1000}\n\n"
+            while not suscripcion.cerrada and not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(
+                        suscripcion.cola.get(), timeout=settings.EVENTOS_LATIDO_SEGUNDOS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"  # Mantiene viva la conexión a través de proxies
+                    continue
+                datos = json.dumps(
+                    {**evento["payload"], "documento_id": evento["documento_id"]}, ensure_ascii=False
+                )
+                yield f"id: {evento['evento_id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+        finally:
+            despachador.cancelar(suscripcion)
+
+    return StreamingResponse(
+        flujo(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ==========================================
+# ENDPOINTS EPIDEMIOLOGÍA (CIE-10)
+# ==========================================
+
+@app.get("/api/epidemiologia/cie10/pacientes", response_model=List[schemas.PacienteCie10], tags=["API Epidemiología"])
+def pacientes_por_cie10(
+    codigos: str,
+    dias: int = Query(90, ge=1, le=3650),
+    limite: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_ANALITICO_MS)),
+    current_user: Any = Depends(check_role("medico"))
+):
+    """
+    Pacientes con atenciones en los últimos `dias` que coinciden con alguno de
+    los códigos (separados por coma). Un código de categoría (J45 o J45.x)
+    incluye todas sus subcategorías.
+    """
+    lista_codigos = [c for c in codigos.split(",") if c.strip()]
+    if not lista_codigos:
+        raise HTTPException(status_code=422, detail="Debe indicar al menos un código CIE-10.")
+
+    hasta = datetime.now(COLOMBIA_TZ)
+    desde = hasta - timedelta(days=dias)
+    try:
+        return cie10.pacientes_por_codigos(db, lista_codigos, desde, hasta, limite=limite)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/api/epidemiologia/cie10/ranking", response_model=List[schemas.FrecuenciaCie10], tags=["API Epidemiología"])
+def ranking_cie10(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    nivel: str = Query("subcategoria", pattern="^(categoria|subcategoria)$"),
+    prefijo: Optional[str] = None,
+    limite: int = Query(20, ge=1, le=500),
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_ANALITICO_MS)),
+    current_user: Any = Depends(check_role("medico"))
+):
+    """
+    Códigos CIE-10 más frecuentes entre `desde` y `hasta` (inclusive), de las
+    atenciones y de sus diagnósticos. Por defecto usa el mes en curso (hora de Colombia).
+    """
+    hoy = datetime.now(COLOMBIA_TZ).date()
+    desde = desde or hoy.replace(day=1)
+    hasta = hasta or hoy
+    if hasta < desde:
+        raise HTTPException(status_code=422, detail="El rango de fechas es inválido.")
+
+    inicio = datetime.combine(desde, time.min, tzinfo=COLOMBIA_TZ)
+    fin = datetime.combine(hasta + timedelta(days=1), time.min, tzinfo=COLOMBIA_TZ)
+    try:
+        return cie10.ranking_codigos(db, inicio, fin, nivel=nivel, prefijo=prefijo, limite=limite)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# ==========================================
+# ENDPOINTS REPORTES (ROLLUPS)
+# ==========================================
+
+@app.get("/api/reportes/atenciones", response_model=schemas.ReporteAtenciones, tags=["API Reportes"])
+def reporte_atenciones(
+    desde: date,
+    hasta: date,
+    agrupar_por: List[str] = Query(["dia"]),
+    tipo_atencion: Optional[str] = None,
+    municipio_ciudad: Optional[str] = None,
+    departamento: Optional[str] = None,
+    grupo_edad: Optional[str] = None,
+    regimen_afiliacion: Optional[str] = None,
+    db: Session = Depends(get_db_con_limite(settings.BD_TIMEOUT_ANALITICO_MS)),
+    current_user: Any = Depends(check_role(["medico", "admisionista"]))
+):
+    """
+    Atenciones por día y dimensiones demográficas, leídas solo de los rollups.
+    `actualizado_hasta` indica hasta qué momento están consolidados los datos.
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=422, detail="El rango de fechas es inválido.")
+
+    filtros = {
+        "tipo_atencion": tipo_atencion,
+        "municipio_ciudad": municipio_ciudad,
+        "departamento": departamento,
+        "grupo_edad": grupo_edad,
+        "regimen_afiliacion": regimen_afiliacion,
+    }
+    filtros = {k: v for k, v in filtros.items() if v is not None}
+    try:
+        filas = rollups.consultar(db, desde, hasta, agrupar_por, filtros)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {
+        "actualizado_hasta": rollups.obtener_marca(db),
+        "agrupado_por": list(dict.fromkeys(agrupar_por)),
+        "filas": filas,
+    }
+
+# ==========================================
+# ENDPOINTS FHIR (EXPORTACIÓN MASIVA)
+# ==========================================
+FORMATOS_NDJSON = {"application/fhir+ndjson", "application/ndjson", "ndjson"}
+
+def resultado_operacion(codigo: int, diagnostico: str) -> JSONResponse:
+    """Error en formato FHIR OperationOutcome."""
+    return JSONResponse(
+        status_code=codigo,
+        media_type="application/fhir+json",
+        content={
+            "resourceType": "OperationOutcome",
+            "issue": [{"severity": "error", "code": "processing", "diagnostics": diagnostico}],
+        },
+    )
+
+@app.get("/fhir/$export", status_code=202, tags=["FHIR"])
+def iniciar_exportacion_fhir(
+    request: Request,
+    tipos: Optional[str] = Query(None, alias="_type", description="Tipos de recurso separados por coma"),
+    desde: Optional[datetime] = Query(None, alias="_since"),
+    formato: Optional[str] = Query(None, alias="_outputFormat"),
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    """
+    Inicia una exportación FHIR R4 Bulk Data (Patient, Encounter, Condition,
+    MedicationAdministration, Practitioner) y responde 202 con la URL de estado
+    en `Content-Location`.
+    """
+    if formato and formato not in FORMATOS_NDJSON:
+        raise HTTPException(status_code=400, detail="Solo se admite _outputFormat=application/fhir+ndjson.")
+    seleccion = [t.strip() for t in tipos.split(",") if t.strip()] if tipos else list(fhir.TIPOS_RECURSO)
+    desconocidos = [t for t in seleccion if t not in fhir.TIPOS_RECURSO]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Tipos de recurso no soportados: {', '.join(desconocidos)}")
+
+    exportador.depurar()
+    trabajo = exportacion_fhir.crear(
+        db, current_user.correo_electronico, list(dict.fromkeys(seleccion)), desde, str(request.url)
+    )
+    exportador.lanzar(trabajo.exportacion_id)
+    estado = request.url_for("estado_exportacion_fhir", exportacion_id=str(trabajo.exportacion_id))
+    return Response(status_code=202, headers={"Content-Location": str(estado)})
+
+@app.get("/fhir/$export-status/{exportacion_id}", tags=["FHIR"])
+def estado_exportacion_fhir(
+    exportacion_id: uuid.UUID,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    """202 con `X-Progress` mientras se ejecuta; 200 con el manifiesto al terminar."""
+    # Un trabajo cuyo proceso murió pasa a error en lugar de quedar en curso
+    exportacion_fhir.marcar_huerfanas(db)
+    trabajo = exportacion_fhir.obtener(db, exportacion_id)
+    if trabajo is None:
+        return resultado_operacion(404, "Exportación no encontrada o vencida.")
+    if trabajo.estado in (exportacion_fhir.EN_COLA, exportacion_fhir.EN_CURSO):
+        progreso = f"{trabajo.segmentos_listos}/{trabajo.segmentos_total or '?'} segmentos"
+        return Response(status_code=202, headers={"X-Progress": progreso, "Retry-After": "5"})
+    if trabajo.estado == exportacion_fhir.CANCELADA:
+        return resultado_operacion(404, "La exportación fue cancelada.")
+    if trabajo.estado == exportacion_fhir.ERROR:
+        return resultado_operacion(500, trabajo.error or "La exportación falló.")
+
+    return {
+        "transactionTime": trabajo.created_at.isoformat(),
+        "request": trabajo.solicitud,
+        "requiresAccessToken": True,
+        "output": [
+            {
+                "type": archivo["type"],
+                "url": str(request.url_for(
+                    "archivo_exportacion_fhir", exportacion_id=str(exportacion_id), archivo=archivo["archivo"]
+                )),
+                "count": archivo["count"],
+            }
+            for archivo in trabajo.archivos or []
+        ],
+        "error": [],
+    }
+
+@app.delete("/fhir/$export-status/{exportacion_id}", status_code=202, tags=["FHIR"])
+def cancelar_exportacion_fhir(
+    exportacion_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    """Cancela la exportación en curso o elimina los archivos de una terminada."""
+    trabajo = exportacion_fhir.obtener(db, exportacion_id)
+    if trabajo is None:
+        return resultado_operacion(404, "Exportación no encontrada o vencida.")
+    if trabajo.estado in (exportacion_fhir.EN_COLA, exportacion_fhir.EN_CURSO):
+        exportador.cancelar(exportacion_id)
+        exportacion_fhir.actualizar(db, exportacion_id, estado=exportacion_fhir.CANCELADA)
+    else:
+        shutil.rmtree(exportador.directorio(exportacion_id), ignore_errors=True)
+        db.delete(trabajo)
+        db.commit()
+    return Response(status_code=202)
+
+@app.get("/fhir/$export-files/{exportacion_id}/{archivo}", tags=["FHIR"], response_class=FileResponse)
+def archivo_exportacion_fhir(
+    exportacion_id: uuid.UUID,
+    archivo: str,
+    db: Session = Depends(get_db),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    trabajo = exportacion_fhir.obtener(db, exportacion_id)
+    # Solo se sirven archivos listados en el manifiesto
+    if trabajo is None or archivo not in {a["archivo"] for a in trabajo.archivos or []}:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    ruta = exportador.directorio(exportacion_id) / archivo
+    if not ruta.is_file():
+        # EXPORTACION_FHIR_DIRECTORIO debe ser compartido entre réplicas
+        raise HTTPException(status_code=404, detail="Archivo no disponible (eliminado o fuera del directorio compartido)")
+    return FileResponse(ruta, media_type="application/fhir+ndjson", filename=archivo)
+
+# ==========================================
+# ENDPOINTS PERFILADOR (ADMINISTRADOR)
+# ==========================================
+
+def perfilador_habilitado():
+    if not settings.PERFILADOR_HABILITADO:
+        raise HTTPException(status_code=404, detail="Perfilador deshabilitado (PERFILADOR_HABILITADO).")
+
+@app.post("/api/admin/perfilador/token", tags=["Perfilador"], dependencies=[Depends(perfilador_habilitado)])
+def token_perfilador(
+    minutos: int = Query(15, ge=1, le=60),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    """
+    Token para perfilar peticiones: se envía en la cabecera `X-Perfilar` o en
+    `?perfilar=`. La respuesta perfilada trae `X-Perfil` con el id del perfil.
+    """
+    return {
+        "token": perfilador.crear_token(minutos),
+        "expira_en_minutos": minutos,
+        "cabecera": "X-Perfilar",
+        "parametro": perfilador.PARAMETRO,
+    }
+
+@app.post("/api/admin/perfilador/ventana", tags=["Perfilador"], dependencies=[Depends(perfilador_habilitado)])
+async def perfilar_ventana(
+    segundos: float = Query(10, gt=0, le=60),
+    current_user: Any = Depends(check_role("administrador"))
+):
+    """Muestrea todas las peticiones de este proceso durante `segundos` y devuelve el resumen."""
+    try:
+        return await perfilador.perfilar_ventana(segundos)
+    except perfilador.PerfiladorOcupado:
+        raise HTTPException(status_code=409, detail="Ya hay un perfilado en curso en este proceso.")
+
+@app.get("/api/admin/perfilador/perfiles", tags=["Perfilador"], dependencies=[Depends(perfilador_habilitado)])
+def listar_perfiles(current_user: Any = Depends(check_role("administrador"))):
+    """Perfiles guardados con el tiempo por categoría (aplicación, SQLAlchemy, Jinja2, Argon2, WeasyPrint)."""
+    return perfilador.listar()
+
+@app.get("/api/admin/perfilador/perfiles/{perfil_id}", tags=["Perfilador"], response_class=FileResponse,
+         dependencies=[Depends(perfilador_habilitado)])
+def descargar_perfil(perfil_id: str, current_user: Any = Depends(check_role("administrador"))):
+    """Archivo speedscope (ábralo en https://www.speedscope.app)."""
+    ruta = perfilador.ruta(perfil_id)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado en este servidor")
+    return FileResponse(ruta, media_type="application/json", filename=ruta.name)
+
 # ==========================================
 # ENDPOINTS VISTAS (HTML)
 # ==========================================
@@ -253,11 +1229,17 @@ async def paciente_page(
     current_user: Any = Depends(check_role("paciente")),
     db: Session = Depends(get_db)
 ):
+    auditor.registrar(auditoria.VISTA_PACIENTE, current_user.documento_id, current_user, request)
+
     # Calcular edad al vuelo
     if current_user.fecha_nacimiento:
         current_user.edad = calcular_edad_real(current_user.fecha_nacimiento)
 
-    for atencion in current_user.atenciones:
+    atenciones = db.query(models.Atencion).options(undefer_group("detalle")).filter(
+        models.Atencion.documento_id == current_user.documento_id
+    ).order_by(*models.Usuario.atenciones.property.order_by).all()
+
+    for atencion in atenciones:
         # 1. Corrección Zona Horaria
         if atencion.fecha_hora_atencion:
             if atencion.fecha_hora_atencion.tzinfo is None:
@@ -265,12 +1247,9 @@ async def paciente_page(
             else:
                 atencion.fecha_hora_atencion = atencion.fecha_hora_atencion.astimezone(COLOMBIA_TZ)
         
-        # 2. Parsear JSON de signos vitales
-        if atencion.signos_vitales and isinstance(atencion.signos_vitales, str):
-            try:
-                atencion.signos_vitales = json.loads(atencion.signos_vitales)
-            except:
-                atencion.signos_vitales = {}
+        # 2. Parsear JSON de signos vitales (registros antiguos guardados como cadena)
+        if isinstance(atencion.signos_vitales, str):
+            atencion.signos_vitales = signos_vitales.como_dict(atencion.signos_vitales)
 
         # 3. Obtener nombre real del médico
         if atencion.profesional_responsable:
@@ -281,7 +1260,9 @@ async def paciente_page(
         else:
             atencion.profesional_nombre_temp = atencion.responsable_registro or "Profesional de Staff"
 
-    return templates.TemplateResponse("vista_paciente.html", {"request": request, "user": current_user})
+    return templates.TemplateResponse(
+        "vista_paciente.html", {"request": request, "user": current_user, "atenciones": atenciones}
+    )
 
 @app.get("/exportar_pdf/{documento_id}", tags=["PDF"], response_class=StreamingResponse)
 async def exportar_historia_pdf(
@@ -301,12 +1282,15 @@ async def exportar_historia_pdf(
     paciente = db.query(models.Usuario).filter(models.Usuario.documento_id == documento_id).first()
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    auditor.registrar(auditoria.EXPORTACION_PDF, documento_id, current_user, request)
     
     # Calcular edad para el PDF
     if paciente.fecha_nacimiento:
         paciente.edad = calcular_edad_real(paciente.fecha_nacimiento)
 
-    atenciones = db.query(models.Atencion).filter(models.Atencion.documento_id == documento_id).all()
+    atenciones = db.query(models.Atencion).options(undefer_group("detalle")).filter(
+        models.Atencion.documento_id == documento_id
+    ).order_by(*models.Usuario.atenciones.property.order_by).all()
 
     for atencion in atenciones:
         # Corrección Hora
@@ -326,11 +1310,8 @@ async def exportar_historia_pdf(
             atencion.profesional_nombre_temp = atencion.responsable_registro or "Profesional de Turno"
 
         # Parsear Signos Vitales
-        if atencion.signos_vitales and isinstance(atencion.signos_vitales, str):
-            try:
-                atencion.signos_vitales = json.loads(atencion.signos_vitales)
-            except:
-                atencion.signos_vitales = {}
+        if isinstance(atencion.signos_vitales, str):
+            atencion.signos_vitales = signos_vitales.como_dict(atencion.signos_vitales)
 
     fecha_impresion = datetime.now(COLOMBIA_TZ).strftime("%d/%m/%Y %H:%M")
 
@@ -345,7 +1326,8 @@ async def exportar_historia_pdf(
     ).body.decode("utf-8")
 
     pdf_buffer = BytesIO()
-    HTML(string=html_content).write_pdf(pdf_buffer)
+    with trazas.span("weasyprint.write_pdf", **{"pdf.atenciones": len(atenciones)}):
+        HTML(string=html_content).write_pdf(pdf_buffer)
     pdf_buffer.seek(0)
 
     filename = f"HC_{paciente.documento_id}_{datetime.now(COLOMBIA_TZ).strftime('%Y%m%d')}.pdf"
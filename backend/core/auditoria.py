@@ -0,0 +1,115 @@
+"""
+Buffer asíncrono de la auditoría de accesos.
+
+Los endpoints llaman a ``auditor.registrar(...)``, que solo agrega el evento a
+una lista en memoria (sin tocar la BD). Una tarea de fondo por proceso lo
+vuelca cada ``AUDITORIA_INTERVALO_SEGUNDOS``, o antes si se acumulan
+``AUDITORIA_LOTE`` eventos, con un ``COPY`` en un hilo aparte.
+
+La memoria está acotada por ``AUDITORIA_BUFFER_MAX``: si la BD no está
+disponible los eventos se conservan y se reintentan, y solo cuando el buffer
+se llena se descartan los nuevos (se cuentan y se informa en el log). Al
+apagar el proceso se vuelca lo pendiente.
+"""
+
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+from fastapi import Request
+
+from backend.core.config import settings
+from backend.db import auditoria
+
+
+class AuditorAccesos:
+    def __init__(self):
+        self._pendientes: List[dict] = []
+        self._candado = threading.Lock()
+        self._descartados = 0
+        self._tarea: Optional[asyncio.Task] = None
+        self._bucle: Optional[asyncio.AbstractEventLoop] = None
+        self._despertar: Optional[asyncio.Event] = None
+
+    def registrar(
+        self,
+        accion: str,
+        documento_id: int,
+        usuario: Any,
+        request: Optional[Request] = None,
+    ) -> None:
+        """Encola un acceso. Puede llamarse desde el bucle o desde un hilo del pool."""
+        evento = {
+            "documento_id": documento_id,
+            "accedido_en": datetime.now(timezone.utc).isoformat(),
+            "accion": accion,
+            "usuario_documento_id": getattr(usuario, "documento_id", None),
+            "usuario_correo": getattr(usuario, "correo_electronico", None),
+            "usuario_rol": getattr(usuario, "tipo_usuario", None),
+        }
+        if request is not None:
+            evento["recurso"] = request.url.path[:255]
+            evento["ip"] = request.client.host if request.client else None
+            evento["agente_usuario"] = (request.headers.get("user-agent") or "")[:255] or None
+
+        with self._candado:
+            if len(self._pendientes) >= settings.AUDITORIA_BUFFER_MAX:
+                self._descartados += 1
+                return
+            self._pendientes.append(evento)
+            lleno = len(self._pendientes) >= settings.AUDITORIA_LOTE
+
+        if lleno and self._bucle is not None and self._despertar is not None:
+            self._bucle.call_soon_threadsafe(self._despertar.set)
+
+    def iniciar(self) -> None:
+        if self._tarea is None:
+            self._bucle = asyncio.get_running_loop()
+            self._despertar = asyncio.Event()
+            self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self) -> None:
+        """Detiene la tarea de fondo y vuelca los eventos pendientes."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        await asyncio.to_thread(self.volcar)
+
+    async def _ciclo(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=settings.AUDITORIA_INTERVALO_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            await asyncio.to_thread(self.volcar)
+
+    def volcar(self) -> int:
+        """Escribe los eventos pendientes. Devuelve cuántos se escribieron."""
+        with self._candado:
+            lote, self._pendientes = self._pendientes, []
+            descartados, self._descartados = self._descartados, 0
+        if descartados:
+            print(f"[ADVERTENCIA] Auditoría: {descartados} accesos descartados por buffer lleno")
+        if not lote:
+            return 0
+        try:
+            return auditoria.escribir_lote(lote)
+        except Exception as e:
+            print(f"[ADVERTENCIA] No se pudo escribir la auditoría ({len(lote)} accesos): {e}")
+            with self._candado:
+                # Se reintentan primero los más antiguos, sin superar el límite
+                self._pendientes = lote + self._pendientes
+                exceso = len(self._pendientes) - settings.AUDITORIA_BUFFER_MAX
+                if exceso > 0:
+                    del self._pendientes[settings.AUDITORIA_BUFFER_MAX:]
+                    self._descartados += exceso
+            return 0
+
+
+auditor = AuditorAccesos()
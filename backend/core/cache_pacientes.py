@@ -0,0 +1,153 @@
+"""
+Caché compartida de las proyecciones de pacientes (``CACHE_PACIENTES_BACKEND``).
+
+Guarda el JSON ya serializado de la historia del médico y de la ficha de
+admisión, por ``documento_id``, para no volver a leer las atenciones del
+coordinador cuando muchos profesionales consultan los mismos pacientes
+(p. ej. hospitalizados). Dos backends:
+
+- ``memoria``: diccionario LRU del proceso (pruebas y una sola réplica).
+- ``redis``: compartido por todos los pods de ``fastapi-app`` (producción).
+- ``ninguno``: desactivada.
+
+Cada entrada lleva el ETag de la versión con que se generó y solo se sirve si
+coincide con el de ``versiones.version_paciente``, que los endpoints calculan
+de todos modos. Así una entrada vieja (una escritura de otro pod con caché en
+memoria, o una lectura concurrente que guardó la versión anterior) nunca se
+devuelve. Además, ``crear_paciente``, ``actualizar_paciente`` y
+``crear_atencion`` invalidan el paciente tras confirmar la transacción.
+
+La caché nunca hace fallar una petición: si Redis no responde se consulta la
+BD como si no hubiera caché.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from backend.core.config import settings
+
+HISTORIA = "historia"
+ADMISION = "admision"
+PROYECCIONES: Tuple[str, ...] = (HISTORIA, ADMISION)
+
+_PREFIJO = "hce:paciente"
+
+
+class CacheMemoria:
+    def __init__(self, ttl_segundos: int, max_entradas: int):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._candado = threading.Lock()
+        self._entradas: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def obtener(self, clave: str) -> Optional[bytes]:
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if time.monotonic() >= expira:
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave: str, valor: bytes) -> None:
+        with self._candado:
+            self._entradas[clave] = (time.monotonic() + self.ttl_segundos, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def eliminar(self, *claves: str) -> None:
+        with self._candado:
+            for clave in claves:
+                self._entradas.pop(clave, None)
+
+
+class CacheRedis:
+    """
+    Backend en Redis. El TTL lo aplica Redis (SET ... EX) y el tamaño total lo
+    acota su ``maxmemory`` con ``allkeys-lru`` (ver infra/k8s/redis.yaml).
+    """
+
+    def __init__(self, url: str, ttl_segundos: int, timeout_segundos: float):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_PACIENTES_BACKEND=redis requiere el paquete 'redis'") from e
+        self.ttl_segundos = ttl_segundos
+        self._error = redis.RedisError
+        self._cliente = redis.Redis.from_url(
+            url, socket_timeout=timeout_segundos, socket_connect_timeout=timeout_segundos
+        )
+
+    def obtener(self, clave: str) -> Optional[bytes]:
+        try:
+            return self._cliente.get(clave)
+        except self._error as e:
+            print(f"[ADVERTENCIA] Caché de pacientes no disponible: {e}")
+            return None
+
+    def guardar(self, clave: str, valor: bytes) -> None:
+        try:
+            self._cliente.set(clave, valor, ex=self.ttl_segundos)
+        except self._error as e:
+            print(f"[ADVERTENCIA] No se pudo guardar en la caché de pacientes: {e}")
+
+    def eliminar(self, *claves: str) -> None:
+        try:
+            self._cliente.delete(*claves)
+        except self._error as e:
+            print(f"[ADVERTENCIA] No se pudo invalidar la caché de pacientes: {e}")
+
+
+class CachePacientes:
+    def __init__(self, backend, max_bytes: int):
+        self.backend = backend
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _clave(proyeccion: str, documento_id: int) -> str:
+        return f"{_PREFIJO}:{int(documento_id)}:{proyeccion}"
+
+    def obtener(self, proyeccion: str, documento_id: int, etag: str) -> Optional[bytes]:
+        """Cuerpo JSON guardado para esta versión del paciente, o None."""
+        if self.backend is None:
+            return None
+        valor = self.backend.obtener(self._clave(proyeccion, documento_id))
+        if valor is None:
+            return None
+        etag_guardado, _, cuerpo = valor.partition(b"\n")
+        return cuerpo if etag_guardado == etag.encode() else None
+
+    def guardar(self, proyeccion: str, documento_id: int, etag: str, cuerpo: bytes) -> None:
+        if self.backend is None or len(cuerpo) > self.max_bytes:
+            return
+        self.backend.guardar(self._clave(proyeccion, documento_id), etag.encode() + b"\n" + cuerpo)
+
+    def invalidar(self, documento_id: int) -> None:
+        """Descarta todas las proyecciones del paciente (después del commit)."""
+        if self.backend is None:
+            return
+        self.backend.eliminar(*(self._clave(p, documento_id) for p in PROYECCIONES))
+
+
+def _crear_backend():
+    tipo = settings.CACHE_PACIENTES_BACKEND
+    if tipo == "memoria":
+        return CacheMemoria(settings.CACHE_PACIENTES_TTL_SEGUNDOS, settings.CACHE_PACIENTES_MAX_ENTRADAS)
+    if tipo == "redis":
+        return CacheRedis(
+            settings.CACHE_PACIENTES_URL,
+            settings.CACHE_PACIENTES_TTL_SEGUNDOS,
+            settings.CACHE_PACIENTES_TIMEOUT_SEGUNDOS,
+        )
+    if tipo == "ninguno":
+        return None
+    raise ValueError(f"CACHE_PACIENTES_BACKEND desconocido: {tipo!r} (memoria, redis o ninguno)")
+
+
+cache_pacientes = CachePacientes(_crear_backend(), settings.CACHE_PACIENTES_MAX_BYTES)
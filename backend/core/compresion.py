@@ -0,0 +1,39 @@
+"""
+Compresión negociada de respuestas (brotli o gzip según ``Accept-Encoding``).
+
+Se usa ``brotli-asgi`` si está instalado (con gzip como alternativa para
+clientes sin soporte de brotli) y, si no, el ``GZipMiddleware`` de Starlette.
+Las respuestas por debajo de ``minimo_bytes`` se envían sin comprimir.
+
+Algunas rutas se excluyen: los flujos SSE, porque el compresor acumula los
+bytes y retrasaría cada evento, y los PDF, que ya vienen comprimidos.
+"""
+
+from typing import Tuple
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+RUTAS_EXCLUIDAS: Tuple[str, ...] = ("/api/eventos/", "/exportar_pdf/")
+
+
+def _crear_compresor(app: ASGIApp, minimo_bytes: int) -> ASGIApp:
+    try:
+        from brotli_asgi import BrotliMiddleware
+    except ImportError:
+        return GZipMiddleware(app, minimum_size=minimo_bytes, compresslevel=6)
+    # Calidad 4: buena relación tamaño/CPU para JSON generado en cada petición
+    return BrotliMiddleware(app, quality=4, minimum_size=minimo_bytes, gzip_fallback=True)
+
+
+class CompresionMiddleware:
+    def __init__(self, app: ASGIApp, minimo_bytes: int = 1024, excluir: Tuple[str, ...] = RUTAS_EXCLUIDAS):
+        self.app = app
+        self.excluir = excluir
+        self.compresor = _crear_compresor(app, minimo_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not scope["path"].startswith(self.excluir):
+            await self.compresor(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,84 @@
+"""
+Peticiones condicionales (ETag / Last-Modified) para las lecturas de pacientes.
+
+El validador se calcula a partir de una consulta de versión barata (ver
+``backend.db.versiones``) antes de cargar la historia; si el cliente ya tiene
+esa versión se responde 304 sin tocar las atenciones ni serializar nada.
+
+El ETag es débil (``W/"..."``): identifica la versión de los datos, no los
+bytes. El mismo valor acompaña al cuerpo sin comprimir, con gzip o con brotli
+(``CompresionMiddleware``) y a la historia emitida en flujo, que difieren byte
+a byte; un ETag fuerte tendría que cambiar con cada representación.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+# Se guarda en el navegador pero se revalida siempre antes de usarse
+CACHE_CONTROL = "private, no-cache"
+
+
+def calcular_etag(*partes) -> str:
+    """ETag débil a partir de los componentes de la versión."""
+    huella = hashlib.sha256("|".join(str(p) for p in partes).encode("utf-8")).hexdigest()
+    return f'W/"{huella[:32]}"'
+
+
+def _opaco(etag: str) -> str:
+    return etag.strip().removeprefix("W/")
+
+
+def _coincide_etag(cabecera: str, etag: str) -> bool:
+    if cabecera.strip() == "*":
+        return True
+    # If-None-Match usa comparación débil: W/"x" equivale a "x"
+    return _opaco(etag) in {_opaco(c) for c in cabecera.split(",")}
+
+
+def _no_modificado_desde(cabecera: str, ultima_modificacion: datetime) -> bool:
+    try:
+        fecha = parsedate_to_datetime(cabecera)
+    except (TypeError, ValueError):
+        return False
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    # HTTP-date tiene resolución de segundos
+    return ultima_modificacion.replace(microsecond=0) <= fecha
+
+
+def aplicar_validadores(response: Response, etag: str, ultima_modificacion: Optional[datetime]) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if ultima_modificacion is not None:
+        response.headers["Last-Modified"] = format_datetime(
+            ultima_modificacion.astimezone(timezone.utc), usegmt=True
+        )
+
+
+def respuesta_no_modificada(
+    request: Request, etag: str, ultima_modificacion: Optional[datetime]
+) -> Optional[Response]:
+    """
+    Devuelve un 304 si el cliente ya tiene la versión actual, o None.
+
+    If-Modified-Since solo se evalúa si no llega If-None-Match (RFC 9110).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        vigente = _coincide_etag(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        vigente = (
+            if_modified_since is not None
+            and ultima_modificacion is not None
+            and _no_modificado_desde(if_modified_since, ultima_modificacion)
+        )
+    if not vigente:
+        return None
+    respuesta = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    aplicar_validadores(respuesta, etag, ultima_modificacion)
+    return respuesta
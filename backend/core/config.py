@@ -8,6 +8,126 @@ class Settings(BaseSettings):
     DB_NAME: str = "interop_db"
     SECRET_KEY: str = "tu-clave-secreta-cambiar-en-produccion"
 
+    # Particionamiento de atenciones
+    PARTICION_MESES_FUTUROS: int = 3
+    PARTICION_MESES_COLUMNAR: int = 12
+
+    # Notificaciones de atenciones (outbox + SSE)
+    EVENTOS_INTERVALO_SEGUNDOS: float = 1.0
+    EVENTOS_SOLAPE_SEGUNDOS: int = 10
+    EVENTOS_RETENCION_HORAS: int = 24
+    EVENTOS_LATIDO_SEGUNDOS: int = 15
+
+    # Respuestas grandes: compresión y serialización por partes
+    COMPRESION_MINIMO_BYTES: int = 1024
+    HISTORIA_STREAMING_MIN_ATENCIONES: int = 200
+    HISTORIA_STREAMING_LOTE: int = 100
+
+    # Servidor (backend/server.py). SERVIDOR_WORKERS = 0 calcula según las CPU
+    SERVIDOR_HOST: str = "0.0.0.0"
+    SERVIDOR_PUERTO: int = 8000
+    SERVIDOR_WORKERS: int = 0
+    SERVIDOR_WORKERS_MAX: int = 8
+    SERVIDOR_MAX_PETICIONES: int = 2000
+    SERVIDOR_MAX_PETICIONES_JITTER: int = 200
+    SERVIDOR_TIMEOUT: int = 120
+    SERVIDOR_TIMEOUT_GRACIA: int = 60
+
+    # Consultas por lote: grupos de shard consultados en paralelo
+    LOTE_CONSULTAS_PARALELAS: int = 4
+
+    # Auditoría de accesos: buffer en memoria volcado por lotes con COPY
+    AUDITORIA_INTERVALO_SEGUNDOS: float = 2.0
+    AUDITORIA_LOTE: int = 500
+    AUDITORIA_BUFFER_MAX: int = 20000
+
+    # Exportación masiva FHIR ($export). Con varias réplicas, el directorio
+    # debe ser un volumen compartido (en Kubernetes, /compartido). El proceso
+    # que ejecuta un trabajo renueva su latido; sin latido durante
+    # EXPORTACION_FHIR_LATIDO_VENCIDO_SEGUNDOS el trabajo pasa a error
+    EXPORTACION_FHIR_DIRECTORIO: str = "/tmp/hce_exportaciones_fhir"
+    EXPORTACION_FHIR_PARALELISMO: int = 4
+    EXPORTACION_FHIR_LOTE: int = 2000
+    EXPORTACION_FHIR_RETENCION_HORAS: int = 24
+    EXPORTACION_FHIR_LATIDO_SEGUNDOS: int = 30
+    EXPORTACION_FHIR_LATIDO_VENCIDO_SEGUNDOS: int = 180
+
+    # Sincronización incremental: margen para transacciones en curso, filas por
+    # entidad y página, y retención de lápidas (tokens más antiguos: resync completo)
+    SINCRONIZACION_SOLAPE_SEGUNDOS: int = 10
+    SINCRONIZACION_LIMITE: int = 500
+    SINCRONIZACION_RETENCION_DIAS: int = 90
+
+    # Disponibilidad de la BD: tiempos máximos de conexión, espera de conexión
+    # del pool y consulta (por defecto y por tipo de ruta)
+    BD_CONEXION_TIMEOUT_SEGUNDOS: int = 3
+    BD_POOL_TIMEOUT_SEGUNDOS: int = 5
+    BD_TIMEOUT_CONSULTA_MS: int = 15000
+    BD_TIMEOUT_INTERACTIVO_MS: int = 5000
+    BD_TIMEOUT_ANALITICO_MS: int = 60000
+    BD_TIMEOUT_HISTORIA_FLUJO_MS: int = 30000  # Cada FETCH del cursor de la historia en flujo
+
+    # Circuito: errores seguidos de BD que lo abren y espera antes de reintentar
+    CIRCUITO_FALLOS: int = 5
+    CIRCUITO_ESPERA_SEGUNDOS: int = 15
+
+    # Verificación periódica del coordinador y los workers (/readyz)
+    SALUD_INTERVALO_SEGUNDOS: float = 5.0
+    SALUD_TIMEOUT_MS: int = 2000
+
+    # Modo degradado: con el circuito abierto, los GET /api/ se sirven desde las
+    # últimas respuestas guardadas de cada usuario (solo lectura)
+    MODO_DEGRADADO: bool = False
+    DEGRADADO_TTL_SEGUNDOS: int = 900
+    DEGRADADO_MAX_ENTRADAS: int = 300
+    DEGRADADO_MAX_BYTES: int = 131072
+
+    # Caché compartida de pacientes: "memoria" (por proceso), "redis" (entre
+    # pods, CACHE_PACIENTES_URL) o "ninguno". Entradas de más de
+    # CACHE_PACIENTES_MAX_BYTES no se guardan
+    CACHE_PACIENTES_BACKEND: str = "memoria"
+    CACHE_PACIENTES_URL: str = "redis://localhost:6379/0"
+    CACHE_PACIENTES_TTL_SEGUNDOS: int = 300
+    CACHE_PACIENTES_MAX_ENTRADAS: int = 2000
+    CACHE_PACIENTES_MAX_BYTES: int = 524288
+    CACHE_PACIENTES_TIMEOUT_SEGUNDOS: float = 0.2
+
+    # Perfilador por muestreo bajo demanda (solo administradores). Con varias
+    # réplicas, el directorio debe ser un volumen compartido
+    PERFILADOR_HABILITADO: bool = False
+    PERFILADOR_INTERVALO_MS: float = 5.0
+    PERFILADOR_MAX_SEGUNDOS: int = 60
+    PERFILADOR_DIRECTORIO: str = "/tmp/hce_perfiles"
+    PERFILADOR_RETENCION_HORAS: int = 24
+
+    # Trazas OpenTelemetry: "otlp" (TRAZAS_OTLP_ENDPOINT), "archivo" (una línea
+    # JSON por span en TRAZAS_ARCHIVO) o "ninguno". TRAZAS_MUESTREO es la
+    # fracción de peticiones trazadas cuando el cliente no envía traceparent
+    TRAZAS_EXPORTADOR: str = "ninguno"
+    TRAZAS_SERVICIO: str = "hce-middleware"
+    TRAZAS_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRAZAS_ARCHIVO: str = "/tmp/hce_trazas.jsonl"
+    TRAZAS_MUESTREO: float = 1.0
+
+    # Control de admisión por clase de ruta (backend/core/control_carga.py), por
+    # proceso: peticiones simultáneas (LIMITE) y en espera (COLA) de cada clase;
+    # el resto recibe 503 con Retry-After
+    CONTROL_CARGA_HABILITADO: bool = True
+    CONTROL_CARGA_ESPERA_SEGUNDOS: float = 2.0
+    CONTROL_CARGA_PDF_LIMITE: int = 2
+    CONTROL_CARGA_PDF_COLA: int = 4
+    CONTROL_CARGA_AUTENTICACION_LIMITE: int = 4
+    CONTROL_CARGA_AUTENTICACION_COLA: int = 16
+    CONTROL_CARGA_HISTORIA_LIMITE: int = 8
+    CONTROL_CARGA_HISTORIA_COLA: int = 16
+    CONTROL_CARGA_ANALITICA_LIMITE: int = 2
+    CONTROL_CARGA_ANALITICA_COLA: int = 4
+    CONTROL_CARGA_GENERAL_LIMITE: int = 24
+    CONTROL_CARGA_GENERAL_COLA: int = 64
+
+    # Vigencia de las claves Idempotency-Key
+    IDEMPOTENCIA_RETENCION_HORAS: int = 24
+
     @property
     def database_url(self) -> str:
         return f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -0,0 +1,221 @@
+"""
+Control de admisión por clase de ruta (``CONTROL_CARGA_HABILITADO``).
+
+En los picos, las rutas costosas (PDF con WeasyPrint, /token con Argon2, la
+historia completa) ocupan todos los hilos del pool y las conexiones de la BD,
+y las rutas baratas agotan su tiempo esperando detrás de ellas. Cada petición
+se clasifica por su ruta y entra en el presupuesto de su clase:
+
+- hasta ``limite`` peticiones de la clase se atienden a la vez,
+- hasta ``cola`` más esperan turno en orden de llegada, como mucho
+  ``CONTROL_CARGA_ESPERA_SEGUNDOS``,
+- el resto recibe de inmediato 503 con ``Retry-After``, sin consumir hilos ni
+  conexiones.
+
+El presupuesto se ocupa hasta que termina de enviarse la respuesta (incluido
+el cuerpo de un PDF por partes). Los contadores son por proceso (cada worker
+de Gunicorn tiene los suyos) y solo se tocan desde el bucle de eventos, así
+que no necesitan candado. ``GET /metrics`` los exporta en formato Prometheus.
+"""
+
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Pattern, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from backend.core.config import settings
+
+PDF = "pdf"
+AUTENTICACION = "autenticacion"
+HISTORIA = "historia"
+ANALITICA = "analitica"
+GENERAL = "general"
+
+# (clase, método o None para cualquiera, ruta). Gana la primera coincidencia;
+# lo que no coincide es GENERAL
+REGLAS: Tuple[Tuple[str, Optional[str], Pattern], ...] = (
+    (PDF, None, re.compile(r"^/exportar_pdf/")),
+    (AUTENTICACION, "POST", re.compile(r"^/token$")),
+    (AUTENTICACION, None, re.compile(r"^/hash-password/")),
+    (HISTORIA, "GET", re.compile(r"^/api/pacientes/\d+$|^/api/admision/pacientes/\d+$|^/paciente/me$")),
+    (HISTORIA, None, re.compile(r"^/api/admision/pacientes/lote$|^/api/sincronizacion/")),
+    (ANALITICA, "GET", re.compile(r"^/api/(reportes|epidemiologia)/|^/api/atenciones/buscar$|^/fhir/")),
+)
+
+# Sondas, métricas, estáticos y flujos SSE (de larga duración: ocuparían un
+# lugar mientras el navegador esté abierto)
+EXENTAS: Tuple[str, ...] = ("/healthz", "/readyz", "/metrics", "/static/", "/api/eventos/")
+
+_REINTENTAR_MAX_SEGUNDOS = 30
+
+
+class Presupuesto:
+    def __init__(self, clase: str, limite: int, cola: int, espera_segundos: float):
+        self.clase = clase
+        self.limite = max(1, limite)
+        self.cola = max(0, cola)
+        self.espera_segundos = espera_segundos
+        self.en_curso = 0
+        self._espera: Deque[asyncio.Future] = deque()
+        self.admitidas = 0
+        self.rechazadas_cola_llena = 0
+        self.rechazadas_espera = 0
+        self._duracion_media = 0.0
+
+    @property
+    def en_cola(self) -> int:
+        return len(self._espera)
+
+    async def entrar(self) -> bool:
+        """Ocupa un lugar, esperando en la cola si hace falta. False si se rechaza."""
+        if self.en_curso < self.limite and not self._espera:
+            self.en_curso += 1
+            self.admitidas += 1
+            return True
+        if len(self._espera) >= self.cola:
+            self.rechazadas_cola_llena += 1
+            return False
+
+        turno = asyncio.get_running_loop().create_future()
+        self._espera.append(turno)
+        try:
+            await asyncio.wait((turno,), timeout=self.espera_segundos)
+        except asyncio.CancelledError:
+            # El cliente se fue mientras esperaba; si ya se le había cedido el
+            # lugar, se pasa al siguiente
+            if turno.done() and not turno.cancelled():
+                self.salir()
+            else:
+                self._quitar(turno)
+            raise
+        if not turno.done():
+            self._quitar(turno)
+            self.rechazadas_espera += 1
+            return False
+        self.admitidas += 1
+        return True
+
+    def _quitar(self, turno: asyncio.Future) -> None:
+        turno.cancel()
+        try:
+            self._espera.remove(turno)
+        except ValueError:
+            pass
+
+    def salir(self, duracion: Optional[float] = None) -> None:
+        """Libera el lugar: lo cede al primero de la cola (sin volver a contarlo) o lo devuelve."""
+        if duracion is not None:
+            # Media móvil exponencial, para estimar Retry-After
+            self._duracion_media += 0.2 * (duracion - self._duracion_media)
+        while self._espera:
+            turno = self._espera.popleft()
+            if not turno.done():
+                turno.set_result(True)
+                return
+        self.en_curso -= 1
+
+    def reintentar_en(self) -> int:
+        """Segundos estimados hasta que se desocupe la cola."""
+        estimado = self._duracion_media * (self.en_cola + 1) / self.limite
+        return min(_REINTENTAR_MAX_SEGUNDOS, max(1, math.ceil(estimado)))
+
+
+def _crear_presupuestos() -> Dict[str, Presupuesto]:
+    espera = settings.CONTROL_CARGA_ESPERA_SEGUNDOS
+    return {
+        clase: Presupuesto(clase, limite, cola, espera)
+        for clase, limite, cola in (
+            (PDF, settings.CONTROL_CARGA_PDF_LIMITE, settings.CONTROL_CARGA_PDF_COLA),
+            (AUTENTICACION, settings.CONTROL_CARGA_AUTENTICACION_LIMITE, settings.CONTROL_CARGA_AUTENTICACION_COLA),
+            (HISTORIA, settings.CONTROL_CARGA_HISTORIA_LIMITE, settings.CONTROL_CARGA_HISTORIA_COLA),
+            (ANALITICA, settings.CONTROL_CARGA_ANALITICA_LIMITE, settings.CONTROL_CARGA_ANALITICA_COLA),
+            (GENERAL, settings.CONTROL_CARGA_GENERAL_LIMITE, settings.CONTROL_CARGA_GENERAL_COLA),
+        )
+    }
+
+
+presupuestos = _crear_presupuestos()
+
+
+def clasificar(metodo: str, ruta: str) -> Optional[str]:
+    """Clase de la petición, o None si está exenta del control."""
+    if ruta.startswith(EXENTAS):
+        return None
+    for clase, metodo_regla, patron in REGLAS:
+        if (metodo_regla is None or metodo_regla == metodo) and patron.search(ruta):
+            return clase
+    return GENERAL
+
+
+# ============================================
+# MÉTRICAS (FORMATO DE TEXTO DE PROMETHEUS)
+# ============================================
+
+_METRICAS = (
+    ("hce_admision_en_curso", "gauge", "Peticiones en atención por clase de ruta", lambda p: p.en_curso),
+    ("hce_admision_en_cola", "gauge", "Peticiones esperando turno por clase de ruta", lambda p: p.en_cola),
+    ("hce_admision_limite", "gauge", "Peticiones simultáneas permitidas por clase de ruta", lambda p: p.limite),
+    ("hce_admision_cola_maxima", "gauge", "Peticiones que pueden esperar turno por clase de ruta", lambda p: p.cola),
+    ("hce_admision_admitidas_total", "counter", "Peticiones admitidas", lambda p: p.admitidas),
+)
+
+
+def metricas() -> str:
+    """Estado de los presupuestos de este proceso (etiqueta ``pid``)."""
+    pid = os.getpid()
+    lineas = []
+    for nombre, tipo, ayuda, valor in _METRICAS:
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        for p in presupuestos.values():
+            lineas.append(f'{nombre}{{clase="{p.clase}",pid="{pid}"}} {valor(p)}')
+    nombre = "hce_admision_rechazadas_total"
+    lineas += [f"# HELP {nombre} Peticiones rechazadas con 503 (cola llena o espera agotada)", f"# TYPE {nombre} counter"]
+    for p in presupuestos.values():
+        lineas.append(f'{nombre}{{clase="{p.clase}",motivo="cola_llena",pid="{pid}"}} {p.rechazadas_cola_llena}')
+        lineas.append(f'{nombre}{{clase="{p.clase}",motivo="espera",pid="{pid}"}} {p.rechazadas_espera}')
+    return "\n".join(lineas) + "\n"
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class ControlCargaMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        clase = clasificar(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if clase is None:
+            await self.app(scope, receive, send)
+            return
+
+        presupuesto = presupuestos[clase]
+        if not await presupuesto.entrar():
+            await self._rechazar(presupuesto, send)
+            return
+        inicio = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            presupuesto.salir(time.monotonic() - inicio)
+
+    @staticmethod
+    async def _rechazar(presupuesto: Presupuesto, send: Send) -> None:
+        cuerpo = b'{"detail":"Servidor ocupado. Intente de nuevo en unos segundos."}'
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"retry-after", str(presupuesto.reintentar_en()).encode()),
+                (b"x-control-carga", presupuesto.clase.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
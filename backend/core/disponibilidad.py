@@ -0,0 +1,194 @@
+"""
+Disponibilidad de la base de datos: circuito y verificación periódica.
+
+Cuando el coordinador de Citus o un worker responden lento, cada petición
+espera su conexión y su consulta hasta agotar el tiempo, y el pool se llena.
+El ``circuito`` cuenta los errores de conexión del motor (rechazada, perdida
+o sin respuesta dentro de ``BD_CONEXION_TIMEOUT_SEGUNDOS``): tras ``CIRCUITO_FALLOS`` seguidos se abre y las peticiones que usan la BD
+fallan de inmediato con 503 durante ``CIRCUITO_ESPERA_SEGUNDOS``. Después se
+deja pasar una petición de prueba; la primera consulta exitosa lo cierra.
+Una consulta cancelada por ``statement_timeout`` (SQLSTATE 57014) no cuenta:
+la BD respondió, la consulta era demasiado costosa, y la petición recibe 504.
+
+El ``monitor`` consulta el coordinador y los workers cada
+``SALUD_INTERVALO_SEGUNDOS`` en un hilo aparte y guarda el resultado, de modo
+que /readyz responde sin tocar la BD. Sus consultas usan el mismo motor, así
+que también sirven de prueba para cerrar el circuito sin esperar tráfico.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.session import SessionLocal, engine, limitar_tiempo
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+# SQLSTATE query_canceled: statement_timeout (o pg_cancel_backend)
+CONSULTA_CANCELADA = "57014"
+
+_HAY_CITUS = text("SELECT to_regclass('pg_catalog.pg_dist_node') IS NOT NULL")
+_WORKERS = text("SELECT nodename, nodeport, success FROM run_command_on_workers('SELECT 1')")
+
+
+class BaseDatosNoDisponible(Exception):
+    def __init__(self, reintentar_en: int):
+        super().__init__("Base de datos no disponible temporalmente.")
+        self.reintentar_en = reintentar_en
+
+
+class Circuito:
+    def __init__(self, fallos_max: int, espera_segundos: float):
+        self.fallos_max = fallos_max
+        self.espera_segundos = espera_segundos
+        self._candado = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde: Optional[float] = None
+
+    @property
+    def estado(self) -> str:
+        abierto_desde = self._abierto_desde
+        if abierto_desde is None:
+            return CERRADO
+        if time.monotonic() - abierto_desde >= self.espera_segundos:
+            return SEMIABIERTO
+        return ABIERTO
+
+    def permitir(self) -> None:
+        """Lanza ``BaseDatosNoDisponible`` si el circuito está abierto."""
+        if self._abierto_desde is None:
+            return
+        with self._candado:
+            if self._abierto_desde is None:
+                return
+            transcurrido = time.monotonic() - self._abierto_desde
+            if transcurrido >= self.espera_segundos:
+                # Semiabierto: pasa esta petición y las demás esperan otro periodo
+                self._abierto_desde = time.monotonic()
+                return
+            raise BaseDatosNoDisponible(max(1, math.ceil(self.espera_segundos - transcurrido)))
+
+    def registrar_exito(self) -> None:
+        if self._fallos == 0 and self._abierto_desde is None:
+            return
+        with self._candado:
+            if self._abierto_desde is not None:
+                print("[INFO] Circuito de BD cerrado: la base de datos responde de nuevo")
+            self._fallos = 0
+            self._abierto_desde = None
+
+    def registrar_fallo(self) -> None:
+        with self._candado:
+            self._fallos += 1
+            if self._abierto_desde is not None or self._fallos >= self.fallos_max:
+                if self._abierto_desde is None:
+                    print(f"[ADVERTENCIA] Circuito de BD abierto tras {self._fallos} errores seguidos")
+                self._abierto_desde = time.monotonic()
+
+
+circuito = Circuito(settings.CIRCUITO_FALLOS, settings.CIRCUITO_ESPERA_SEGUNDOS)
+
+
+def abrir_sesion(milisegundos: int) -> Session:
+    """
+    Sesión para una petición: pasa por el circuito (``BaseDatosNoDisponible``
+    si está abierto) y limita cada consulta a ``milisegundos``.
+    """
+    circuito.permitir()
+    return limitar_tiempo(SessionLocal(), milisegundos)
+
+
+def conexiones_libres() -> int:
+    """Conexiones que el pool de este proceso aún puede entregar sin esperar."""
+    pool = engine.pool
+    try:
+        return pool.size() + getattr(pool, "_max_overflow", 0) - pool.checkedout()
+    except AttributeError:
+        # Pools sin tamaño fijo (NullPool, StaticPool)
+        return 1
+
+
+def consulta_cancelada(error: BaseException) -> bool:
+    """True si el error del driver es una consulta cancelada por ``statement_timeout``."""
+    return getattr(getattr(error, "orig", error), "pgcode", None) == CONSULTA_CANCELADA
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _consulta_exitosa(conn, cursor, statement, parameters, context, executemany):
+    circuito.registrar_exito()
+
+
+@event.listens_for(engine, "handle_error")
+def _error_bd(contexto):
+    # Conexión rechazada o perdida; los errores de datos o de sintaxis y las
+    # consultas canceladas por statement_timeout no dicen nada de la salud de la BD
+    if consulta_cancelada(contexto.original_exception):
+        return
+    if contexto.is_disconnect or isinstance(contexto.sqlalchemy_exception, exc.OperationalError):
+        circuito.registrar_fallo()
+
+
+class MonitorSalud:
+    def __init__(self):
+        self.estado: dict = {"bd": False, "workers": [], "verificado_en": None, "error": None}
+        self._tarea: Optional[asyncio.Task] = None
+
+    def iniciar(self) -> None:
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _ciclo(self) -> None:
+        while True:
+            await asyncio.to_thread(self.verificar)
+            await asyncio.sleep(settings.SALUD_INTERVALO_SEGUNDOS)
+
+    def verificar(self) -> dict:
+        """Consulta el coordinador y los workers (en un hilo) y guarda el resultado."""
+        inicio = time.monotonic()
+        estado = {"bd": False, "workers": [], "error": None}
+        try:
+            with engine.begin() as conexion:
+                conexion.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.SALUD_TIMEOUT_MS)}")
+                if conexion.execute(_HAY_CITUS).scalar():
+                    estado["workers"] = [
+                        {"nodo": f"{fila.nodename}:{fila.nodeport}", "disponible": bool(fila.success)}
+                        for fila in conexion.execute(_WORKERS)
+                    ]
+            estado["bd"] = True
+        except Exception as e:
+            estado["error"] = str(e).splitlines()[0][:200] if str(e) else type(e).__name__
+        estado["latencia_ms"] = round((time.monotonic() - inicio) * 1000, 1)
+        estado["verificado_en"] = datetime.now(timezone.utc).isoformat()
+        self.estado = estado
+        return estado
+
+    def listo(self) -> bool:
+        """Coordinador verificado recientemente y circuito sin abrir."""
+        verificado_en = self.estado.get("verificado_en")
+        if not self.estado["bd"] or verificado_en is None:
+            return False
+        antiguedad = (datetime.now(timezone.utc) - datetime.fromisoformat(verificado_en)).total_seconds()
+        return antiguedad <= 3 * settings.SALUD_INTERVALO_SEGUNDOS + settings.SALUD_TIMEOUT_MS / 1000 and (
+            circuito.estado != ABIERTO
+        )
+
+
+monitor = MonitorSalud()
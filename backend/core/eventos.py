@@ -0,0 +1,139 @@
+"""
+Difusión de eventos de la historia clínica a las sesiones conectadas.
+
+Cada proceso del middleware ejecuta un ``DespachadorEventos`` que consulta
+periódicamente ``hcd.outbox_evento`` y reparte los eventos nuevos entre sus
+suscripciones en memoria (una cola por conexión SSE). Como todos los procesos
+leen el outbox completo, cualquier réplica puede atender a cualquier cliente.
+
+``created_at`` se fija al inicio de la transacción, así que un evento puede
+confirmarse con un ``created_at`` anterior al último leído. Por eso cada
+lectura vuelve ``EVENTOS_SOLAPE_SEGUNDOS`` hacia atrás y los eventos ya
+enviados se descartan por ``evento_id``.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from backend.core.config import settings
+from backend.db import outbox
+from backend.db.session import SessionLocal
+
+# Eventos encolados por conexión antes de considerarla bloqueada y cerrarla
+TAMANO_COLA = 100
+
+# Frecuencia con la que un proceso depura los eventos vencidos
+INTERVALO_DEPURACION = timedelta(minutes=5)
+
+
+class Suscripcion:
+    """
+    Conexión interesada en los eventos de un paciente (``documento_id``) o en
+    las atenciones registradas por un médico (``medico_documento_id``; el
+    nombre de ``responsable_registro`` no distingue médicos homónimos).
+    """
+
+    def __init__(self, documento_id: Optional[int] = None, medico_documento_id: Optional[int] = None):
+        self.documento_id = documento_id
+        self.medico_documento_id = medico_documento_id
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=TAMANO_COLA)
+        self.cerrada = False
+
+    def acepta(self, evento: dict) -> bool:
+        if self.documento_id is not None:
+            return evento["documento_id"] == self.documento_id
+        return (
+            self.medico_documento_id is not None
+            and evento["medico_documento_id"] == self.medico_documento_id
+        )
+
+    def entregar(self, evento: dict) -> None:
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: se cierra y el navegador reconecta y recarga
+            self.cerrada = True
+
+
+class DespachadorEventos:
+    def __init__(self):
+        self._suscripciones: List[Suscripcion] = []
+        self._tarea: Optional[asyncio.Task] = None
+        self._cursor: Optional[datetime] = None
+        self._enviados: Dict[str, datetime] = {}
+        self._ultima_depuracion: Optional[datetime] = None
+
+    def suscribir(self, suscripcion: Suscripcion) -> Suscripcion:
+        self._suscripciones.append(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion) -> None:
+        if suscripcion in self._suscripciones:
+            self._suscripciones.remove(suscripcion)
+
+    def iniciar(self) -> None:
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _ciclo(self) -> None:
+        while True:
+            await asyncio.sleep(settings.EVENTOS_INTERVALO_SEGUNDOS)
+            if not self._suscripciones:
+                # Sin oyentes no se consulta la BD; al volver a haberlos se parte de "ahora"
+                self._cursor = None
+                continue
+            try:
+                eventos = await asyncio.to_thread(self._leer)
+            except Exception as e:
+                print(f"[ADVERTENCIA] No se pudo leer el outbox de eventos: {e}")
+                continue
+            for evento in eventos:
+                for suscripcion in list(self._suscripciones):
+                    if suscripcion.acepta(evento):
+                        suscripcion.entregar(evento)
+
+    def _leer(self) -> List[dict]:
+        """Lee los eventos nuevos (en un hilo, la sesión es síncrona)."""
+        solape = timedelta(seconds=settings.EVENTOS_SOLAPE_SEGUNDOS)
+        db = SessionLocal()
+        try:
+            if self._cursor is None:
+                self._cursor = outbox.ahora(db)
+            nuevos = []
+            for evento in outbox.leer_eventos(db, self._cursor - solape):
+                clave = str(evento.evento_id)
+                self._cursor = max(self._cursor, evento.created_at)
+                if clave in self._enviados:
+                    continue
+                self._enviados[clave] = evento.created_at
+                nuevos.append({
+                    "evento_id": clave,
+                    "tipo": evento.tipo,
+                    "documento_id": evento.documento_id,
+                    "responsable_registro": evento.responsable_registro,
+                    "medico_documento_id": evento.medico_documento_id,
+                    "payload": evento.payload,
+                })
+
+            limite = self._cursor - solape
+            self._enviados = {k: v for k, v in self._enviados.items() if v >= limite}
+
+            if self._ultima_depuracion is None or self._cursor - self._ultima_depuracion > INTERVALO_DEPURACION:
+                self._ultima_depuracion = self._cursor
+                outbox.depurar_eventos(db, self._cursor - timedelta(hours=settings.EVENTOS_RETENCION_HORAS))
+            return nuevos
+        finally:
+            db.close()
+
+
+despachador = DespachadorEventos()
@@ -0,0 +1,186 @@
+"""
+Ejecución asíncrona de la exportación masiva FHIR (``$export``).
+
+El endpoint de inicio crea el trabajo y lo encola aquí; el cliente consulta
+el estado hasta que el manifiesto está listo y descarga los archivos NDJSON.
+Cada segmento (grupo de shards co-localizados) se exporta en un hilo,
+hasta ``EXPORTACION_FHIR_PARALELISMO`` a la vez, escribiendo fila a fila desde
+un cursor de servidor: la memoria no depende del tamaño de la base.
+
+Los archivos quedan en ``EXPORTACION_FHIR_DIRECTORIO/<exportacion_id>/``; con
+varias réplicas del middleware ese directorio debe ser un volumen compartido
+(``fastapi-compartido-pvc`` en infra/k8s), porque la descarga puede llegar a
+cualquier réplica.
+
+Mientras un proceso tiene trabajos en cola o en curso, un hilo renueva su
+``latido_en`` cada ``EXPORTACION_FHIR_LATIDO_SEGUNDOS``. Si el proceso muere,
+el latido vence y ``marcar_huerfanas`` (al consultar el estado o iniciar otra
+exportación) pasa el trabajo a error en lugar de dejarlo en curso para siempre.
+"""
+
+import json
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional, Set
+
+from backend.core import fhir
+from backend.core.config import settings
+from backend.db import exportacion_fhir
+from backend.db.session import SessionLocal
+
+
+class ExportacionCancelada(Exception):
+    pass
+
+
+class ExportadorFHIR:
+    def __init__(self):
+        # Un trabajo a la vez por proceso; el paralelismo está dentro del trabajo
+        self._trabajos = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exportacion-fhir")
+        self._canceladas: Set[str] = set()
+        self._deteniendo = False
+        self._propias: Set[str] = set()
+        self._latido: Optional[threading.Thread] = None
+        self._fin_latido = threading.Event()
+
+    def directorio(self, exportacion_id) -> Path:
+        return Path(settings.EXPORTACION_FHIR_DIRECTORIO) / str(exportacion_id)
+
+    def lanzar(self, exportacion_id) -> None:
+        self._propias.add(str(exportacion_id))
+        if self._latido is None:
+            self._latido = threading.Thread(target=self._latir, name="exportacion-fhir-latido", daemon=True)
+            self._latido.start()
+        self._trabajos.submit(self._ejecutar, str(exportacion_id))
+
+    def _latir(self) -> None:
+        while not self._fin_latido.wait(settings.EXPORTACION_FHIR_LATIDO_SEGUNDOS):
+            propias = list(self._propias)
+            if not propias:
+                continue
+            db = SessionLocal()
+            try:
+                exportacion_fhir.latir(db, propias)
+            except Exception as e:
+                print(f"[ADVERTENCIA] No se pudo renovar el latido de las exportaciones FHIR: {e}")
+            finally:
+                db.close()
+
+    def cancelar(self, exportacion_id) -> None:
+        self._canceladas.add(str(exportacion_id))
+
+    def detener(self) -> None:
+        """Interrumpe el trabajo en curso y espera a que sus hilos terminen el lote actual."""
+        self._deteniendo = True
+        self._trabajos.shutdown(wait=True, cancel_futures=True)
+        self._fin_latido.set()
+
+    def depurar(self) -> int:
+        """Elimina los trabajos vencidos y sus archivos. Devuelve cuántos se borraron."""
+        db = SessionLocal()
+        try:
+            exportacion_fhir.marcar_huerfanas(db)
+            vencidas = exportacion_fhir.vencidas(db)
+            for trabajo in vencidas:
+                shutil.rmtree(self.directorio(trabajo.exportacion_id), ignore_errors=True)
+                db.delete(trabajo)
+            db.commit()
+            return len(vencidas)
+        finally:
+            db.close()
+
+    def _interrumpida(self, exportacion_id: str) -> bool:
+        return self._deteniendo or exportacion_id in self._canceladas
+
+    def _ejecutar(self, exportacion_id: str) -> None:
+        db = SessionLocal()
+        directorio = self.directorio(exportacion_id)
+        try:
+            trabajo = exportacion_fhir.obtener(db, exportacion_id)
+            if trabajo is None or trabajo.estado != exportacion_fhir.EN_COLA:
+                return
+            tipos, desde = list(trabajo.tipos), trabajo.desde
+            segmentos = exportacion_fhir.segmentos(db)
+            exportacion_fhir.actualizar(
+                db, exportacion_id, estado=exportacion_fhir.EN_CURSO, segmentos_total=len(segmentos)
+            )
+            directorio.mkdir(parents=True, exist_ok=True)
+
+            archivos: List[dict] = []
+            listos = 0
+            with ThreadPoolExecutor(max_workers=settings.EXPORTACION_FHIR_PARALELISMO) as pool:
+                futuros = [
+                    pool.submit(self._exportar_segmento, exportacion_id, segmento, tipos, desde, directorio)
+                    for segmento in segmentos
+                ]
+                for futuro in as_completed(futuros):
+                    try:
+                        archivos.extend(futuro.result())
+                    except Exception:
+                        # Detener los demás segmentos antes de salir del pool
+                        self._canceladas.add(exportacion_id)
+                        raise
+                    listos += 1
+                    exportacion_fhir.actualizar(db, exportacion_id, segmentos_listos=listos)
+                    # La cancelación puede haberse pedido en otro proceso, o el
+                    # trabajo puede haberse dado por huérfano si el latido se retrasó
+                    db.expire_all()
+                    if exportacion_fhir.obtener(db, exportacion_id).estado in (
+                        exportacion_fhir.CANCELADA, exportacion_fhir.ERROR
+                    ):
+                        self._canceladas.add(exportacion_id)
+                    if self._interrumpida(exportacion_id):
+                        raise ExportacionCancelada()
+
+            archivos.sort(key=lambda a: (fhir.TIPOS_RECURSO.index(a["type"]), a["archivo"]))
+            exportacion_fhir.actualizar(db, exportacion_id, estado=exportacion_fhir.COMPLETADA, archivos=archivos)
+
+        except ExportacionCancelada:
+            db.rollback()
+            shutil.rmtree(directorio, ignore_errors=True)
+            if self._deteniendo:
+                exportacion_fhir.actualizar(
+                    db, exportacion_id, estado=exportacion_fhir.ERROR,
+                    error="Exportación interrumpida por el reinicio del servidor; solicítela de nuevo.",
+                )
+            elif exportacion_fhir.obtener(db, exportacion_id).estado != exportacion_fhir.ERROR:
+                # Un trabajo ya dado por huérfano conserva su error
+                exportacion_fhir.actualizar(db, exportacion_id, estado=exportacion_fhir.CANCELADA)
+        except Exception as e:
+            print(f"[ERROR] Exportación FHIR {exportacion_id} fallida: {e}")
+            db.rollback()
+            shutil.rmtree(directorio, ignore_errors=True)
+            exportacion_fhir.actualizar(db, exportacion_id, estado=exportacion_fhir.ERROR, error=str(e))
+        finally:
+            self._canceladas.discard(exportacion_id)
+            self._propias.discard(exportacion_id)
+            db.close()
+
+    def _exportar_segmento(self, exportacion_id, segmento, tipos, desde, directorio: Path) -> List[dict]:
+        """Escribe un archivo NDJSON por tipo de recurso presente en el segmento."""
+        archivos = []
+        lote = settings.EXPORTACION_FHIR_LOTE
+        for tipo in tipos:
+            if exportacion_fhir.CONSULTAS[tipo][0] not in segmento.tablas:
+                continue
+            convertir = fhir.CONVERSORES[tipo]
+            nombre = f"{tipo}.{segmento.nombre}.ndjson"
+            ruta = directorio / nombre
+            total = 0
+            with open(ruta, "w", encoding="utf-8") as salida:
+                for fila in exportacion_fhir.leer(segmento, tipo, desde, lote):
+                    salida.write(json.dumps(convertir(fila), ensure_ascii=False, separators=(",", ":")))
+                    salida.write("\n")
+                    total += 1
+                    if total % lote == 0 and self._interrumpida(exportacion_id):
+                        raise ExportacionCancelada()
+            if total:
+                archivos.append({"type": tipo, "archivo": nombre, "count": total})
+            else:
+                ruta.unlink()
+        return archivos
+
+
+exportador = ExportadorFHIR()
@@ -0,0 +1,185 @@
+"""
+Conversión de filas de la HCE a recursos FHIR R4 (JSON).
+
+Funciones puras sobre filas (mapeos ``columna -> valor``) para que la
+exportación masiva pueda convertir millones de filas sin instanciar objetos
+del ORM. Solo se emiten los elementos con valor.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+SISTEMA_CIE10 = "http://hl7.org/fhir/sid/icd-10"
+SISTEMA_DOCUMENTO = "urn:hce:documento"
+SISTEMA_REGISTRO_PROFESIONAL = "urn:hce:registro-profesional"
+SISTEMA_CLASE_ENCUENTRO = "http://terminology.hl7.org/CodeSystem/v3-ActCode"
+SISTEMA_CATEGORIA_CONDICION = "http://terminology.hl7.org/CodeSystem/condition-category"
+SISTEMA_VERIFICACION_CONDICION = "http://terminology.hl7.org/CodeSystem/condition-ver-status"
+
+PATIENT = "Patient"
+ENCOUNTER = "Encounter"
+CONDITION = "Condition"
+MEDICATION_ADMINISTRATION = "MedicationAdministration"
+PRACTITIONER = "Practitioner"
+
+TIPOS_RECURSO = (PATIENT, ENCOUNTER, CONDITION, MEDICATION_ADMINISTRATION, PRACTITIONER)
+
+
+def _fecha(valor: Any) -> Optional[str]:
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return None
+
+
+def _sin_vacios(recurso: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in recurso.items() if v not in (None, "", [], {})}
+
+
+def _genero(sexo: Optional[str]) -> str:
+    inicial = (sexo or "").strip()[:1].upper()
+    return {"M": "male", "H": "male", "F": "female"}.get(inicial, "unknown")
+
+
+def _clase_encuentro(tipo_atencion: Optional[str]) -> Dict[str, str]:
+    tipo = (tipo_atencion or "").lower()
+    if "urgencia" in tipo:
+        return {"system": SISTEMA_CLASE_ENCUENTRO, "code": "EMER", "display": "emergency"}
+    if "hospital" in tipo:
+        return {"system": SISTEMA_CLASE_ENCUENTRO, "code": "IMP", "display": "inpatient encounter"}
+    return {"system": SISTEMA_CLASE_ENCUENTRO, "code": "AMB", "display": "ambulatory"}
+
+
+def _referencia(tipo: str, identificador: Any) -> Optional[Dict[str, str]]:
+    return {"reference": f"{tipo}/{identificador}"} if identificador is not None else None
+
+
+def paciente(fila: Mapping[str, Any]) -> dict:
+    telecom: List[dict] = []
+    for sistema, uso, columna in (("phone", "home", "telefono"), ("phone", "mobile", "celular"), ("email", None, "correo_electronico")):
+        if fila[columna]:
+            telecom.append(_sin_vacios({"system": sistema, "use": uso, "value": fila[columna]}))
+    return _sin_vacios({
+        "resourceType": PATIENT,
+        "id": str(fila["documento_id"]),
+        "identifier": [_sin_vacios({
+            "system": SISTEMA_DOCUMENTO,
+            "type": {"text": fila["tipo_documento"]} if fila["tipo_documento"] else None,
+            "value": str(fila["documento_id"]),
+        })],
+        "name": [_sin_vacios({
+            "use": "official",
+            "family": " ".join(p for p in (fila["primer_apellido"], fila["segundo_apellido"]) if p),
+            "given": [p for p in (fila["primer_nombre"], fila["segundo_nombre"]) if p],
+        })],
+        "gender": _genero(fila["sexo"]),
+        "birthDate": _fecha(fila["fecha_nacimiento"]),
+        "telecom": telecom,
+        "address": [_sin_vacios({
+            "text": fila["direccion_residencia"],
+            "city": fila["municipio_ciudad"],
+            "state": fila["departamento"],
+            "country": "CO",
+        })],
+        "maritalStatus": {"text": fila["estado_civil"]} if fila["estado_civil"] else None,
+        "meta": {"lastUpdated": _fecha(fila["updated_at"])} if fila["updated_at"] else None,
+    })
+
+
+def encuentro(fila: Mapping[str, Any]) -> dict:
+    cerrada = fila["fecha_hora_cierre"] is not None or bool(fila["estado_egreso"])
+    return _sin_vacios({
+        "resourceType": ENCOUNTER,
+        "id": str(fila["atencion_id"]),
+        "status": "finished" if cerrada else "in-progress",
+        "class": _clase_encuentro(fila["tipo_atencion"]),
+        "type": [{"text": fila["tipo_atencion"]}] if fila["tipo_atencion"] else None,
+        "subject": _referencia(PATIENT, fila["documento_id"]),
+        "participant": (
+            [{"individual": _referencia(PRACTITIONER, fila["profesional_responsable"])}]
+            if fila["profesional_responsable"] else None
+        ),
+        "period": _sin_vacios({
+            "start": _fecha(fila["fecha_hora_atencion"]),
+            "end": _fecha(fila["fecha_hora_cierre"]),
+        }),
+        "reasonCode": [{"text": fila["motivo_consulta"]}] if fila["motivo_consulta"] else None,
+        "hospitalization": (
+            {"dischargeDisposition": {"text": fila["estado_egreso"]}} if fila["estado_egreso"] else None
+        ),
+        "meta": {"lastUpdated": _fecha(fila["updated_at"])} if fila["updated_at"] else None,
+    })
+
+
+def condicion(fila: Mapping[str, Any]) -> dict:
+    tipo = (fila["tipo_diagnostico"] or "").lower()
+    verificacion = "confirmed" if "confirm" in tipo or "definitiv" in tipo else "provisional"
+    codigo = (fila["codigo_cie10"] or "").replace(".", "").strip().upper()
+    return _sin_vacios({
+        "resourceType": CONDITION,
+        "id": str(fila["diagnostico_id"]),
+        "category": [{"coding": [{"system": SISTEMA_CATEGORIA_CONDICION, "code": "encounter-diagnosis"}]}],
+        "verificationStatus": {"coding": [{"system": SISTEMA_VERIFICACION_CONDICION, "code": verificacion}]},
+        "code": _sin_vacios({
+            "coding": [{"system": SISTEMA_CIE10, "code": codigo}] if codigo else None,
+            "text": fila["diagnostico_text"],
+        }),
+        "severity": {"text": fila["gravedad"]} if fila["gravedad"] else None,
+        "subject": _referencia(PATIENT, fila["documento_id"]),
+        "encounter": _referencia(ENCOUNTER, fila["atencion_id"]),
+        "recordedDate": _fecha(fila["created_at"]),
+    })
+
+
+def administracion_medicamento(fila: Mapping[str, Any]) -> dict:
+    dosis = " ".join(p for p in (fila["dosis"], fila["frecuencia"]) if p)
+    return _sin_vacios({
+        "resourceType": MEDICATION_ADMINISTRATION,
+        "id": str(fila["tecnologia_id"]),
+        "status": "completed",
+        "medicationCodeableConcept": {"text": fila["descripcion_medicamento"] or "Sin descripción"},
+        "subject": _referencia(PATIENT, fila["documento_id"]),
+        "context": _referencia(ENCOUNTER, fila["atencion_id"]),
+        "effectiveDateTime": _fecha(fila["created_at"]),
+        "performer": (
+            [{"actor": _referencia(PRACTITIONER, fila["id_personal_salud"])}]
+            if fila["id_personal_salud"] else None
+        ),
+        "reasonCode": [{"text": fila["finalidad_tecnologia"]}] if fila["finalidad_tecnologia"] else None,
+        "dosage": _sin_vacios({
+            "text": dosis,
+            "route": {"text": fila["via_administracion"]} if fila["via_administracion"] else None,
+        }),
+    })
+
+
+def profesional(fila: Mapping[str, Any]) -> dict:
+    contacto = fila["contacto"] if isinstance(fila["contacto"], dict) else {}
+    telecom = []
+    if contacto.get("telefono"):
+        telecom.append({"system": "phone", "value": str(contacto["telefono"])})
+    if contacto.get("email"):
+        telecom.append({"system": "email", "value": str(contacto["email"])})
+    return _sin_vacios({
+        "resourceType": PRACTITIONER,
+        "id": str(fila["id_personal_salud"]),
+        "identifier": (
+            [{"system": SISTEMA_REGISTRO_PROFESIONAL, "value": fila["registro_profesional"]}]
+            if fila["registro_profesional"] else None
+        ),
+        "name": [{"text": fila["nombre_completo"]}] if fila["nombre_completo"] else None,
+        "telecom": telecom,
+        "qualification": (
+            [{"code": {"text": fila["tipo_profesional"]}}] if fila["tipo_profesional"] else None
+        ),
+    })
+
+
+CONVERSORES = {
+    PATIENT: paciente,
+    ENCOUNTER: encuentro,
+    CONDITION: condicion,
+    MEDICATION_ADMINISTRATION: administracion_medicamento,
+    PRACTITIONER: profesional,
+}
@@ -0,0 +1,124 @@
+"""
+Modo degradado de solo lectura (``MODO_DEGRADADO``).
+
+Mientras la BD está disponible se guardan en memoria las últimas respuestas
+200 de los GET bajo /api/, por usuario (la clave incluye el token de sesión)
+y URL. Si el circuito de la BD está abierto, una petición que ya tiene
+respuesta guardada y vigente la recibe con ``X-Modo-Degradado: true`` y
+``Age``; el resto (incluidas todas las escrituras) sigue su curso y recibe el
+503 del circuito.
+
+La memoria está acotada: a lo sumo ``DEGRADADO_MAX_ENTRADAS`` respuestas de
+hasta ``DEGRADADO_MAX_BYTES`` cada una por proceso, descartando la usada hace
+más tiempo.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.core.disponibilidad import ABIERTO, circuito
+from backend.core.security import ALGORITHM, SECRET_KEY
+
+PREFIJO = "/api/"
+# Flujos y respuestas que cambian en cada petición
+RUTAS_EXCLUIDAS: Tuple[str, ...] = ("/api/eventos/", "/api/sincronizacion/")
+
+
+class ModoDegradadoMiddleware:
+    def __init__(self, app: ASGIApp, ttl_segundos: int, max_entradas: int, max_bytes: int):
+        self.app = app
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._respuestas: "OrderedDict[str, Tuple[float, list, bytes]]" = OrderedDict()
+
+    def _clave(self, scope: Scope) -> Optional[str]:
+        token = HTTPConnection(scope).cookies.get("hce_access_token")
+        if not token:
+            return None
+        clave = f"{token}\n{scope['path']}?{scope.get('query_string', b'').decode('latin-1')}"
+        return hashlib.sha256(clave.encode()).hexdigest()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not scope["path"].startswith(PREFIJO)
+            or scope["path"].startswith(RUTAS_EXCLUIDAS)
+        ):
+            await self.app(scope, receive, send)
+            return
+        clave = self._clave(scope)
+        if clave is None:
+            await self.app(scope, receive, send)
+            return
+
+        if circuito.estado == ABIERTO:
+            if await self._responder_guardada(scope, clave, send):
+                return
+            await self.app(scope, receive, send)
+            return
+
+        inicio: Optional[Message] = None
+        partes = []
+        tamano = 0
+
+        async def enviar(mensaje: Message) -> None:
+            nonlocal inicio, tamano
+            if mensaje["type"] == "http.response.start":
+                if mensaje["status"] == 200:
+                    inicio = mensaje
+            elif mensaje["type"] == "http.response.body" and inicio is not None:
+                cuerpo = mensaje.get("body", b"")
+                tamano += len(cuerpo)
+                if tamano > self.max_bytes:
+                    inicio = None
+                    partes.clear()
+                else:
+                    partes.append(cuerpo)
+                    if not mensaje.get("more_body", False):
+                        self._guardar(clave, inicio["headers"], b"".join(partes))
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
+
+    def _guardar(self, clave: str, cabeceras: list, cuerpo: bytes) -> None:
+        tipo = dict(cabeceras).get(b"content-type", b"")
+        if not tipo.startswith(b"application/json"):
+            return
+        self._respuestas[clave] = (time.monotonic(), list(cabeceras), cuerpo)
+        self._respuestas.move_to_end(clave)
+        while len(self._respuestas) > self.max_entradas:
+            self._respuestas.popitem(last=False)
+
+    async def _responder_guardada(self, scope: Scope, clave: str, send: Send) -> bool:
+        entrada = self._respuestas.get(clave)
+        if entrada is None:
+            return False
+        guardada_en, cabeceras, cuerpo = entrada
+        edad = time.monotonic() - guardada_en
+        if edad > self.ttl_segundos:
+            del self._respuestas[clave]
+            return False
+        # Sin BD no se puede consultar el usuario, pero sí comprobar que la
+        # sesión con la que se guardó la respuesta no ha vencido
+        try:
+            jwt.decode(HTTPConnection(scope).cookies["hce_access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return False
+
+        cabeceras = [(k, v) for k, v in cabeceras if k not in (b"age", b"etag", b"last-modified", b"cache-control")]
+        cabeceras += [
+            (b"age", str(int(edad)).encode()),
+            (b"x-modo-degradado", b"true"),
+            (b"cache-control", b"no-store"),
+        ]
+        await send({"type": "http.response.start", "status": 200, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": cuerpo})
+        return True
@@ -0,0 +1,370 @@
+"""
+Perfilador por muestreo bajo demanda (``PERFILADOR_HABILITADO``).
+
+Un hilo toma cada ``PERFILADOR_INTERVALO_MS`` la pila de todos los hilos del
+proceso (``sys._current_frames``), descarta los que están inactivos (esperando
+trabajo fuera de FastAPI/Starlette y de la aplicación) y acumula el tiempo por
+pila.
+Es tiempo de reloj: una consulta que espera a Citus cuenta como SQLAlchemy.
+
+Dos modos, ambos solo para administradores:
+
+- Una petición: el administrador obtiene un token de perfilado
+  (``POST /api/admin/perfilador/token``) y la petición lenta se repite con la
+  cabecera ``X-Perfilar: <token>`` o el parámetro ``?perfilar=<token>``. La
+  respuesta es la normal, con ``X-Perfil: <id>``. Se conservan los hilos que
+  ejecutaron el endpoint de la petición y el del bucle de eventos.
+- Una ventana de tiempo (``POST /api/admin/perfilador/ventana``): todo el
+  proceso durante N segundos.
+
+El resultado se guarda en ``PERFILADOR_DIRECTORIO`` (con varias réplicas, el
+volumen compartido ``fastapi-compartido-pvc``; ver infra/k8s) en formato speedscope
+(https://www.speedscope.app): un perfil por hilo y uno por categoría
+(aplicación, SQLAlchemy, Jinja2, Argon2, WeasyPrint y otros), más un resumen
+con el tiempo de cada categoría. Solo contiene nombres de funciones y
+archivos, no datos de pacientes.
+
+Con el perfilador deshabilitado el middleware no se instala: costo cero.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from jose import JWTError, jwt
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.core.config import settings
+from backend.core.security import ALGORITHM, SECRET_KEY
+
+ALCANCE = "perfilador"
+CABECERA = "x-perfilar"
+PARAMETRO = "perfilar"
+
+APLICACION = "aplicacion"
+OTROS = "otros"
+# Paquetes de cada categoría; gana el marco más interno que pertenezca a alguna
+CATEGORIAS = (
+    ("sqlalchemy", ("sqlalchemy", "psycopg2")),
+    ("jinja2", ("jinja2",)),
+    ("argon2", ("argon2", "passlib")),
+    ("weasyprint", ("weasyprint", "pydyf", "tinycss2", "cssselect2", "fontTools", "pyphen")),
+)
+
+_DIR_APLICACION = str(Path(__file__).resolve().parent.parent) + os.sep
+_MARCAS_PETICION = tuple(f"{os.sep}{p}{os.sep}" for p in ("starlette", "fastapi"))
+# Esperas de hilos sin trabajo: pool de hilos, bucle de eventos, temporizadores
+_ESPERAS = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("selectors.py", "select"), ("thread.py", "_worker"),
+}
+
+# Un muestreo a la vez por proceso
+_en_curso = threading.Lock()
+
+
+class PerfiladorOcupado(Exception):
+    pass
+
+
+def _clasificar(archivo: str) -> Optional[str]:
+    for categoria, paquetes in CATEGORIAS:
+        if any(f"{os.sep}{p}{os.sep}" in archivo for p in paquetes):
+            return categoria
+    if archivo.startswith(_DIR_APLICACION):
+        return APLICACION
+    return None
+
+
+class Muestreador:
+    def __init__(self, intervalo_segundos: float, max_segundos: float):
+        self.intervalo_segundos = intervalo_segundos
+        self.max_segundos = max_segundos
+        self.marcos: List[dict] = []
+        # código -> (índice en marcos, categoría, marca de petición, espera)
+        self._codigos: Dict[object, tuple] = {}
+        # hilo -> [(pila raíz→hoja, peso ms, categoría)]
+        self.muestras: Dict[int, list] = defaultdict(list)
+        self.nombres_hilos: Dict[int, str] = {}
+        self.iniciado_en: Optional[datetime] = None
+        self.duracion_ms = 0.0
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._ciclo, name="perfilador", daemon=True)
+
+    def iniciar(self) -> None:
+        self.iniciado_en = datetime.now(timezone.utc)
+        self._inicio = time.perf_counter()
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        self._hilo.join()
+        self.duracion_ms = (time.perf_counter() - self._inicio) * 1000
+        self.nombres_hilos = {h.ident: h.name for h in threading.enumerate() if h.ident in self.muestras}
+
+    def _ciclo(self) -> None:
+        propio = threading.get_ident()
+        anterior = time.perf_counter()
+        limite = anterior + self.max_segundos
+        while not self._detener.wait(self.intervalo_segundos):
+            ahora = time.perf_counter()
+            peso = (ahora - anterior) * 1000
+            anterior = ahora
+            for ident, marco in sys._current_frames().items():
+                if ident != propio:
+                    self._registrar(ident, marco, peso)
+            if ahora >= limite:
+                break
+
+    def _codigo(self, codigo) -> tuple:
+        info = self._codigos.get(codigo)
+        if info is None:
+            archivo = codigo.co_filename
+            self.marcos.append({
+                "name": getattr(codigo, "co_qualname", codigo.co_name),
+                "file": archivo,
+                "line": codigo.co_firstlineno,
+            })
+            info = (
+                len(self.marcos) - 1,
+                _clasificar(archivo),
+                archivo.startswith(_DIR_APLICACION) or any(m in archivo for m in _MARCAS_PETICION),
+                (os.path.basename(archivo), codigo.co_name) in _ESPERAS,
+            )
+            self._codigos[codigo] = info
+        return info
+
+    def _registrar(self, ident: int, marco, peso: float) -> None:
+        infos = []
+        while marco is not None:
+            infos.append(self._codigo(marco.f_code))
+            marco = marco.f_back
+        if infos[0][3] and not any(info[2] for info in infos):
+            return  # Hilo inactivo (pool sin trabajo, bucle esperando eventos)
+        categoria = next((info[1] for info in infos if info[1]), OTROS)
+        pila = tuple(info[0] for info in reversed(infos))
+        self.muestras[ident].append((pila, peso, categoria))
+
+    def hilos_con(self, codigo) -> Set[int]:
+        """Hilos que ejecutaron ``codigo`` en alguna muestra."""
+        info = self._codigos.get(codigo)
+        if info is None:
+            return set()
+        return {ident for ident, muestras in self.muestras.items() if any(info[0] in m[0] for m in muestras)}
+
+    def _seleccion(self, hilos: Optional[Set[int]]) -> Dict[int, list]:
+        return {i: m for i, m in self.muestras.items() if hilos is None or i in hilos}
+
+    def resumen(self, hilos: Optional[Set[int]] = None) -> dict:
+        categorias: Dict[str, float] = defaultdict(float)
+        muestras = 0
+        for lista in self._seleccion(hilos).values():
+            muestras += len(lista)
+            for _, peso, categoria in lista:
+                categorias[categoria] += peso
+        return {
+            "duracion_ms": round(self.duracion_ms, 1),
+            "muestras": muestras,
+            # Tiempo de hilo: con varios hilos activos puede superar la duración
+            "categorias_ms": {c: round(v, 1) for c, v in sorted(categorias.items(), key=lambda x: -x[1])},
+        }
+
+    def speedscope(self, nombre: str, hilos: Optional[Set[int]] = None) -> dict:
+        seleccion = self._seleccion(hilos)
+
+        def perfil(titulo: str, muestras: list) -> dict:
+            total = sum(m[1] for m in muestras)
+            return {
+                "type": "sampled",
+                "name": titulo,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": [list(m[0]) for m in muestras],
+                "weights": [round(m[1], 3) for m in muestras],
+            }
+
+        perfiles = [
+            perfil(f"Hilo {self.nombres_hilos.get(ident, ident)}", muestras)
+            for ident, muestras in sorted(seleccion.items(), key=lambda x: -len(x[1]))
+        ]
+        por_categoria = defaultdict(list)
+        for muestras in seleccion.values():
+            for muestra in muestras:
+                por_categoria[muestra[2]].append(muestra)
+        perfiles += [perfil(f"Categoría {c}", m) for c, m in sorted(por_categoria.items())]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nombre,
+            "exporter": "hce-perfilador",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.marcos},
+            "profiles": perfiles,
+        }
+
+
+def nuevo_muestreador() -> Muestreador:
+    return Muestreador(settings.PERFILADOR_INTERVALO_MS / 1000, settings.PERFILADOR_MAX_SEGUNDOS)
+
+
+# ============================================
+# ALMACENAMIENTO DE PERFILES
+# ============================================
+
+def directorio() -> Path:
+    return Path(settings.PERFILADOR_DIRECTORIO)
+
+
+def depurar() -> int:
+    """Elimina los perfiles más antiguos que ``PERFILADOR_RETENCION_HORAS``."""
+    limite = time.time() - settings.PERFILADOR_RETENCION_HORAS * 3600
+    borrados = 0
+    for archivo in directorio().glob("*.json"):
+        if archivo.stat().st_mtime < limite:
+            archivo.unlink(missing_ok=True)
+            borrados += 1
+    return borrados
+
+
+def guardar(muestreador: Muestreador, perfil_id: str, nombre: str, hilos: Optional[Set[int]] = None) -> dict:
+    """Escribe el archivo speedscope y su resumen. Devuelve el resumen."""
+    carpeta = directorio()
+    carpeta.mkdir(parents=True, exist_ok=True)
+    depurar()
+    resumen = {
+        "perfil_id": perfil_id,
+        "nombre": nombre,
+        "iniciado_en": muestreador.iniciado_en.isoformat(),
+        **muestreador.resumen(hilos),
+    }
+    _escribir(carpeta / f"{perfil_id}.speedscope.json", json.dumps(muestreador.speedscope(nombre, hilos), separators=(",", ":")))
+    # El resumen va al final: listar() no muestra un perfil cuyo archivo aún no está completo
+    _escribir(carpeta / f"{perfil_id}.resumen.json", json.dumps(resumen, ensure_ascii=False))
+    return resumen
+
+
+def _escribir(archivo: Path, contenido: str) -> None:
+    # Otras réplicas leen el mismo directorio: se renombra un archivo ya completo
+    temporal = archivo.with_name(f".{archivo.name}.{os.getpid()}.tmp")
+    temporal.write_text(contenido, encoding="utf-8")
+    os.replace(temporal, archivo)
+
+
+def listar() -> List[dict]:
+    """Resúmenes de los perfiles guardados, del más reciente al más antiguo."""
+    resumenes = []
+    for archivo in directorio().glob("*.resumen.json"):
+        try:
+            resumenes.append(json.loads(archivo.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return sorted(resumenes, key=lambda r: r["iniciado_en"], reverse=True)
+
+
+def ruta(perfil_id: str) -> Optional[Path]:
+    """Archivo speedscope del perfil, o None (el id se valida: nada fuera del directorio)."""
+    try:
+        perfil_id = uuid.UUID(perfil_id).hex
+    except ValueError:
+        return None
+    archivo = directorio() / f"{perfil_id}.speedscope.json"
+    return archivo if archivo.is_file() else None
+
+
+async def perfilar_ventana(segundos: float) -> dict:
+    """Muestrea todo el proceso durante ``segundos`` y guarda el perfil."""
+    if not _en_curso.acquire(blocking=False):
+        raise PerfiladorOcupado()
+    try:
+        muestreador = nuevo_muestreador()
+        muestreador.iniciar()
+        try:
+            await asyncio.sleep(min(segundos, settings.PERFILADOR_MAX_SEGUNDOS))
+        finally:
+            await asyncio.to_thread(muestreador.detener)
+        nombre = f"Ventana de {segundos:g} s (pid {os.getpid()})"
+        return await asyncio.to_thread(guardar, muestreador, uuid.uuid4().hex, nombre)
+    finally:
+        _en_curso.release()
+
+
+# ============================================
+# TOKENS DE PERFILADO
+# ============================================
+
+# Clave propia, derivada de SECRET_KEY: un token de perfilado (que viaja en URLs
+# y termina en logs) no sirve como token de sesión, y viceversa. Tampoco lleva
+# "sub", y get_current_user rechaza cualquier token con "alcance".
+_CLAVE = hashlib.sha256(f"{ALCANCE}:{SECRET_KEY}".encode()).hexdigest()
+
+
+def crear_token(minutos: int) -> str:
+    expira = datetime.utcnow() + timedelta(minutes=minutos)
+    return jwt.encode({"alcance": ALCANCE, "exp": expira, "jti": uuid.uuid4().hex}, _CLAVE, algorithm=ALGORITHM)
+
+
+def _token_valido(token: str) -> bool:
+    try:
+        return jwt.decode(token, _CLAVE, algorithms=[ALGORITHM]).get("alcance") == ALCANCE
+    except JWTError:
+        return False
+
+
+# ============================================
+# MIDDLEWARE (UNA PETICIÓN)
+# ============================================
+
+class PerfiladorMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = Headers(scope=scope).get(CABECERA)
+        if token is None and PARAMETRO.encode() in scope.get("query_string", b""):
+            token = QueryParams(scope["query_string"]).get(PARAMETRO)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not _token_valido(token):
+            await self.app(scope, receive, self._con_cabecera(send, b"token-invalido"))
+            return
+        if not _en_curso.acquire(blocking=False):
+            await self.app(scope, receive, self._con_cabecera(send, b"ocupado"))
+            return
+        try:
+            perfil_id = uuid.uuid4().hex
+            hilo_bucle = threading.get_ident()
+            muestreador = nuevo_muestreador()
+            muestreador.iniciar()
+            try:
+                await self.app(scope, receive, self._con_cabecera(send, perfil_id.encode()))
+            finally:
+                await asyncio.to_thread(muestreador.detener)
+            # El router deja en el scope el endpoint que atendió la petición
+            codigo = getattr(scope.get("endpoint"), "__code__", None)
+            hilos = ({hilo_bucle} | muestreador.hilos_con(codigo)) if codigo is not None else None
+            await asyncio.to_thread(guardar, muestreador, perfil_id, f"{scope['method']} {scope['path']}", hilos)
+        finally:
+            _en_curso.release()
+
+    @staticmethod
+    def _con_cabecera(send: Send, valor: bytes) -> Send:
+        async def enviar(mensaje: Message) -> None:
+            if mensaje["type"] == "http.response.start":
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [(b"x-perfil", valor)]
+            await send(mensaje)
+        return enviar
@@ -11,9 +11,10 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi.security.oauth2 import OAuth2
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 
-from backend.db import models
+from backend.db import models, usuarios
+from backend.core import trazas
 from backend.core.config import settings
 
 # ============================================
@@ -64,12 +65,14 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 def get_password_hash(password: str) -> str:
     """Genera el hash de una contraseña usando bcrypt."""
-    return pwd_context.hash(password)
+    with trazas.span("auth.hash_contrasena"):
+        return pwd_context.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si una contraseña coincide con su hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    with trazas.span("auth.verificar_contrasena"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 # ============================================
@@ -119,9 +122,7 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[mod
     Returns:
         Usuario si las credenciales son válidas, None en caso contrario
     """
-    user = db.query(models.Usuario).filter(
-        models.Usuario.correo_electronico == username
-    ).first()
+    user = usuarios.buscar_por_correo(db, username)
     
     if not user:
         return None
@@ -134,8 +135,10 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[mod
 
 def get_db_for_security():
     """Proporciona sesión de BD para funciones de seguridad."""
-    from backend.db.session import SessionLocal
-    db = SessionLocal()
+    from backend.core.disponibilidad import circuito
+    from backend.db.session import SessionLocal, limitar_tiempo
+    circuito.permitir()
+    db = limitar_tiempo(SessionLocal(), settings.BD_TIMEOUT_INTERACTIVO_MS)
     try:
         yield db
     finally:
@@ -165,20 +168,19 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        
-        if username is None:
+    with trazas.span("auth.get_current_user"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            
+            # Los tokens con alcance (p. ej. perfilado) no son tokens de sesión
+            if username is None or "alcance" in payload:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(models.Usuario).options(
-        joinedload(models.Usuario.atenciones)
-    ).filter(
-        models.Usuario.correo_electronico == username
-    ).first()
+        
+        # Sin las atenciones: cada petición autenticada pasa por aquí y casi ninguna las usa
+        user = usuarios.buscar_por_correo(db, username)
     
     if user is None:
         raise credentials_exception
@@ -0,0 +1,92 @@
+"""
+Lectura tipada de ``Atencion.signos_vitales``.
+
+El formulario del médico envía los signos como texto libre (``"130/85"``,
+``"36,5"``, ``"98%"``) y algunos registros antiguos guardaron el objeto como
+cadena JSON. Aquí se normalizan a números con unidades fijas para la serie
+de tiempo ``hcd.signo_vital``; los valores fuera de rango fisiológico se
+descartan en lugar de contaminar las tendencias.
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+# Variable de la serie -> (mínimo, máximo) aceptados
+RANGOS = {
+    "ta_sistolica": (40, 300),      # mmHg
+    "ta_diastolica": (20, 200),     # mmHg
+    "fc": (20, 300),                # lpm
+    "fr": (4, 80),                  # rpm
+    "temperatura": (25.0, 45.0),    # °C
+    "saturacion": (30, 100),        # %
+    "peso": (0.3, 400.0),           # kg
+    "talla": (0.2, 2.6),            # m
+}
+
+VARIABLES = tuple(RANGOS)
+
+_ENTEROS = {"ta_sistolica", "ta_diastolica", "fc", "fr", "saturacion"}
+
+# Clave en el JSON de la atención -> variable de la serie (la TA se trata aparte)
+_CLAVES = {"fc": "fc", "fr": "fr", "temp": "temperatura", "sat": "saturacion", "peso": "peso", "talla": "talla"}
+
+_NUMERO = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def como_dict(valor: Any) -> dict:
+    """``signos_vitales`` como diccionario, también si quedó guardado como cadena JSON."""
+    if isinstance(valor, dict):
+        return valor
+    if isinstance(valor, str) and valor.strip():
+        try:
+            datos = json.loads(valor)
+        except ValueError:
+            return {}
+        return datos if isinstance(datos, dict) else {}
+    return {}
+
+
+def _numero(valor: Any) -> Optional[float]:
+    if isinstance(valor, bool) or valor is None:
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    encontrado = _NUMERO.search(str(valor))
+    return float(encontrado.group().replace(",", ".")) if encontrado else None
+
+
+def _en_rango(variable: str, valor: Optional[float]):
+    if valor is None:
+        return None
+    minimo, maximo = RANGOS[variable]
+    if not minimo <= valor <= maximo:
+        return None
+    return int(round(valor)) if variable in _ENTEROS else round(valor, 2)
+
+
+def extraer(signos: Any) -> Optional[Dict[str, Any]]:
+    """
+    Variables tipadas de un registro de signos vitales, o None si no hay
+    ninguna utilizable.
+    """
+    datos = como_dict(signos)
+    resultado: Dict[str, Any] = {}
+
+    partes = _NUMERO.findall(str(datos.get("ta") or ""))
+    if len(partes) == 2:
+        sistolica = _en_rango("ta_sistolica", float(partes[0].replace(",", ".")))
+        diastolica = _en_rango("ta_diastolica", float(partes[1].replace(",", ".")))
+        if sistolica is not None and diastolica is not None and sistolica > diastolica:
+            resultado["ta_sistolica"] = sistolica
+            resultado["ta_diastolica"] = diastolica
+
+    for clave, variable in _CLAVES.items():
+        valor = _numero(datos.get(clave))
+        if variable == "talla" and valor is not None and valor > 3:
+            valor = valor / 100  # registrada en centímetros
+        valor = _en_rango(variable, valor)
+        if valor is not None:
+            resultado[variable] = valor
+
+    return resultado or None
@@ -0,0 +1,183 @@
+"""
+Trazas distribuidas con OpenTelemetry (``TRAZAS_EXPORTADOR``).
+
+Cada petición abre un span de servidor que continúa el contexto W3C
+(``traceparent``/``tracestate``) del cliente, si llega. Dentro quedan como
+hijos:
+
+- cada sentencia SQL (eventos del motor; el texto va sin parámetros),
+- la resolución de ``get_current_user`` y el hash/verificación de contraseñas,
+- el renderizado de cada plantilla Jinja (``templates.TemplateResponse``),
+- ``write_pdf`` de WeasyPrint.
+
+El contexto viaja en contextvars, así que los endpoints síncronos (pool de
+hilos) cuelgan del span de su petición. Exportadores:
+
+- ``otlp``: OTLP/HTTP hacia ``TRAZAS_OTLP_ENDPOINT`` (Jaeger, Tempo, un collector).
+- ``archivo``: una línea JSON por span en ``TRAZAS_ARCHIVO``, escrita al
+  terminar cada span (pruebas y depuración local).
+- ``ninguno``: sin SDK ni middleware; las llamadas de la API son no-op.
+
+El proveedor se configura en el arranque de cada worker (después del fork de
+Gunicorn), porque el procesador por lotes usa un hilo propio.
+"""
+
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.core.config import settings
+
+tracer = trace.get_tracer("hce.middleware")
+
+_proveedor = None
+
+
+def habilitadas() -> bool:
+    return settings.TRAZAS_EXPORTADOR != "ninguno"
+
+
+def span(nombre: str, **atributos):
+    """Span hijo del actual, como context manager."""
+    return tracer.start_as_current_span(nombre, attributes=atributos or None)
+
+
+def _crear_exportador():
+    tipo = settings.TRAZAS_EXPORTADOR
+    if tipo == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.TRAZAS_OTLP_ENDPOINT)
+    if tipo == "archivo":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        salida = open(settings.TRAZAS_ARCHIVO, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=salida, formatter=lambda s: s.to_json(indent=None) + "\n")
+    raise ValueError(f"TRAZAS_EXPORTADOR desconocido: {tipo!r} (otlp, archivo o ninguno)")
+
+
+def configurar(engine) -> bool:
+    """Instala el proveedor del SDK y los eventos del motor. Devuelve si quedó activo."""
+    global _proveedor
+    if not habilitadas() or _proveedor is not None:
+        return _proveedor is not None
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
+        exportador = _crear_exportador()
+    except ImportError as e:
+        print(f"[ADVERTENCIA] Trazas deshabilitadas, falta el SDK de OpenTelemetry: {e}")
+        return False
+
+    proveedor = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRAZAS_SERVICIO}),
+        # Respeta la decisión de muestreo del cliente; sin padre, muestrea la fracción configurada
+        sampler=ParentBasedTraceIdRatio(settings.TRAZAS_MUESTREO),
+    )
+    # En archivo cada span se escribe al terminar, para poder leerlo en seguida
+    procesador = SimpleSpanProcessor if settings.TRAZAS_EXPORTADOR == "archivo" else BatchSpanProcessor
+    proveedor.add_span_processor(procesador(exportador))
+    trace.set_tracer_provider(proveedor)
+    _instrumentar_motor(engine)
+    _proveedor = proveedor
+    return True
+
+
+def cerrar() -> None:
+    """Envía los spans pendientes (apagado del worker)."""
+    if _proveedor is not None:
+        _proveedor.shutdown()
+
+
+# ============================================
+# SENTENCIAS SQL
+# ============================================
+
+def _instrumentar_motor(engine) -> None:
+    base = engine.url.database or ""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _inicio(conn, cursor, statement, parameters, context, executemany):
+        operacion = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        context._traza_span = tracer.start_span(
+            f"{operacion} {base}".strip(),
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": engine.dialect.name,
+                "db.name": base,
+                "db.operation": operacion,
+                "db.statement": statement,
+            },
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _fin(conn, cursor, statement, parameters, context, executemany):
+        span_sql = getattr(context, "_traza_span", None)
+        if span_sql is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span_sql.set_attribute("db.rowcount", cursor.rowcount)
+            span_sql.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto):
+        span_sql = getattr(contexto.execution_context, "_traza_span", None)
+        if span_sql is not None:
+            span_sql.record_exception(contexto.original_exception)
+            span_sql.set_status(Status(StatusCode.ERROR, type(contexto.original_exception).__name__))
+            span_sql.end()
+
+
+# ============================================
+# PLANTILLAS JINJA
+# ============================================
+
+def instrumentar_plantillas(plantillas) -> None:
+    """Envuelve ``plantillas.TemplateResponse`` (renderiza al construirse) en un span."""
+    original = plantillas.TemplateResponse
+
+    def TemplateResponse(*args, **kwargs):
+        nombre = next((a for a in args if isinstance(a, str)), kwargs.get("name"))
+        with span("jinja.render", **{"template.name": str(nombre)}):
+            return original(*args, **kwargs)
+
+    plantillas.TemplateResponse = TemplateResponse
+
+
+# ============================================
+# MIDDLEWARE (SPAN DE SERVIDOR)
+# ============================================
+
+class TrazasMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cabeceras = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        contexto = propagate.extract(cabeceras)
+        metodo = scope["method"]
+
+        with tracer.start_as_current_span(
+            f"{metodo} {scope['path']}",
+            context=contexto,
+            kind=SpanKind.SERVER,
+            attributes={"http.method": metodo, "http.target": scope["path"]},
+        ) as span_peticion:
+            async def enviar(mensaje: Message) -> None:
+                if mensaje["type"] == "http.response.start":
+                    span_peticion.set_attribute("http.status_code", mensaje["status"])
+                    if mensaje["status"] >= 500:
+                        span_peticion.set_status(Status(StatusCode.ERROR))
+                await send(mensaje)
+
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                # Con la ruta ya resuelta, el nombre agrupa las peticiones del mismo endpoint
+                ruta = getattr(scope.get("route"), "path", None)
+                if ruta:
+                    span_peticion.update_name(f"{metodo} {ruta}")
+                    span_peticion.set_attribute("http.route", ruta)
@@ -0,0 +1,126 @@
+"""
+Administración de medicamentos como eventos (``hcd.administracion_medicamento``).
+
+Cada dosis es una fila nueva: registrar una administración no toca la fila de
+``hcd.tecnologia_salud`` (su ``registro_administracion`` y su contador
+``unidades_aplicadas`` quedan como históricos), así que varias enfermeras
+pueden registrar dosis del mismo paciente sin reescribir el JSONB ni esperar
+el bloqueo de la fila. El total aplicado se deriva sumando los eventos.
+
+La tabla está co-localizada con ``hcd.atencion``: un lote de dosis de un
+paciente es un único INSERT de varias filas en su shard, y los totales son un
+JOIN de router con ``tecnologia_salud``. El cliente puede enviar su propio
+``administracion_id``; reenviar un lote tras un error de red no duplica dosis.
+"""
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.db import models
+
+Administracion = models.AdministracionMedicamento
+Tecnologia = models.TecnologiaSalud
+
+_COLUMNAS = (
+    "administracion_id", "documento_id", "tecnologia_id", "administrado_en", "unidades",
+    "dosis", "via_administracion", "observaciones", "id_personal_salud", "responsable_registro",
+)
+
+
+def tecnologias_faltantes(db: Session, documento_id: int, tecnologia_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+    """Medicamentos del lote que no pertenecen al paciente."""
+    pedidas = set(tecnologia_ids)
+    existentes = set(db.scalars(
+        select(Tecnologia.tecnologia_id).where(
+            Tecnologia.documento_id == documento_id,
+            Tecnologia.tecnologia_id.in_(pedidas),
+        )
+    ))
+    return pedidas - existentes
+
+
+def insertar_lote(db: Session, filas: List[dict]) -> Set[uuid.UUID]:
+    """
+    Inserta las dosis en un solo INSERT, sin confirmar, ignorando los
+    ``administracion_id`` ya registrados. Devuelve los ids insertados.
+    """
+    if not filas:
+        return set()
+    # Un INSERT de varias filas necesita las mismas columnas en todas
+    filas = [{**dict.fromkeys(_COLUMNAS), **fila} for fila in filas]
+    for fila in filas:
+        fila["administracion_id"] = fila["administracion_id"] or uuid.uuid4()
+    sentencia = insert(Administracion).values(filas).on_conflict_do_nothing().returning(
+        Administracion.administracion_id
+    )
+    return set(db.scalars(sentencia))
+
+
+def totales(
+    db: Session,
+    documento_id: int,
+    tecnologia_ids: Optional[Iterable[uuid.UUID]] = None,
+) -> Dict[uuid.UUID, Dict[str, Any]]:
+    """
+    Unidades aplicadas por medicamento: el contador histórico de
+    ``tecnologia_salud`` más la suma de las administraciones registradas.
+    """
+    eventos = (
+        select(
+            Administracion.tecnologia_id,
+            func.sum(Administracion.unidades).label("unidades"),
+            func.count().label("administraciones"),
+            func.max(Administracion.administrado_en).label("ultima_administracion"),
+        )
+        .where(Administracion.documento_id == documento_id)
+        .group_by(Administracion.tecnologia_id)
+        .subquery()
+    )
+    consulta = (
+        select(
+            Tecnologia,
+            eventos.c.unidades,
+            eventos.c.administraciones,
+            eventos.c.ultima_administracion,
+        )
+        .outerjoin(eventos, eventos.c.tecnologia_id == Tecnologia.tecnologia_id)
+        .where(Tecnologia.documento_id == documento_id)
+        .order_by(Tecnologia.created_at)
+    )
+    if tecnologia_ids is not None:
+        consulta = consulta.where(Tecnologia.tecnologia_id.in_(set(tecnologia_ids)))
+
+    resultado = {}
+    for tecnologia, unidades, administraciones, ultima in db.execute(consulta):
+        resultado[tecnologia.tecnologia_id] = {
+            "tecnologia": tecnologia,
+            "unidades_aplicadas": (tecnologia.unidades_aplicadas or 0) + int(unidades or 0),
+            "administraciones": administraciones or 0,
+            "ultima_administracion": ultima,
+        }
+    return resultado
+
+
+def listar(
+    db: Session,
+    documento_id: int,
+    tecnologia_id: Optional[uuid.UUID] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    limite: int = 200,
+) -> List[models.AdministracionMedicamento]:
+    """Administraciones del paciente, de la más reciente a la más antigua."""
+    consulta = select(Administracion).where(Administracion.documento_id == documento_id)
+    if tecnologia_id is not None:
+        consulta = consulta.where(Administracion.tecnologia_id == tecnologia_id)
+    if desde is not None:
+        consulta = consulta.where(Administracion.administrado_en >= desde)
+    if hasta is not None:
+        consulta = consulta.where(Administracion.administrado_en < hasta)
+    consulta = consulta.order_by(Administracion.administrado_en.desc(), Administracion.administracion_id).limit(limite)
+    return list(db.scalars(consulta))
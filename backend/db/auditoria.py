@@ -0,0 +1,84 @@
+"""
+Registro de auditoría de accesos a la historia clínica (Ley 1581 de 2012).
+
+La escritura es por lotes con ``COPY``: Citus reparte las filas entre los
+shards de ``hcd.auditoria_acceso`` en un único viaje desde el coordinador, en
+lugar de un INSERT (y una transacción) por cada consulta de una historia. Los
+eventos llegan desde el buffer en memoria de ``backend.core.auditoria``.
+"""
+
+import csv
+import io
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from backend.db import models
+from backend.db.session import engine
+
+CONSULTA_HISTORIA = "consulta_historia"
+VISTA_PACIENTE = "vista_paciente"
+EXPORTACION_PDF = "exportacion_pdf"
+CONSULTA_SIGNOS_VITALES = "consulta_signos_vitales"
+CONSULTA_MEDICAMENTOS = "consulta_medicamentos"
+SINCRONIZACION = "sincronizacion"
+
+COLUMNAS = (
+    "documento_id", "accedido_en", "accion", "usuario_documento_id", "usuario_correo",
+    "usuario_rol", "recurso", "ip", "agente_usuario",
+)
+
+_COPY = f"COPY hcd.auditoria_acceso ({', '.join(COLUMNAS)}) FROM STDIN WITH (FORMAT csv)"
+
+
+def escribir_lote(eventos: List[dict]) -> int:
+    """
+    Inserta los eventos con un solo ``COPY`` en su propia transacción.
+    Devuelve cuántos se escribieron.
+    """
+    if not eventos:
+        return 0
+    contenido = io.StringIO()
+    escritor = csv.writer(contenido)
+    for evento in eventos:
+        # En CSV un campo vacío sin comillas es NULL
+        escritor.writerow(["" if evento.get(c) is None else evento[c] for c in COLUMNAS])
+    contenido.seek(0)
+
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        cursor.copy_expert(_COPY, contenido)
+        cursor.close()
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+    return len(eventos)
+
+
+def consultar_accesos(
+    db: Session,
+    documento_id: Optional[int] = None,
+    usuario_documento_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    limite: int = 200,
+) -> List[models.AuditoriaAcceso]:
+    """
+    Accesos más recientes primero. Con ``documento_id`` la consulta va a un
+    único shard; solo por ``usuario_documento_id`` recorre todos los shards.
+    """
+    query = db.query(models.AuditoriaAcceso)
+    if documento_id is not None:
+        query = query.filter(models.AuditoriaAcceso.documento_id == documento_id)
+    if usuario_documento_id is not None:
+        query = query.filter(models.AuditoriaAcceso.usuario_documento_id == usuario_documento_id)
+    if desde is not None:
+        query = query.filter(models.AuditoriaAcceso.accedido_en >= desde)
+    if hasta is not None:
+        query = query.filter(models.AuditoriaAcceso.accedido_en < hasta)
+    return query.order_by(models.AuditoriaAcceso.accedido_en.desc()).limit(limite).all()
@@ -0,0 +1,101 @@
+"""
+Búsqueda de texto completo sobre la narrativa clínica de las atenciones.
+
+``hcd.atencion.busqueda_tsv`` es una columna generada con la configuración
+``hcd.es_clinico`` (español sin tildes) que combina, con distinto peso:
+
+- A: ``motivo_consulta``, ``impresion_diagnostica``
+- B: ``enfermedad_actual``, ``medicamentos_actuales``
+- C: ``conducta_plan_manejo``
+
+Se indexa con GIN por partición (ver ``hcd.asegurar_indices_particion``).
+"""
+
+from typing import Any, List, Optional
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+
+from backend.db import models, panel
+
+CONFIGURACION = "hcd.es_clinico"
+
+_OPCIONES_FRAGMENTO = (
+    "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=25, MinWords=8, "
+    "FragmentDelimiter=\" … \""
+)
+
+
+def _texto_escapado(*columnas):
+    """Concatena las columnas y escapa HTML antes de resaltar con <mark>."""
+    texto = func.concat_ws(" … ", *columnas)
+    for original, escapado in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")):
+        texto = func.replace(texto, original, escapado)
+    return texto
+
+
+def buscar_atenciones(
+    db: Session,
+    consulta: str,
+    usuario: Any,
+    documento_id: Optional[int] = None,
+    limite: int = 20,
+) -> List[dict]:
+    """
+    Atenciones que coinciden con ``consulta`` ordenadas por relevancia.
+
+    Con ``documento_id`` la consulta va a un único shard. Sin él, se limita a
+    los pacientes del panel del médico; Citus aplica el ORDER BY/LIMIT en
+    cada shard y combina los mejores resultados en el coordinador.
+    ``ts_headline`` es costoso, por lo que PostgreSQL lo evalúa después del
+    LIMIT y solo para las filas devueltas.
+    """
+    Atencion = models.Atencion
+    tsquery = func.websearch_to_tsquery(literal_column(f"'{CONFIGURACION}'"), consulta)
+    relevancia = func.ts_rank_cd(Atencion.busqueda_tsv, tsquery).label("relevancia")
+    fragmento = func.ts_headline(
+        literal_column(f"'{CONFIGURACION}'"),
+        _texto_escapado(
+            Atencion.motivo_consulta,
+            Atencion.impresion_diagnostica,
+            Atencion.enfermedad_actual,
+            Atencion.medicamentos_actuales,
+            Atencion.conducta_plan_manejo,
+        ),
+        tsquery,
+        _OPCIONES_FRAGMENTO,
+    ).label("fragmento")
+
+    q = db.query(
+        Atencion.documento_id,
+        Atencion.atencion_id,
+        Atencion.fecha_hora_atencion,
+        Atencion.tipo_atencion,
+        Atencion.motivo_consulta,
+        models.Usuario.primer_nombre,
+        models.Usuario.primer_apellido,
+        relevancia,
+        fragmento,
+    ).join(
+        models.Usuario, models.Usuario.documento_id == Atencion.documento_id
+    ).filter(Atencion.busqueda_tsv.op("@@")(tsquery))
+
+    if documento_id is not None:
+        q = q.filter(Atencion.documento_id == documento_id)
+    else:
+        q = q.filter(Atencion.documento_id.in_(panel.subconsulta_panel(db, usuario)))
+
+    filas = q.order_by(relevancia.desc(), Atencion.fecha_hora_atencion.desc()).limit(limite).all()
+    return [
+        {
+            "documento_id": f.documento_id,
+            "atencion_id": f.atencion_id,
+            "fecha_hora_atencion": f.fecha_hora_atencion,
+            "tipo_atencion": f.tipo_atencion,
+            "motivo_consulta": f.motivo_consulta,
+            "paciente_nombre": " ".join(p for p in (f.primer_nombre, f.primer_apellido) if p),
+            "relevancia": float(f.relevancia or 0),
+            "fragmento": f.fragmento,
+        }
+        for f in filas
+    ]
@@ -0,0 +1,190 @@
+"""
+Censo de atenciones abiertas para los tableros de servicio.
+
+Una atención está abierta mientras no tenga ``fecha_hora_cierre`` ni
+``estado_egreso``. Consultarlas directamente recorre todos los shards de
+``hcd.atencion``; en su lugar, ``hcd.censo_atencion_abierta`` (tabla de
+referencia, pocas filas) guarda una fila por atención abierta:
+
+- ``registrar_apertura`` la agrega en la misma transacción que crea la atención.
+- ``registrar_cierre`` la elimina en la misma transacción que la cierra.
+
+``conciliar`` compara el censo con las atenciones abiertas reales (índice
+parcial ``<partición>_abiertas`` en cada shard) y corrige las diferencias
+que dejan las escrituras hechas fuera de la API (borrados de pacientes,
+que con historia comprimida requieren antes ``mantenimiento_particiones.py
+--descomprimir-paciente``; cargas por SQL). Lo ejecutan el mantenimiento diario y
+``backend/scripts/reconstruir_censo.py``.
+
+Las dos lecturas de la comparación ven momentos distintos y la API sigue
+abriendo y cerrando atenciones mientras tanto. Por eso cada diferencia se
+vuelve a comprobar contra ``hcd.atencion`` antes de corregirla, y solo se
+eliminan filas del censo registradas antes de empezar la conciliación.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.db import models
+
+Censo = models.CensoAtencionAbierta
+
+_SQL_ABIERTAS = """
+    SELECT a.atencion_id, a.documento_id, a.fecha_hora_atencion, a.tipo_atencion, a.motivo_consulta,
+           a.profesional_responsable,
+           concat_ws(' ', u.primer_nombre, u.primer_apellido, u.segundo_apellido) AS paciente_nombre
+    FROM hcd.atencion a
+    JOIN hcd.usuario u ON u.documento_id = a.documento_id
+    WHERE a.fecha_hora_cierre IS NULL AND COALESCE(a.estado_egreso, '') = ''
+"""
+_ABIERTAS = text(_SQL_ABIERTAS)
+# Las mismas, limitadas a las atenciones indicadas (nueva lectura para confirmar)
+_SIGUEN_ABIERTAS = text(_SQL_ABIERTAS + " AND a.documento_id = ANY(:documentos) AND a.atencion_id = ANY(CAST(:ids AS uuid[]))")
+
+
+def nombre_paciente(paciente: models.Usuario) -> str:
+    partes = (paciente.primer_nombre, paciente.primer_apellido, paciente.segundo_apellido)
+    return " ".join(p for p in partes if p)
+
+
+def abierta(atencion: models.Atencion) -> bool:
+    return atencion.fecha_hora_cierre is None and not atencion.estado_egreso
+
+
+def registrar_apertura(db: Session, atencion: models.Atencion, paciente: models.Usuario) -> None:
+    """Agrega la atención al censo si está abierta (sin commit)."""
+    if not abierta(atencion):
+        return
+    db.add(Censo(
+        atencion_id=atencion.atencion_id,
+        documento_id=atencion.documento_id,
+        fecha_hora_atencion=atencion.fecha_hora_atencion,
+        tipo_atencion=atencion.tipo_atencion,
+        motivo_consulta=atencion.motivo_consulta,
+        profesional_responsable=atencion.profesional_responsable,
+        paciente_nombre=nombre_paciente(paciente),
+    ))
+
+
+def registrar_cierre(db: Session, atencion_id) -> None:
+    """Quita la atención del censo (sin commit)."""
+    db.query(Censo).filter(Censo.atencion_id == atencion_id).delete(synchronize_session=False)
+
+
+def listar(
+    db: Session,
+    tipo_atencion: Optional[str] = None,
+    profesional: Optional[Any] = None,
+    limite: int = 500,
+) -> Dict[str, Any]:
+    """
+    Atenciones abiertas, de la más antigua a la más reciente, con el total y
+    el conteo por tipo. Solo lee tablas de referencia.
+    """
+    filtros = []
+    if tipo_atencion:
+        filtros.append(Censo.tipo_atencion == tipo_atencion)
+    if profesional is not None:
+        filtros.append(Censo.profesional_responsable == profesional)
+
+    por_tipo = dict(
+        db.query(func.coalesce(Censo.tipo_atencion, "Sin dato"), func.count())
+        .filter(*filtros)
+        .group_by(func.coalesce(Censo.tipo_atencion, "Sin dato"))
+        .all()
+    )
+    filas = (
+        db.query(Censo, models.ProfesionalSalud.nombre_completo)
+        .outerjoin(
+            models.ProfesionalSalud,
+            models.ProfesionalSalud.id_personal_salud == Censo.profesional_responsable,
+        )
+        .filter(*filtros)
+        .order_by(Censo.fecha_hora_atencion)
+        .limit(limite)
+        .all()
+    )
+    atenciones = []
+    for fila, profesional_nombre in filas:
+        atenciones.append({
+            "atencion_id": fila.atencion_id,
+            "documento_id": fila.documento_id,
+            "paciente_nombre": fila.paciente_nombre,
+            "fecha_hora_atencion": fila.fecha_hora_atencion,
+            "tipo_atencion": fila.tipo_atencion,
+            "motivo_consulta": fila.motivo_consulta,
+            "profesional_responsable": fila.profesional_responsable,
+            "profesional_nombre": profesional_nombre,
+        })
+    return {"total": sum(por_tipo.values()), "por_tipo": por_tipo, "atenciones": atenciones}
+
+
+def _reloj(db: Session) -> datetime:
+    # clock_timestamp y no now(): now() es el inicio de la transacción
+    return db.execute(text("SELECT clock_timestamp()")).scalar()
+
+
+def diferencias(db: Session, inicio: Optional[datetime] = None) -> Tuple[List[dict], List[Any]]:
+    """
+    (atenciones abiertas que faltan en el censo, ids del censo que ya no están
+    abiertas), confirmadas con una segunda lectura de cada atención. Los ids
+    sobrantes se limitan a filas del censo registradas antes de ``inicio``.
+    """
+    if inicio is None:
+        inicio = _reloj(db)
+    abiertas = {fila["atencion_id"]: dict(fila) for fila in db.execute(_ABIERTAS).mappings()}
+    en_censo = {
+        fila.atencion_id: fila
+        for fila in db.query(Censo.atencion_id, Censo.documento_id, Censo.registrado_en)
+    }
+    candidatas = [fila for atencion_id, fila in abiertas.items() if atencion_id not in en_censo]
+    candidatas_sobrantes = [
+        fila for atencion_id, fila in en_censo.items()
+        if atencion_id not in abiertas and (fila.registrado_en is None or fila.registrado_en < inicio)
+    ]
+    if not candidatas and not candidatas_sobrantes:
+        return [], []
+
+    # Segunda lectura: una atención creada o cerrada por la API entre las dos
+    # lecturas anteriores aparece como diferencia sin serlo
+    documentos = {fila["documento_id"] for fila in candidatas} | {fila.documento_id for fila in candidatas_sobrantes}
+    ids = [str(fila["atencion_id"]) for fila in candidatas] + [str(fila.atencion_id) for fila in candidatas_sobrantes]
+    siguen_abiertas = {
+        fila["atencion_id"]: dict(fila)
+        for fila in db.execute(_SIGUEN_ABIERTAS, {"documentos": list(documentos), "ids": ids}).mappings()
+    }
+    faltantes = [siguen_abiertas[fila["atencion_id"]] for fila in candidatas if fila["atencion_id"] in siguen_abiertas]
+    sobrantes = [fila.atencion_id for fila in candidatas_sobrantes if fila.atencion_id not in siguen_abiertas]
+    return faltantes, sobrantes
+
+
+def conciliar(db: Session) -> Tuple[int, int]:
+    """Corrige el censo. Devuelve (agregadas, eliminadas)."""
+    inicio = _reloj(db)
+    faltantes, sobrantes = diferencias(db, inicio)
+    eliminadas = agregadas = 0
+    if sobrantes:
+        # Una atención abierta de nuevo (o creada) tras empezar no se toca
+        eliminadas = db.query(Censo).filter(
+            Censo.atencion_id.in_(sobrantes),
+            or_(Censo.registrado_en.is_(None), Censo.registrado_en < inicio),
+        ).delete(synchronize_session=False)
+    if faltantes:
+        # La API pudo registrarla entre la segunda lectura y esta escritura
+        agregadas = db.execute(insert(Censo).values(faltantes).on_conflict_do_nothing()).rowcount
+    db.commit()
+    return agregadas, eliminadas
+
+
+def reconstruir(db: Session) -> int:
+    """Vacía el censo y lo vuelve a llenar desde las atenciones. Devuelve las filas."""
+    db.execute(text("DELETE FROM hcd.censo_atencion_abierta"))
+    filas = [dict(fila) for fila in db.execute(_ABIERTAS).mappings()]
+    if filas:
+        db.execute(Censo.__table__.insert(), filas)
+    db.commit()
+    return len(filas)
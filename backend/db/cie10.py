@@ -0,0 +1,206 @@
+"""
+Consultas epidemiológicas sobre códigos CIE-10.
+
+Los códigos se normalizan en la base de datos (mayúsculas, sin punto) con las
+funciones ``hcd.cie10_codigo`` y ``hcd.cie10_jerarquia`` definidas en
+``infra/init.sql``. La jerarquía expande cada código a todos sus prefijos
+(``E11.9`` -> ``E11``, ``E119``), de modo que una búsqueda por categoría se
+resuelve con el índice GIN ``idx_atencion_cie10_jerarquia`` usando ``&&``.
+
+Las agregaciones se escriben para que Citus las ejecute en los workers:
+agrupar por ``documento_id`` (columna de distribución) se empuja completo a
+cada shard, y el conteo por código se calcula parcialmente en cada shard y
+se combina en el coordinador.
+"""
+
+import re
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Letra + dos dígitos, seguidos opcionalmente de subcategoría (J45, J45.9, J45.x)
+_PATRON_CIE10 = re.compile(r"^[A-Z][0-9]{2}[0-9A-Z]*$")
+
+NIVELES_CIE10 = {"categoria", "subcategoria"}
+
+
+def normalizar_codigo_cie10(codigo: str) -> str:
+    """
+    Normaliza un código CIE-10 a la forma almacenada en la jerarquía.
+
+    Acepta comodines de jerarquía como ``J45.x``, ``J45.*`` o ``J45%``,
+    que equivalen a buscar por la categoría ``J45``.
+
+    Raises:
+        ValueError: Si el código no tiene la forma letra + dos dígitos.
+    """
+    limpio = codigo.strip().upper()
+    limpio = re.sub(r"[.\-]?[X*%]+$", "", limpio)
+    limpio = re.sub(r"[^A-Z0-9]", "", limpio)
+    if not _PATRON_CIE10.match(limpio):
+        raise ValueError(f"Código CIE-10 inválido: '{codigo}'")
+    return limpio
+
+
+def formatear_codigo_cie10(codigo: str) -> str:
+    """Devuelve un código normalizado con el punto de subcategoría (E119 -> E11.9)."""
+    return codigo if len(codigo) <= 3 else f"{codigo[:3]}.{codigo[3:]}"
+
+
+def pacientes_por_codigos(
+    db: Session,
+    codigos: List[str],
+    desde: datetime,
+    hasta: datetime,
+    limite: int = 500,
+):
+    """
+    Pacientes con atenciones o diagnósticos que coinciden con los códigos
+    (o cualquiera de sus subcódigos) en el rango de fechas.
+
+    Todo el plan se agrupa por ``documento_id``, por lo que cada shard
+    devuelve sus pacientes ya agregados y el coordinador solo ordena.
+    """
+    normalizados = sorted({normalizar_codigo_cie10(c) for c in codigos})
+    consulta = text(
+        """
+        WITH coincidencias AS (
+            SELECT a.documento_id, a.atencion_id, a.fecha_hora_atencion,
+                   hcd.cie10_normalizar(a.codigos_cie10) AS codigos
+            FROM hcd.atencion a
+            WHERE hcd.cie10_jerarquia(a.codigos_cie10) && CAST(:codigos AS text[])
+              AND a.fecha_hora_atencion >= :desde
+              AND a.fecha_hora_atencion < :hasta
+            UNION ALL
+            SELECT d.documento_id, a.atencion_id, a.fecha_hora_atencion,
+                   ARRAY[hcd.cie10_codigo(d.codigo_cie10)] AS codigos
+            FROM hcd.diagnostico d
+            JOIN hcd.atencion a
+              ON a.documento_id = d.documento_id AND a.atencion_id = d.atencion_id
+            WHERE hcd.cie10_codigo(d.codigo_cie10) LIKE ANY (CAST(:prefijos AS text[]))
+              AND a.fecha_hora_atencion >= :desde
+              AND a.fecha_hora_atencion < :hasta
+        )
+        SELECT c.documento_id,
+               u.tipo_documento,
+               u.primer_nombre,
+               u.primer_apellido,
+               u.fecha_nacimiento,
+               u.sexo,
+               u.municipio_ciudad,
+               -- Una atención puede coincidir varias veces (código principal y
+               -- relacionado, diagnóstico, varios códigos pedidos) y unnest la repite
+               count(DISTINCT c.atencion_id) AS atenciones,
+               max(c.fecha_hora_atencion) AS ultima_atencion,
+               array_agg(DISTINCT cod) AS codigos
+        FROM coincidencias c
+        JOIN hcd.usuario u ON u.documento_id = c.documento_id
+        CROSS JOIN LATERAL unnest(c.codigos) AS cod
+        GROUP BY c.documento_id, u.tipo_documento, u.primer_nombre, u.primer_apellido,
+                 u.fecha_nacimiento, u.sexo, u.municipio_ciudad
+        ORDER BY ultima_atencion DESC
+        LIMIT :limite
+        """
+    )
+    filas = db.execute(
+        consulta,
+        {
+            "codigos": normalizados,
+            "prefijos": [f"{c}%" for c in normalizados],
+            "desde": desde,
+            "hasta": hasta,
+            "limite": limite,
+        },
+    ).mappings().all()
+
+    resultado = []
+    for fila in filas:
+        item = dict(fila)
+        # Solo se reportan los códigos del paciente que cayeron en la búsqueda
+        item["codigos"] = sorted(
+            formatear_codigo_cie10(c)
+            for c in (fila["codigos"] or [])
+            if any(c.startswith(n) for n in normalizados)
+        )
+        resultado.append(item)
+    return resultado
+
+
+def ranking_codigos(
+    db: Session,
+    desde: datetime,
+    hasta: datetime,
+    nivel: str = "subcategoria",
+    prefijo: str = None,
+    limite: int = 20,
+):
+    """
+    Códigos CIE-10 más frecuentes en el rango de fechas.
+
+    ``nivel="categoria"`` agrupa por los tres primeros caracteres (J45);
+    ``nivel="subcategoria"`` usa el código completo registrado (J45.9).
+    Cuenta los códigos de la atención y los de sus diagnósticos
+    (``hcd.diagnostico``), igual que ``pacientes_por_codigos``. El conteo de pacientes distintos es sobre la columna de distribución,
+    así que Citus lo suma por shard sin llevar filas al coordinador.
+    """
+    if nivel not in NIVELES_CIE10:
+        raise ValueError(f"Nivel inválido: '{nivel}'")
+
+    expresion = "left(cod, 3)" if nivel == "categoria" else "cod"
+    filtro_atencion = filtro_diagnostico = ""
+    parametros = {"desde": desde, "hasta": hasta, "limite": limite}
+    if prefijo:
+        filtro_atencion = (
+            "AND hcd.cie10_jerarquia(a.codigos_cie10) && CAST(:jerarquia AS text[]) "
+            "AND cod LIKE :patron"
+        )
+        filtro_diagnostico = "AND hcd.cie10_codigo(d.codigo_cie10) LIKE :patron"
+        normalizado = normalizar_codigo_cie10(prefijo)
+        parametros["jerarquia"] = [normalizado]
+        parametros["patron"] = f"{normalizado}%"
+
+    # Cada atención cuenta una vez por código aunque lo repita, lo tenga también
+    # como diagnóstico o tenga varios subcódigos de la misma categoría. La
+    # deduplicación agrupa por documento_id, así que se hace en cada shard.
+    consulta = text(
+        f"""
+        SELECT codigo,
+               count(*) AS atenciones,
+               count(DISTINCT documento_id) AS pacientes
+        FROM (
+            SELECT documento_id, atencion_id, {expresion} AS codigo
+            FROM (
+                SELECT a.documento_id, a.atencion_id, cod
+                FROM hcd.atencion a
+                CROSS JOIN LATERAL unnest(hcd.cie10_normalizar(a.codigos_cie10)) AS cod
+                WHERE a.fecha_hora_atencion >= :desde
+                  AND a.fecha_hora_atencion < :hasta
+                  {filtro_atencion}
+                UNION ALL
+                SELECT d.documento_id, a.atencion_id, hcd.cie10_codigo(d.codigo_cie10) AS cod
+                FROM hcd.diagnostico d
+                JOIN hcd.atencion a
+                  ON a.documento_id = d.documento_id AND a.atencion_id = d.atencion_id
+                WHERE hcd.cie10_codigo(d.codigo_cie10) IS NOT NULL
+                  AND a.fecha_hora_atencion >= :desde
+                  AND a.fecha_hora_atencion < :hasta
+                  {filtro_diagnostico}
+            ) codigos
+            GROUP BY documento_id, atencion_id, {expresion}
+        ) por_atencion
+        GROUP BY codigo
+        ORDER BY atenciones DESC, codigo
+        LIMIT :limite
+        """
+    )
+    filas = db.execute(consulta, parametros).mappings().all()
+    return [
+        {
+            "codigo": formatear_codigo_cie10(fila["codigo"]),
+            "atenciones": fila["atenciones"],
+            "pacientes": fila["pacientes"],
+        }
+        for fila in filas
+    ]
@@ -0,0 +1,182 @@
+"""
+Administración del clúster Citus: workers, rebalanceo de shards y tablas de
+referencia. Lo usa ``backend/scripts/citus_cluster.py``.
+
+Todas las funciones se ejecutan en el coordinador.
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.db.session import SessionLocal
+
+# Nombre DNS de cada pod del StatefulSet infra/k8s/citus-worker.yaml
+DNS_WORKER = "citus-worker-{indice}.citus-worker.default.svc.cluster.local"
+
+ESTRATEGIAS = ("by_disk_size", "by_shard_count")
+MODOS_TRANSFERENCIA = ("auto", "force_logical", "block_writes")
+
+# Una tabla representativa por grupo de co-localización del esquema hcd
+_GRUPOS_HCD = text(
+    """
+    SELECT DISTINCT ON (p.colocationid) p.colocationid, p.logicalrelid::regclass::text AS tabla
+    FROM pg_dist_partition p
+    JOIN pg_class c ON c.oid = p.logicalrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = 'hcd'
+    WHERE p.partmethod = 'h' AND NOT c.relispartition
+    ORDER BY p.colocationid, p.logicalrelid::regclass::text
+    """
+)
+
+_DISTRIBUCION = text(
+    """
+    SELECT n.nodename, n.nodeport, count(s.shardid) AS shards, coalesce(sum(s.shard_size), 0) AS bytes
+    FROM pg_dist_node n
+    LEFT JOIN citus_shards s
+           ON s.nodename = n.nodename AND s.nodeport = n.nodeport
+          AND s.citus_table_type = 'distributed' AND s.table_name::text LIKE 'hcd.%'
+    WHERE n.noderole = 'primary' AND n.isactive AND n.shouldhaveshards
+    GROUP BY n.nodename, n.nodeport
+    ORDER BY n.nodename, n.nodeport
+    """
+)
+
+_COPIAS_REFERENCIA = text(
+    """
+    SELECT n.nodename, n.nodeport,
+           EXISTS (
+               SELECT 1 FROM pg_dist_shard s
+               JOIN pg_dist_placement p ON p.shardid = s.shardid
+               WHERE s.logicalrelid = CAST(:tabla AS regclass) AND p.groupid = n.groupid
+           ) AS tiene_copia
+    FROM pg_dist_node n
+    WHERE n.noderole = 'primary' AND n.isactive
+    ORDER BY n.groupid
+    """
+)
+
+
+def nodos(db: Session) -> List[dict]:
+    filas = db.execute(text(
+        "SELECT nodeid, nodename, nodeport, groupid, isactive, noderole, shouldhaveshards "
+        "FROM pg_dist_node ORDER BY groupid, nodeid"
+    ))
+    return [dict(fila._mapping) for fila in filas]
+
+
+def agregar_worker(db: Session, host: str, puerto: int = 5432) -> bool:
+    """Registra el worker si no lo estaba. Devuelve si se agregó."""
+    existe = db.execute(
+        text("SELECT 1 FROM pg_dist_node WHERE nodename = :host AND nodeport = :puerto"),
+        {"host": host, "puerto": puerto},
+    ).first()
+    if existe:
+        return False
+    db.execute(text("SELECT citus_add_node(:host, :puerto)"), {"host": host, "puerto": puerto})
+    db.commit()
+    return True
+
+
+def grupos_hcd(db: Session) -> List[str]:
+    """Tabla representativa de cada grupo de co-localización del esquema hcd."""
+    return [fila.tabla for fila in db.execute(_GRUPOS_HCD)]
+
+
+def plan_rebalanceo(db: Session, tabla: str, estrategia: str) -> List[dict]:
+    filas = db.execute(
+        text("SELECT * FROM get_rebalance_table_shards_plan(CAST(:tabla AS regclass), rebalance_strategy => :estrategia)"),
+        {"tabla": tabla, "estrategia": estrategia},
+    )
+    return [dict(fila._mapping) for fila in filas]
+
+
+def rebalancear(
+    tabla: str,
+    estrategia: str,
+    modo_transferencia: str,
+    informar: Callable[[List[dict]], None],
+    intervalo_segundos: float = 5.0,
+) -> None:
+    """
+    Rebalancea el grupo de co-localización de ``tabla`` en línea.
+
+    ``rebalance_table_shards`` bloquea su conexión hasta terminar, así que se
+    ejecuta en un hilo con su propia sesión mientras esta consulta
+    ``get_rebalance_progress()`` y se lo pasa a ``informar``. Con
+    ``force_logical`` (o ``auto`` cuando las tablas tienen identidad de
+    réplica) las escrituras continúan durante el movimiento.
+    """
+    error: Dict[str, Exception] = {}
+
+    def mover():
+        db = SessionLocal()
+        try:
+            db.execute(
+                text(
+                    "SELECT rebalance_table_shards(CAST(:tabla AS regclass), "
+                    "rebalance_strategy => :estrategia, shard_transfer_mode => CAST(:modo AS citus.shard_transfer_mode))"
+                ),
+                {"tabla": tabla, "estrategia": estrategia, "modo": modo_transferencia},
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            error["e"] = e
+        finally:
+            db.close()
+
+    hilo = threading.Thread(target=mover, name="rebalanceo", daemon=True)
+    hilo.start()
+    monitor = SessionLocal()
+    try:
+        while hilo.is_alive():
+            hilo.join(intervalo_segundos)
+            progreso = [dict(f._mapping) for f in monitor.execute(text("SELECT * FROM get_rebalance_progress()"))]
+            monitor.commit()
+            if progreso:
+                informar(progreso)
+    finally:
+        monitor.close()
+    if "e" in error:
+        raise error["e"]
+
+
+def distribucion(db: Session) -> List[dict]:
+    """Shards y bytes de las tablas distribuidas de hcd por worker."""
+    return [dict(fila._mapping) for fila in db.execute(_DISTRIBUCION)]
+
+
+def desbalance(filas: List[dict], campo: str = "bytes") -> Optional[float]:
+    """Relación entre el worker más cargado y el promedio (1.0 = perfecto)."""
+    valores = [float(f[campo]) for f in filas]
+    if not valores or sum(valores) == 0:
+        return None
+    return max(valores) / (sum(valores) / len(valores))
+
+
+def tablas_referencia(db: Session) -> List[str]:
+    filas = db.execute(text(
+        "SELECT logicalrelid::regclass::text AS tabla FROM pg_dist_partition "
+        "WHERE partmethod = 'n' AND repmodel = 't' ORDER BY 1"
+    ))
+    return [fila.tabla for fila in filas]
+
+
+def nodos_sin_copia(db: Session, tabla: str) -> List[str]:
+    """Nodos activos sin copia de la tabla de referencia (incluye el coordinador)."""
+    return [
+        f"{fila.nodename}:{fila.nodeport}"
+        for fila in db.execute(_COPIAS_REFERENCIA, {"tabla": tabla})
+        if not fila.tiene_copia
+    ]
+
+
+def replicar_referencias(db: Session, modo_transferencia: str) -> None:
+    db.execute(
+        text("SELECT replicate_reference_tables(CAST(:modo AS citus.shard_transfer_mode))"),
+        {"modo": modo_transferencia},
+    )
+    db.commit()
@@ -0,0 +1,219 @@
+"""
+Trabajos de exportación masiva FHIR y lectura de datos por shard.
+
+Una consulta sin ``documento_id`` sobre una tabla distribuida la ejecuta el
+coordinador en todos los shards y le devuelve todas las filas a él. Para
+exportar en paralelo y con memoria constante, cada segmento de la exportación
+es un grupo de shards co-localizados (usuario, atencion, diagnostico,
+tecnologia_salud con el mismo rango de hash) que se lee directamente en el
+worker que lo aloja, con un cursor de servidor.
+
+Sin Citus (p. ej. un PostgreSQL de desarrollo) hay un único segmento: las
+tablas completas a través de la conexión normal.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from backend.core import fhir
+from backend.core.config import settings
+from backend.db import models
+from backend.db.session import engine
+
+EN_COLA = "en_cola"
+EN_CURSO = "en_curso"
+COMPLETADA = "completada"
+ERROR = "error"
+CANCELADA = "cancelada"
+
+# Tipo de recurso -> (tabla, columna de fecha para _since, consulta)
+CONSULTAS: Dict[str, Tuple[str, str, str]] = {
+    fhir.PATIENT: (
+        "usuario", "updated_at",
+        "SELECT documento_id, tipo_documento, primer_apellido, segundo_apellido, primer_nombre, "
+        "segundo_nombre, fecha_nacimiento, sexo, estado_civil, direccion_residencia, municipio_ciudad, "
+        "departamento, telefono, celular, correo_electronico, updated_at "
+        "FROM {tabla} WHERE coalesce(tipo_usuario, 'paciente') = 'paciente'",
+    ),
+    fhir.ENCOUNTER: (
+        "atencion", "updated_at",
+        "SELECT atencion_id, documento_id, fecha_hora_atencion, fecha_hora_cierre, tipo_atencion, "
+        "motivo_consulta, estado_egreso, profesional_responsable, updated_at "
+        "FROM {tabla} WHERE true",
+    ),
+    fhir.CONDITION: (
+        "diagnostico", "updated_at",
+        "SELECT diagnostico_id, documento_id, atencion_id, tipo_diagnostico, diagnostico_text, "
+        "codigo_cie10, gravedad, created_at FROM {tabla} WHERE true",
+    ),
+    fhir.MEDICATION_ADMINISTRATION: (
+        "tecnologia_salud", "updated_at",
+        "SELECT tecnologia_id, documento_id, atencion_id, descripcion_medicamento, dosis, "
+        "via_administracion, frecuencia, id_personal_salud, finalidad_tecnologia, created_at "
+        "FROM {tabla} WHERE true",
+    ),
+    fhir.PRACTITIONER: (
+        "profesional_salud", "created_at",
+        "SELECT id_personal_salud, nombre_completo, tipo_profesional, registro_profesional, contacto "
+        "FROM {tabla} WHERE true",
+    ),
+}
+
+_HAY_CITUS = text("SELECT to_regclass('pg_catalog.pg_dist_shard') IS NOT NULL")
+
+# Una ubicación activa por shard (la primera si hay réplicas)
+_SHARDS = text(
+    """
+    SELECT DISTINCT ON (s.shardid)
+           c.relname AS tabla, s.shardid, s.shardminvalue, n.nodename, n.nodeport
+    FROM pg_dist_shard s
+    JOIN pg_class c ON c.oid = s.logicalrelid
+    JOIN pg_namespace esquema ON esquema.oid = c.relnamespace AND esquema.nspname = 'hcd'
+    JOIN pg_dist_placement p ON p.shardid = s.shardid
+    JOIN pg_dist_node n ON n.groupid = p.groupid AND n.noderole = 'primary' AND n.isactive
+    WHERE c.relname = ANY(:tablas) AND s.shardminvalue IS NOT NULL
+    ORDER BY s.shardid, n.nodeid
+    """
+)
+
+
+@dataclass
+class Segmento:
+    """Tablas que se leen juntas en un nodo. ``host`` None es el coordinador."""
+    nombre: str
+    host: Optional[str] = None
+    puerto: Optional[int] = None
+    tablas: Dict[str, str] = field(default_factory=dict)
+
+
+def segmentos(db: Session) -> List[Segmento]:
+    """Segmentos de la exportación: uno por grupo de shards co-localizados, más el coordinador."""
+    todas = {tabla for tabla, _, _ in CONSULTAS.values()}
+    if not db.execute(_HAY_CITUS).scalar():
+        return [Segmento("coordinador", tablas={t: f"hcd.{t}" for t in todas})]
+
+    # Los shards co-localizados comparten rango de hash y nodo
+    por_rango: Dict[int, Segmento] = {}
+    for fila in db.execute(_SHARDS, {"tablas": sorted(todas)}):
+        segmento = por_rango.setdefault(
+            int(fila.shardminvalue), Segmento(nombre="", host=fila.nodename, puerto=fila.nodeport)
+        )
+        segmento.tablas[fila.tabla] = f"hcd.{fila.tabla}_{fila.shardid}"
+
+    resultado = [por_rango[rango] for rango in sorted(por_rango)]
+    for i, segmento in enumerate(resultado):
+        segmento.nombre = f"{i:03d}"
+
+    # Tablas de referencia o no distribuidas: se leen una vez en el coordinador
+    distribuidas = {t for s in resultado for t in s.tablas}
+    locales = {t: f"hcd.{t}" for t in todas - distribuidas}
+    if locales:
+        resultado.append(Segmento("coordinador", tablas=locales))
+    return resultado
+
+
+_motores: Dict[Tuple[str, int], Engine] = {}
+_candado_motores = threading.Lock()
+
+
+def _motor(segmento: Segmento) -> Engine:
+    if segmento.host is None:
+        return engine
+    clave = (segmento.host, segmento.puerto)
+    with _candado_motores:
+        if clave not in _motores:
+            url = URL.create(
+                "postgresql+psycopg2",
+                username=settings.DB_USER,
+                password=settings.DB_PASSWORD,
+                host=segmento.host,
+                port=segmento.puerto,
+                database=settings.DB_NAME,
+            )
+            # Conexiones de larga duración y poco frecuentes: sin pool
+            _motores[clave] = create_engine(url, poolclass=NullPool)
+        return _motores[clave]
+
+
+def leer(segmento: Segmento, tipo: str, desde: Optional[datetime], lote: int) -> Iterator[dict]:
+    """Filas del recurso en el segmento, de ``lote`` en ``lote`` desde un cursor de servidor."""
+    tabla, columna_fecha, consulta = CONSULTAS[tipo]
+    sql = consulta.format(tabla=segmento.tablas[tabla])
+    parametros = {}
+    if desde is not None:
+        sql += f" AND {columna_fecha} >= :desde"
+        parametros["desde"] = desde
+    with _motor(segmento).connect() as conexion:
+        resultado = conexion.execution_options(stream_results=True, yield_per=lote).execute(
+            text(sql), parametros
+        )
+        for fila in resultado.mappings():
+            yield fila
+
+
+def crear(db: Session, solicitante: str, tipos: List[str], desde: Optional[datetime], solicitud: str) -> models.ExportacionFHIR:
+    trabajo = models.ExportacionFHIR(
+        estado=EN_COLA, solicitante=solicitante, tipos=tipos, desde=desde, solicitud=solicitud,
+        latido_en=func.now(),
+    )
+    db.add(trabajo)
+    db.commit()
+    db.refresh(trabajo)
+    return trabajo
+
+
+def obtener(db: Session, exportacion_id) -> Optional[models.ExportacionFHIR]:
+    return db.query(models.ExportacionFHIR).filter(
+        models.ExportacionFHIR.exportacion_id == exportacion_id
+    ).first()
+
+
+def actualizar(db: Session, exportacion_id, **campos) -> None:
+    if campos.get("estado") in (COMPLETADA, ERROR, CANCELADA):
+        campos["finalizada_en"] = func.now()
+    db.query(models.ExportacionFHIR).filter(
+        models.ExportacionFHIR.exportacion_id == exportacion_id
+    ).update(campos, synchronize_session=False)
+    db.commit()
+
+
+def latir(db: Session, exportacion_ids: List[str]) -> None:
+    """Renueva el latido de los trabajos pendientes de este proceso."""
+    db.query(models.ExportacionFHIR).filter(
+        models.ExportacionFHIR.exportacion_id.in_(exportacion_ids),
+        models.ExportacionFHIR.estado.in_((EN_COLA, EN_CURSO)),
+    ).update({"latido_en": func.now()}, synchronize_session=False)
+    db.commit()
+
+
+def marcar_huerfanas(db: Session) -> int:
+    """
+    Pasa a error los trabajos pendientes sin latido reciente: el proceso que
+    los ejecutaba terminó (reinicio o eliminación del pod). Devuelve cuántos.
+    """
+    limite = func.now() - text(f"INTERVAL '{int(settings.EXPORTACION_FHIR_LATIDO_VENCIDO_SEGUNDOS)} seconds'")
+    marcadas = db.query(models.ExportacionFHIR).filter(
+        models.ExportacionFHIR.estado.in_((EN_COLA, EN_CURSO)),
+        func.coalesce(models.ExportacionFHIR.latido_en, models.ExportacionFHIR.created_at) < limite,
+    ).update(
+        {
+            "estado": ERROR,
+            "error": "El servidor que ejecutaba la exportación se detuvo; solicítela de nuevo.",
+            "finalizada_en": func.now(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return marcadas
+
+
+def vencidas(db: Session) -> List[models.ExportacionFHIR]:
+    limite = func.now() - text(f"INTERVAL '{int(settings.EXPORTACION_FHIR_RETENCION_HORAS)} hours'")
+    return db.query(models.ExportacionFHIR).filter(models.ExportacionFHIR.created_at < limite).all()
@@ -0,0 +1,80 @@
+"""
+Claves de idempotencia (cabecera ``Idempotency-Key``) para escrituras.
+
+Se guarda la huella de la petición y el documento creado. Un reintento con la
+misma clave y la misma huella devuelve el resultado original sin repetir la
+operación; con otra huella es un error del cliente. Las claves vencen tras
+``IDEMPOTENCIA_RETENCION_HORAS`` y el mantenimiento diario las depura.
+"""
+
+import hashlib
+import hmac
+import json
+from typing import Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db import models
+
+LONGITUD_MAXIMA_CLAVE = 120
+
+
+def calcular_huella(operacion: str, solicitante: str, datos: dict) -> str:
+    """
+    HMAC del contenido de la petición. Usa la clave secreta porque los datos
+    pueden incluir la contraseña en claro, que no debe quedar derivable.
+    """
+    contenido = json.dumps(
+        {"operacion": operacion, "solicitante": solicitante, "datos": datos},
+        sort_keys=True,
+        default=str,
+    )
+    return hmac.new(settings.SECRET_KEY.encode(), contenido.encode(), hashlib.sha256).hexdigest()
+
+
+def _vigencia():
+    return func.now() - text(f"INTERVAL '{int(settings.IDEMPOTENCIA_RETENCION_HORAS)} hours'")
+
+
+def buscar(db: Session, clave: str) -> Optional[models.Idempotencia]:
+    """Clave vigente (consulta a un único shard)."""
+    return db.query(models.Idempotencia).filter(
+        models.Idempotencia.clave == clave,
+        models.Idempotencia.created_at >= _vigencia(),
+    ).first()
+
+
+def registrar(db: Session, clave: str, operacion: str, huella: str, documento_id: int) -> bool:
+    """
+    Registra la clave en la transacción del llamador.
+
+    Returns:
+        False si otra petición concurrente ya registró la misma clave.
+    """
+    sentencia = insert(models.Idempotencia).values(
+        clave=clave, operacion=operacion, huella=huella, documento_id=documento_id
+    )
+    # Una clave vencida se reemplaza; una vigente gana la primera petición
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=["clave"],
+        set_={
+            "operacion": sentencia.excluded.operacion,
+            "huella": sentencia.excluded.huella,
+            "documento_id": sentencia.excluded.documento_id,
+            "created_at": func.now(),
+        },
+        where=models.Idempotencia.created_at < _vigencia(),
+    ).returning(models.Idempotencia.clave)
+    return db.execute(sentencia).first() is not None
+
+
+def depurar(db: Session) -> int:
+    """Elimina las claves vencidas. Devuelve cuántas se borraron."""
+    borradas = db.query(models.Idempotencia).filter(
+        models.Idempotencia.created_at < _vigencia()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return borradas
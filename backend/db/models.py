@@ -8,9 +8,12 @@ from sqlalchemy import (
     TIMESTAMP,
     ForeignKey,
     ForeignKeyConstraint,
+    Computed,
+    SmallInteger,
+    Numeric,
 )
-from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 import uuid
 
@@ -51,7 +54,34 @@ class Usuario(Base):
         TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
-    atenciones = relationship("Atencion", back_populates="usuario")
+    # Mismo orden que la historia servida por partes (app.historia_en_flujo)
+    atenciones = relationship(
+        "Atencion",
+        back_populates="usuario",
+        order_by="(Atencion.fecha_hora_atencion.desc(), Atencion.atencion_id)",
+    )
+
+
+class UsuarioCorreo(Base):
+    # Distribuida por correo: índice global correo -> documento_id
+    __tablename__ = "usuario_correo"
+    __table_args__ = {"schema": "hcd"}
+
+    correo = Column(String(255), primary_key=True)
+    documento_id = Column(BigInteger, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class Idempotencia(Base):
+    # Distribuida por clave (cabecera Idempotency-Key)
+    __tablename__ = "idempotencia"
+    __table_args__ = {"schema": "hcd"}
+
+    clave = Column(String(120), primary_key=True)
+    operacion = Column(String(60), nullable=False)
+    huella = Column(String(64), nullable=False)
+    documento_id = Column(BigInteger, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
 
 
 class ProfesionalSalud(Base):
@@ -71,6 +101,10 @@ class ProfesionalSalud(Base):
 
 
 class Atencion(Base):
+    # Particionada por mes de fecha_hora_atencion (ver infra/init.sql). La PK real
+    # incluye fecha_hora_atencion; para el ORM basta (atencion_id, documento_id).
+    # Los índices GIN de CIE-10 y de texto completo se crean por partición
+    # mientras esta sea heap.
     __tablename__ = "atencion"
     __table_args__ = {"schema": "hcd"}
 
@@ -81,49 +115,66 @@ class Atencion(Base):
     fecha_hora_atencion = Column(TIMESTAMP(timezone=True), nullable=False)
     tipo_atencion = Column(String(80))
     motivo_consulta = Column(Text)
-    enfermedad_actual = Column(Text)
-    antecedentes_personales = Column(Text)
-    antecedentes_familiares = Column(Text)
-    alergias_conocidas = Column(Text)
-    habitos = Column(JSONB)
-    medicamentos_actuales = Column(Text)
-    signos_vitales = Column(JSONB)
-    examen_fisico_general = Column(Text)
-    examen_fisico_por_sistemas = Column(Text)
+    # Texto clínico y JSONB diferidos (grupo "detalle"): los listados solo usan
+    # fecha, tipo, motivo e impresión diagnóstica. Las consultas que muestran
+    # la atención completa usan undefer_group("detalle") para cargarlos en la
+    # misma consulta.
+    enfermedad_actual = deferred(Column(Text), group="detalle")
+    antecedentes_personales = deferred(Column(Text), group="detalle")
+    antecedentes_familiares = deferred(Column(Text), group="detalle")
+    alergias_conocidas = deferred(Column(Text), group="detalle")
+    habitos = deferred(Column(JSONB), group="detalle")
+    medicamentos_actuales = deferred(Column(Text), group="detalle")
+    signos_vitales = deferred(Column(JSONB), group="detalle")
+    examen_fisico_general = deferred(Column(Text), group="detalle")
+    examen_fisico_por_sistemas = deferred(Column(Text), group="detalle")
     impresion_diagnostica = Column(Text)
     codigos_cie10 = Column(ARRAY(String))
-    conducta_plan_manejo = Column(Text)
-    recomendaciones_paciente = Column(Text)
-    medicos_interconsultados = Column(Text)
-    procedimientos_realizados = Column(Text)
-    resultados_paraclinicos = Column(JSONB)
-    diagnostico_definitivo = Column(Text)
-    evolucion_medica = Column(Text)
-    tratamiento_instaurado = Column(Text)
-    formulacion_medica = Column(JSONB)
-    educacion_consejeria = Column(Text)
-    referencia_contrarreferencia = Column(Text)
+    conducta_plan_manejo = deferred(Column(Text), group="detalle")
+    recomendaciones_paciente = deferred(Column(Text), group="detalle")
+    medicos_interconsultados = deferred(Column(Text), group="detalle")
+    procedimientos_realizados = deferred(Column(Text), group="detalle")
+    resultados_paraclinicos = deferred(Column(JSONB), group="detalle")
+    diagnostico_definitivo = deferred(Column(Text), group="detalle")
+    evolucion_medica = deferred(Column(Text), group="detalle")
+    tratamiento_instaurado = deferred(Column(Text), group="detalle")
+    formulacion_medica = deferred(Column(JSONB), group="detalle")
+    educacion_consejeria = deferred(Column(Text), group="detalle")
+    referencia_contrarreferencia = deferred(Column(Text), group="detalle")
     estado_egreso = Column(String(80), index=True)
     profesional_responsable = Column(
         UUID(as_uuid=True), ForeignKey("hcd.profesional_salud.id_personal_salud")
     )
-    firma_paciente_path = Column(Text)
+    firma_paciente_path = deferred(Column(Text), group="detalle")
     fecha_hora_cierre = Column(TIMESTAMP(timezone=True))
     responsable_registro = Column(String(120))
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = Column(
         TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
     )
+    # Columna generada por la BD (ver infra/init.sql); diferida para no cargarla
+    # con la historia del paciente.
+    busqueda_tsv = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('hcd.es_clinico', coalesce(motivo_consulta, '')), 'A') || "
+                "setweight(to_tsvector('hcd.es_clinico', coalesce(impresion_diagnostica, '')), 'A') || "
+                "setweight(to_tsvector('hcd.es_clinico', coalesce(enfermedad_actual, '')), 'B') || "
+                "setweight(to_tsvector('hcd.es_clinico', coalesce(medicamentos_actuales, '')), 'B') || "
+                "setweight(to_tsvector('hcd.es_clinico', coalesce(conducta_plan_manejo, '')), 'C')",
+                persisted=True,
+            ),
+        )
+    )
 
     usuario = relationship("Usuario", back_populates="atenciones")
 
 
 class Diagnostico(Base):
     __tablename__ = "diagnostico"
-    __table_args__ = (
-        ForeignKeyConstraint(['documento_id', 'atencion_id'], ['hcd.atencion.documento_id', 'hcd.atencion.atencion_id']),
-        {"schema": "hcd"}
-    )
+    # Particionada por created_at; sin FK a atencion (la tabla referenciada está particionada)
+    __table_args__ = {"schema": "hcd"}
 
     diagnostico_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     documento_id = Column(BigInteger, primary_key=True)
@@ -133,12 +184,15 @@ class Diagnostico(Base):
     codigo_cie10 = Column(String(30))
     gravedad = Column(String(50))
     registro_medico = Column(JSONB)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
 
 class TecnologiaSalud(Base):
     __tablename__ = "tecnologia_salud"
+    # Particionada por created_at; sin FK a atencion (la tabla referenciada está particionada)
     __table_args__ = (
-        ForeignKeyConstraint(['documento_id', 'atencion_id'], ['hcd.atencion.documento_id', 'hcd.atencion.atencion_id']),
         ForeignKeyConstraint(['id_personal_salud'], ['hcd.profesional_salud.id_personal_salud']),
         {"schema": "hcd"}
     )
@@ -151,18 +205,21 @@ class TecnologiaSalud(Base):
     via_administracion = Column(String(80))
     frecuencia = Column(String(80))
     dias_tratamiento = Column(Integer)
+    # Históricos: ya no se actualizan. Cada dosis es una fila de
+    # AdministracionMedicamento y el total se deriva de ellas.
     unidades_aplicadas = Column(Integer, default=0)
     id_personal_salud = Column(UUID(as_uuid=True))
     finalidad_tecnologia = Column(Text)
     registro_administracion = Column(JSONB)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
 
 class Egreso(Base):
     __tablename__ = "egreso"
-    __table_args__ = (
-        ForeignKeyConstraint(['documento_id', 'atencion_id'], ['hcd.atencion.documento_id', 'hcd.atencion.atencion_id']),
-        {"schema": "hcd"}
-    )
+    # Particionada por created_at; sin FK a atencion (la tabla referenciada está particionada)
+    __table_args__ = {"schema": "hcd"}
 
     egreso_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     documento_id = Column(BigInteger, primary_key=True)
@@ -171,5 +228,163 @@ class Egreso(Base):
     causas_egreso = Column(Text)
     recomendaciones_al_egreso = Column(Text)
     fecha_egreso = Column(TIMESTAMP(timezone=True))
-    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
+
+
+
+class RollupAtencionDiaria(Base):
+    __tablename__ = "rollup_atenciones_diarias"
+    __table_args__ = {"schema": "hcd"}
+
+    dia = Column(Date, primary_key=True)
+    tipo_atencion = Column(String(80), primary_key=True)
+    municipio_ciudad = Column(String(120), primary_key=True)
+    departamento = Column(String(120), primary_key=True)
+    grupo_edad = Column(String(20), primary_key=True)
+    regimen_afiliacion = Column(String(80), primary_key=True)
+    atenciones = Column(BigInteger, nullable=False, default=0)
+
+
+class RollupMarca(Base):
+    __tablename__ = "rollup_marca"
+    __table_args__ = {"schema": "hcd"}
+
+    nombre = Column(String(80), primary_key=True)
+    procesado_hasta = Column(TIMESTAMP(timezone=True), nullable=False)
+    actualizado_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class CensoAtencionAbierta(Base):
+    # Tabla de referencia con una fila por atención abierta (sin fecha de cierre
+    # ni estado de egreso). Se mantiene al crear y cerrar atenciones (ver
+    # backend/db/censo.py), así el censo no recorre los shards de atencion.
+    __tablename__ = "censo_atencion_abierta"
+    __table_args__ = {"schema": "hcd"}
+
+    atencion_id = Column(UUID(as_uuid=True), primary_key=True)
+    documento_id = Column(BigInteger, nullable=False)
+    fecha_hora_atencion = Column(TIMESTAMP(timezone=True), nullable=False)
+    tipo_atencion = Column(String(80))
+    motivo_consulta = Column(Text)
+    profesional_responsable = Column(UUID(as_uuid=True))
+    paciente_nombre = Column(String(255))
+    registrado_en = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class OutboxEvento(Base):
+    # Distribuida por documento_id y co-localizada con atencion: el evento se
+    # inserta en el mismo shard y transacción que la atención que lo origina.
+    __tablename__ = "outbox_evento"
+    __table_args__ = {"schema": "hcd"}
 
+    evento_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    documento_id = Column(BigInteger, primary_key=True)
+    tipo = Column(String(60), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    responsable_registro = Column(String(120))
+    medico_documento_id = Column(BigInteger)  # Usuario médico que originó el evento
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+
+class AuditoriaAcceso(Base):
+    # Distribuida por documento_id y co-localizada con usuario: el informe de
+    # accesos a una historia es una consulta a un único shard. Solo se inserta.
+    __tablename__ = "auditoria_acceso"
+    __table_args__ = {"schema": "hcd"}
+
+    auditoria_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    documento_id = Column(BigInteger, primary_key=True)
+    accedido_en = Column(TIMESTAMP(timezone=True), nullable=False)
+    accion = Column(String(40), nullable=False)
+    usuario_documento_id = Column(BigInteger)
+    usuario_correo = Column(String(255))
+    usuario_rol = Column(String(80))
+    recurso = Column(String(255))
+    ip = Column(String(64))
+    agente_usuario = Column(String(255))
+
+
+class SignoVital(Base):
+    # Serie de tiempo extraída de Atencion.signos_vitales (ver backend/db/serie_signos.py).
+    # Co-localizada con atencion; una fila por atención.
+    __tablename__ = "signo_vital"
+    __table_args__ = {"schema": "hcd"}
+
+    documento_id = Column(BigInteger, primary_key=True)
+    medido_en = Column(TIMESTAMP(timezone=True), primary_key=True)
+    atencion_id = Column(UUID(as_uuid=True), primary_key=True)
+    ta_sistolica = Column(SmallInteger)
+    ta_diastolica = Column(SmallInteger)
+    fc = Column(SmallInteger)
+    fr = Column(SmallInteger)
+    temperatura = Column(Numeric(4, 1))
+    saturacion = Column(SmallInteger)
+    peso = Column(Numeric(5, 1))
+    talla = Column(Numeric(3, 2))
+
+
+class PanelMedico(Base):
+    # Pacientes del panel de cada usuario médico (ver backend/db/panel.py).
+    # Co-localizada con atencion: se inserta en la transacción de la atención.
+    __tablename__ = "panel_medico"
+    __table_args__ = {"schema": "hcd"}
+
+    documento_id = Column(BigInteger, primary_key=True)
+    medico_documento_id = Column(BigInteger, primary_key=True)
+    agregado_en = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+
+class AdministracionMedicamento(Base):
+    # Una fila por dosis administrada; solo se inserta (ver backend/db/administraciones.py).
+    # Co-localizada con atencion y tecnologia_salud.
+    __tablename__ = "administracion_medicamento"
+    __table_args__ = {"schema": "hcd"}
+
+    administracion_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    documento_id = Column(BigInteger, primary_key=True)
+    tecnologia_id = Column(UUID(as_uuid=True), nullable=False)
+    administrado_en = Column(TIMESTAMP(timezone=True), nullable=False)
+    unidades = Column(Integer, nullable=False)
+    dosis = Column(String(80))
+    via_administracion = Column(String(80))
+    observaciones = Column(Text)
+    id_personal_salud = Column(UUID(as_uuid=True))
+    responsable_registro = Column(String(120))
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+
+class ExportacionFHIR(Base):
+    # Trabajos de exportación masiva FHIR ($export). Tabla local del coordinador.
+    __tablename__ = "exportacion_fhir"
+    __table_args__ = {"schema": "hcd"}
+
+    exportacion_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    estado = Column(String(20), nullable=False)
+    solicitante = Column(String(255))
+    solicitud = Column(Text)
+    tipos = Column(ARRAY(String))
+    desde = Column(TIMESTAMP(timezone=True))
+    segmentos_total = Column(Integer, nullable=False, default=0)
+    segmentos_listos = Column(Integer, nullable=False, default=0)
+    archivos = Column(JSONB)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    finalizada_en = Column(TIMESTAMP(timezone=True))
+    # Renovado por el proceso que ejecuta el trabajo (ver backend/core/exportacion_fhir.py)
+    latido_en = Column(TIMESTAMP(timezone=True))
+
+
+class SyncEliminacion(Base):
+    # Lápidas para la sincronización incremental; las escribe un trigger AFTER
+    # DELETE (ver infra/init.sql). Co-localizada con atencion.
+    __tablename__ = "sync_eliminacion"
+    __table_args__ = {"schema": "hcd"}
+
+    eliminacion_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    documento_id = Column(BigInteger, primary_key=True)
+    entidad = Column(String(30), nullable=False)
+    entidad_id = Column(Text, nullable=False)
+    eliminado_en = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,63 @@
+"""
+Outbox transaccional de eventos de la historia clínica.
+
+Quien modifica datos clínicos llama a ``registrar_evento`` dentro de su propia
+transacción, de modo que el evento existe si y solo si el cambio se confirmó.
+La difusión a las sesiones conectadas la hace ``backend.core.eventos``.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.db import models
+
+ATENCION_CREADA = "atencion_creada"
+
+
+def registrar_evento(
+    db: Session,
+    documento_id: int,
+    tipo: str,
+    payload: dict,
+    responsable_registro: Optional[str] = None,
+    medico_documento_id: Optional[int] = None,
+) -> models.OutboxEvento:
+    """Agrega el evento a la sesión sin confirmar; lo confirma el llamador."""
+    evento = models.OutboxEvento(
+        documento_id=documento_id,
+        tipo=tipo,
+        payload=payload,
+        responsable_registro=responsable_registro,
+        medico_documento_id=medico_documento_id,
+    )
+    db.add(evento)
+    return evento
+
+
+def ahora(db: Session) -> datetime:
+    """Hora del servidor de BD, la misma referencia que ``created_at``."""
+    return db.execute(text("SELECT now()")).scalar()
+
+
+def leer_eventos(db: Session, desde: datetime, limite: int = 500) -> List[models.OutboxEvento]:
+    """
+    Eventos con ``created_at`` posterior a ``desde``, en orden cronológico.
+
+    Es una consulta multi-shard; cada worker la resuelve con el índice por
+    ``created_at`` de su shard.
+    """
+    return db.query(models.OutboxEvento).filter(
+        models.OutboxEvento.created_at > desde
+    ).order_by(models.OutboxEvento.created_at).limit(limite).all()
+
+
+def depurar_eventos(db: Session, antes_de: datetime) -> int:
+    """Elimina los eventos ya vencidos. Devuelve cuántos se borraron."""
+    borrados = db.query(models.OutboxEvento).filter(
+        models.OutboxEvento.created_at < antes_de
+    ).delete(synchronize_session=False)
+    db.commit()
+    return borrados
@@ -0,0 +1,114 @@
+"""
+Relación entre el usuario médico autenticado y sus pacientes (su "panel").
+
+Los usuarios con rol ``medico`` viven en ``hcd.usuario`` y no tienen un
+vínculo explícito con ``hcd.profesional_salud``. Se asocian por el correo
+registrado en ``profesional_salud.contacto->>'email'`` (tabla de referencia,
+consulta local en el coordinador).
+
+El panel de un médico son los pacientes con al menos una atención suya y se
+guarda en ``hcd.panel_medico`` con la clave del usuario (``documento_id`` del
+médico), no con su nombre: dos médicos homónimos tienen paneles distintos.
+``crear_atencion`` inserta la fila en la misma transacción (y shard) que la
+atención; las atenciones históricas se incorporan con
+``incorporar_historico`` (``backend/scripts/backfill_panel_medico.py``).
+"""
+
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.db import models
+
+
+def nombre_registro(usuario: Any) -> str:
+    """Nombre legible con el que se firma ``responsable_registro``."""
+    return f"Dr. {usuario.primer_nombre} {usuario.primer_apellido}"
+
+
+def profesional_de_usuario(db: Session, usuario: Any) -> Optional[models.ProfesionalSalud]:
+    """Busca el profesional de salud cuyo correo de contacto coincide con el del usuario."""
+    if not getattr(usuario, "correo_electronico", None):
+        return None
+    return db.query(models.ProfesionalSalud).filter(
+        models.ProfesionalSalud.contacto["email"].astext == usuario.correo_electronico
+    ).first()
+
+
+def registrar(db: Session, documento_id: int, medico_documento_id: int) -> None:
+    """Agrega el paciente al panel del médico (sin confirmar); si ya estaba, no hace nada."""
+    db.execute(
+        insert(models.PanelMedico)
+        .values(documento_id=documento_id, medico_documento_id=medico_documento_id)
+        .on_conflict_do_nothing()
+    )
+
+
+def subconsulta_panel(db: Session, usuario: Any):
+    """
+    ``SELECT documento_id`` de los pacientes del panel, para usar con ``in_()``.
+
+    Al filtrar otra tabla distribuida por ``documento_id IN (...)`` Citus lo
+    resuelve como un semi-join colocado dentro de cada shard.
+    """
+    return select(models.PanelMedico.documento_id).where(
+        models.PanelMedico.medico_documento_id == usuario.documento_id
+    )
+
+
+def subconsulta_incorporados(usuario: Any, desde: datetime, hasta: datetime):
+    """Como ``subconsulta_panel``, solo los pacientes agregados en [desde, hasta)."""
+    return select(models.PanelMedico.documento_id).where(
+        models.PanelMedico.medico_documento_id == usuario.documento_id,
+        models.PanelMedico.agregado_en >= desde,
+        models.PanelMedico.agregado_en < hasta,
+    )
+
+
+def hay_incorporados(db: Session, usuario: Any, desde: datetime, hasta: datetime) -> bool:
+    return db.scalar(select(subconsulta_incorporados(usuario, desde, hasta).exists())) or False
+
+
+def nombre_unico(db: Session, usuario: Any) -> bool:
+    """True si ningún otro usuario médico firma con el mismo ``nombre_registro``."""
+    homonimos = db.scalar(
+        select(func.count()).select_from(models.Usuario).where(
+            models.Usuario.tipo_usuario == "medico",
+            models.Usuario.primer_nombre == usuario.primer_nombre,
+            models.Usuario.primer_apellido == usuario.primer_apellido,
+        )
+    )
+    return homonimos <= 1
+
+
+_INCORPORAR = text("""
+    INSERT INTO hcd.panel_medico (documento_id, medico_documento_id)
+    SELECT DISTINCT documento_id, :medico
+    FROM hcd.atencion
+    WHERE profesional_responsable = :profesional
+       OR (:por_nombre AND responsable_registro = :nombre)
+    ON CONFLICT DO NOTHING
+""")
+
+
+def incorporar_historico(db: Session, usuario: Any) -> int:
+    """
+    Incorpora al panel (sin confirmar) los pacientes de las atenciones ya
+    registradas por el médico. Devuelve las filas nuevas.
+
+    Las atenciones se reconocen por ``profesional_responsable``; el nombre de
+    ``responsable_registro`` solo se usa si no hay otro médico homónimo, para
+    no mezclar paneles. Es un único INSERT ... SELECT colocado: Citus lo
+    ejecuta en cada shard sin traer filas al coordinador.
+    """
+    profesional = profesional_de_usuario(db, usuario)
+    resultado = db.execute(_INCORPORAR, {
+        "medico": int(usuario.documento_id),
+        "profesional": profesional.id_personal_salud if profesional else None,
+        "por_nombre": nombre_unico(db, usuario),
+        "nombre": nombre_registro(usuario),
+    })
+    return resultado.rowcount
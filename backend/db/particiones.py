@@ -0,0 +1,296 @@
+"""
+Mantenimiento de las particiones por tiempo de ``hcd.atencion`` y sus tablas hijas.
+
+``hcd.atencion`` está particionada por mes de ``fecha_hora_atencion`` y
+``diagnostico``, ``tecnologia_salud`` y ``egreso`` por mes de ``created_at``.
+Citus distribuye cada partición con la misma colocación que la tabla padre,
+así que las consultas por ``documento_id`` siguen yendo a un solo shard y
+además descartan las particiones fuera del rango de fechas.
+
+Cada tabla tiene además una partición DEFAULT (``<tabla>_default``) que
+recibe las filas sin partición mensual (cargas históricas, o si el
+mantenimiento deja de ejecutarse), para que el INSERT no falle.
+
+Las tablas hijas no tienen FK hacia ``hcd.atencion`` (la clave referenciada
+tendría que incluir ``fecha_hora_atencion``). El borrado en cascada lo hace el
+trigger ``trg_atencion_hijas`` (infra/init.sql) y ``contar_huerfanas``
+informa las filas hijas sin atención.
+
+El mantenimiento hace estas cosas:
+
+1. Crea particiones futuras (``create_time_partitions``) y sus índices GIN.
+2. Mueve las filas de las particiones DEFAULT a particiones mensuales.
+3. Convierte a almacenamiento columnar las particiones de atención más
+   antiguas que ``antiguedad`` en las que todas las atenciones están cerradas
+   (``fecha_hora_cierre`` informado), y las particiones hijas cuyo rango ya
+   quedó cubierto por atenciones comprimidas. Columnar no admite UPDATE ni
+   DELETE ni índices GIN, por lo que esos índices se eliminan antes.
+
+Borrar o corregir un paciente con historia comprimida (el borrado en cascada
+desde ``hcd.usuario``, ``trg_atencion_hijas``, las lápidas de sincronización y
+los triggers de ``updated_at``) falla mientras sus filas estén en particiones
+columnares. ``descomprimir_paciente`` devuelve esas particiones a heap antes
+de la operación; el mantenimiento siguiente las vuelve a comprimir.
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+TABLA_ATENCION = "hcd.atencion"
+TABLAS_HIJAS = ("hcd.diagnostico", "hcd.tecnologia_salud", "hcd.egreso")
+COLUMNA_PARTICION = {
+    TABLA_ATENCION: "fecha_hora_atencion",
+    **{tabla: "created_at" for tabla in TABLAS_HIJAS},
+}
+
+
+def listar_particiones(db: Session, tabla: str) -> List[dict]:
+    """Particiones de ``tabla`` con su rango y método de acceso (heap o columnar), sin la DEFAULT."""
+    filas = db.execute(
+        text(
+            """
+            SELECT partition::text AS particion,
+                   from_value::timestamptz AS desde,
+                   to_value::timestamptz AS hasta,
+                   access_method
+            FROM time_partitions
+            WHERE parent_table = CAST(:tabla AS regclass) AND from_value IS NOT NULL
+            ORDER BY from_value::timestamptz
+            """
+        ),
+        {"tabla": tabla},
+    ).mappings().all()
+    return [dict(f) for f in filas]
+
+
+def crear_particiones_futuras(db: Session, meses_adelante: int) -> None:
+    """Garantiza particiones mensuales hasta ``meses_adelante`` meses en el futuro."""
+    for tabla in (TABLA_ATENCION,) + TABLAS_HIJAS:
+        db.execute(
+            text(
+                """
+                SELECT create_time_partitions(
+                    table_name := CAST(:tabla AS regclass),
+                    partition_interval := INTERVAL '1 month',
+                    end_at := date_trunc('month', now()) + make_interval(months => :meses + 1)
+                )
+                """
+            ),
+            {"tabla": tabla, "meses": meses_adelante},
+        )
+    db.commit()
+
+    for particion in listar_particiones(db, TABLA_ATENCION):
+        if particion["access_method"] == "heap":
+            db.execute(
+                text("SELECT hcd.asegurar_indices_particion(CAST(:particion AS regclass))"),
+                {"particion": particion["particion"]},
+            )
+    db.commit()
+
+
+def _columnas_insertables(db: Session, tabla: str) -> str:
+    # Sin las columnas generadas (busqueda_tsv), que no admiten INSERT
+    return db.execute(
+        text(
+            """
+            SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+            FROM pg_attribute
+            WHERE attrelid = CAST(:tabla AS regclass) AND attnum > 0
+              AND NOT attisdropped AND attgenerated = ''
+            """
+        ),
+        {"tabla": tabla},
+    ).scalar()
+
+
+def reubicar_default(db: Session) -> Dict[str, int]:
+    """
+    Mueve las filas de cada partición DEFAULT a particiones mensuales.
+
+    PostgreSQL no permite crear una partición cuyo rango tenga filas en la
+    DEFAULT, así que, en una sola transacción por tabla, se separa la
+    DEFAULT, se crean las particiones que cubren sus filas, se copian (INSERT
+    ... SELECT colocado, shard a shard) y se vuelve a adjuntar vacía.
+
+    Returns:
+        Filas movidas por tabla (solo las tablas con filas en la DEFAULT).
+    """
+    movidas = {}
+    for tabla, columna in COLUMNA_PARTICION.items():
+        defecto = f"{tabla}_default"
+        if db.execute(text("SELECT to_regclass(:defecto)"), {"defecto": defecto}).scalar() is None:
+            continue
+        desde, hasta, filas = db.execute(
+            text(f"SELECT min({columna}), max({columna}), count(*) FROM {defecto}")
+        ).one()
+        if not filas:
+            continue
+        columnas = _columnas_insertables(db, tabla)
+        db.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {defecto}"))
+        db.execute(
+            text(
+                """
+                SELECT create_time_partitions(
+                    table_name := CAST(:tabla AS regclass),
+                    partition_interval := INTERVAL '1 month',
+                    start_from := date_trunc('month', CAST(:desde AS timestamptz)),
+                    end_at := date_trunc('month', CAST(:hasta AS timestamptz)) + INTERVAL '1 month'
+                )
+                """
+            ),
+            {"tabla": tabla, "desde": desde, "hasta": hasta},
+        )
+        db.execute(text(f"INSERT INTO {tabla} ({columnas}) SELECT {columnas} FROM {defecto}"))
+        db.execute(text(f"DELETE FROM {defecto}"))
+        db.execute(text(f"ALTER TABLE {tabla} ATTACH PARTITION {defecto} DEFAULT"))
+        db.commit()
+        movidas[tabla] = filas
+
+    if movidas:
+        for particion in listar_particiones(db, TABLA_ATENCION):
+            if particion["access_method"] == "heap":
+                db.execute(
+                    text("SELECT hcd.asegurar_indices_particion(CAST(:particion AS regclass))"),
+                    {"particion": particion["particion"]},
+                )
+        db.commit()
+    return movidas
+
+
+def contar_huerfanas(db: Session) -> Dict[str, int]:
+    """
+    Filas de las tablas hijas cuya atención no existe (lo que antes impedía la
+    FK). El anti-join es por ``(documento_id, atencion_id)``, co-localizado.
+    """
+    huerfanas = {}
+    for tabla in TABLAS_HIJAS:
+        huerfanas[tabla] = db.execute(
+            text(
+                f"""
+                SELECT count(*) FROM {tabla} h
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM hcd.atencion a
+                    WHERE a.documento_id = h.documento_id AND a.atencion_id = h.atencion_id
+                )
+                """
+            )
+        ).scalar()
+    return huerfanas
+
+
+def _tiene_atenciones_abiertas(db: Session, particion: str) -> bool:
+    return db.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {particion} WHERE fecha_hora_cierre IS NULL)")
+    ).scalar()
+
+
+def _convertir_a_columnar(db: Session, particion: str) -> None:
+    db.execute(
+        text("SELECT hcd.eliminar_indices_heap_particion(CAST(:particion AS regclass))"),
+        {"particion": particion},
+    )
+    db.execute(
+        text("SELECT alter_table_set_access_method(CAST(:particion AS regclass), 'columnar')"),
+        {"particion": particion},
+    )
+    db.commit()
+
+
+def descomprimir(db: Session, particion: str) -> None:
+    """Devuelve una partición columnar a heap (reescribe toda la partición) y recrea sus índices."""
+    db.execute(
+        text("SELECT alter_table_set_access_method(CAST(:particion AS regclass), 'heap')"),
+        {"particion": particion},
+    )
+    db.execute(
+        text("SELECT hcd.asegurar_indices_particion(CAST(:particion AS regclass))"),
+        {"particion": particion},
+    )
+    db.commit()
+
+
+def particiones_columnares_paciente(db: Session, documento_id: int) -> List[str]:
+    """Particiones columnares de atención o de las tablas hijas con filas del paciente."""
+    columnares = []
+    for tabla in COLUMNA_PARTICION:
+        for particion in listar_particiones(db, tabla):
+            if particion["access_method"] != "columnar":
+                continue
+            # Cada partición es una tabla distribuida: consulta a un solo shard
+            if db.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {particion['particion']} WHERE documento_id = :documento_id)"),
+                {"documento_id": documento_id},
+            ).scalar():
+                columnares.append(particion["particion"])
+    db.commit()
+    return columnares
+
+
+def descomprimir_paciente(db: Session, documento_id: int) -> List[str]:
+    """
+    Prepara el borrado o la corrección de un paciente: convierte a heap las
+    particiones columnares que tienen filas suyas.
+
+    Cada conversión reescribe la partición completa (todo el mes, todos los
+    pacientes). Las particiones quedan en heap hasta el siguiente
+    mantenimiento, que las vuelve a comprimir si siguen cumpliendo las
+    condiciones: el borrado o la corrección deben hacerse antes.
+
+    Returns:
+        Nombres de las particiones convertidas.
+    """
+    convertidas = []
+    for particion in particiones_columnares_paciente(db, documento_id):
+        descomprimir(db, particion)
+        convertidas.append(particion)
+    return convertidas
+
+
+def comprimir_particiones_antiguas(db: Session, antes_de: datetime) -> List[str]:
+    """
+    Convierte a columnar las particiones cerradas cuyo rango termina antes de ``antes_de``.
+
+    Una partición de atención se comprime solo si no tiene atenciones abiertas.
+    Las hijas se comprimen cuando su rango termina antes de la primera partición
+    de atención que sigue en heap, para no congelar filas de episodios abiertos.
+
+    Returns:
+        Nombres de las particiones convertidas.
+    """
+    convertidas = []
+    limite_hijas = None
+
+    for particion in listar_particiones(db, TABLA_ATENCION):
+        if particion["access_method"] != "heap":
+            continue
+        if particion["hasta"] > antes_de or _tiene_atenciones_abiertas(db, particion["particion"]):
+            limite_hijas = particion["desde"]
+            break
+        try:
+            _convertir_a_columnar(db, particion["particion"])
+            convertidas.append(particion["particion"])
+        except Exception as e:
+            db.rollback()
+            print(f"[ADVERTENCIA] No se pudo comprimir {particion['particion']}: {e}")
+            limite_hijas = particion["desde"]
+            break
+
+    if limite_hijas is None:
+        limite_hijas = antes_de
+
+    for tabla in TABLAS_HIJAS:
+        for particion in listar_particiones(db, tabla):
+            if particion["access_method"] != "heap" or particion["hasta"] > limite_hijas:
+                continue
+            try:
+                _convertir_a_columnar(db, particion["particion"])
+                convertidas.append(particion["particion"])
+            except Exception as e:
+                db.rollback()
+                print(f"[ADVERTENCIA] No se pudo comprimir {particion['particion']}: {e}")
+
+    return convertidas
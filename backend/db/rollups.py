@@ -0,0 +1,253 @@
+"""
+Tablas de resumen (rollups) para reportes operativos y epidemiológicos.
+
+``hcd.rollup_atenciones_diarias`` guarda el número de atenciones por día,
+tipo de atención, municipio, departamento, grupo de edad y régimen. Se
+mantiene de forma incremental: cada refresco agrega solo las atenciones
+insertadas (``created_at``) desde la última marca de agua registrada en
+``hcd.rollup_marca`` y hasta ``now() - RETRASO``. El retraso deja margen a las
+transacciones que aún no han confirmado y cuyo ``created_at`` es anterior al
+momento del refresco.
+
+Ambas tablas son tablas de referencia en Citus: la agregación se calcula en
+los workers (join colocado atencion/usuario) y solo las filas resumidas
+viajan al coordinador. Los reportes leen exclusivamente estas tablas.
+
+Limitación conocida: los cambios posteriores sobre una atención o sobre los
+datos demográficos del paciente no se reflejan en los resúmenes ya
+acumulados; ``reconstruir`` los recalcula desde cero en
+``hcd.rollup_atenciones_diarias_reconstruccion`` y los reemplaza en una sola
+transacción, así que los reportes nunca ven un resumen a medio calcular.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from backend.db import models
+
+NOMBRE_ROLLUP = "atenciones_diarias"
+NOMBRE_RECONSTRUCCION = "atenciones_diarias_reconstruccion"
+
+TABLA_ROLLUP = "hcd.rollup_atenciones_diarias"
+TABLA_RECONSTRUCCION = "hcd.rollup_atenciones_diarias_reconstruccion"
+
+# Margen para transacciones en curso al calcular el límite superior del refresco
+RETRASO = timedelta(minutes=1)
+
+# Tamaño máximo (por created_at) de cada ventana procesada en una transacción
+VENTANA_LOTE = timedelta(days=7)
+
+SIN_DATO = "Sin dato"
+
+# Dimensiones por las que se puede agrupar o filtrar un reporte
+DIMENSIONES = (
+    "dia",
+    "tipo_atencion",
+    "municipio_ciudad",
+    "departamento",
+    "grupo_edad",
+    "regimen_afiliacion",
+)
+
+# Ciclos de vida de MinSalud (Resolución 3280 de 2018)
+_GRUPO_EDAD_SQL = """
+    CASE
+        WHEN u.fecha_nacimiento IS NULL THEN 'Sin dato'
+        WHEN edad < 6 THEN '0-5'
+        WHEN edad < 12 THEN '6-11'
+        WHEN edad < 18 THEN '12-17'
+        WHEN edad < 29 THEN '18-28'
+        WHEN edad < 60 THEN '29-59'
+        ELSE '60+'
+    END
+"""
+
+_AGREGAR_VENTANA = """
+    INSERT INTO {tabla} AS r (
+        dia, tipo_atencion, municipio_ciudad, departamento,
+        grupo_edad, regimen_afiliacion, atenciones
+    )
+    SELECT dia,
+           COALESCE(NULLIF(tipo_atencion, ''), '{sin_dato}'),
+           COALESCE(NULLIF(municipio_ciudad, ''), '{sin_dato}'),
+           COALESCE(NULLIF(departamento, ''), '{sin_dato}'),
+           grupo_edad,
+           COALESCE(NULLIF(regimen_afiliacion, ''), '{sin_dato}'),
+           count(*)
+    FROM (
+        SELECT (a.fecha_hora_atencion AT TIME ZONE 'America/Bogota')::date AS dia,
+               a.tipo_atencion,
+               u.municipio_ciudad,
+               u.departamento,
+               u.regimen_afiliacion,
+               {grupo_edad} AS grupo_edad
+        FROM hcd.atencion a
+        JOIN hcd.usuario u ON u.documento_id = a.documento_id
+        CROSS JOIN LATERAL (
+            SELECT date_part('year', age((a.fecha_hora_atencion AT TIME ZONE 'America/Bogota')::date,
+                                         u.fecha_nacimiento)) AS edad
+        ) e
+        WHERE a.created_at > :desde
+          AND a.created_at <= :hasta
+    ) nuevas
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ON CONFLICT (dia, tipo_atencion, municipio_ciudad, departamento, grupo_edad, regimen_afiliacion)
+    DO UPDATE SET atenciones = r.atenciones + EXCLUDED.atenciones
+"""
+
+# Misma agregación sobre el rollup en uso o sobre la tabla de reconstrucción
+_AGREGAR = {
+    tabla: text(_AGREGAR_VENTANA.format(tabla=tabla, sin_dato=SIN_DATO, grupo_edad=_GRUPO_EDAD_SQL))
+    for tabla in (TABLA_ROLLUP, TABLA_RECONSTRUCCION)
+}
+
+_GUARDAR_MARCA = text(
+    """
+    INSERT INTO hcd.rollup_marca (nombre, procesado_hasta, actualizado_at)
+    VALUES (:nombre, :limite, now())
+    ON CONFLICT (nombre) DO UPDATE
+    SET procesado_hasta = EXCLUDED.procesado_hasta, actualizado_at = now()
+    """
+)
+
+
+def _bloquear(db: Session) -> None:
+    """Serializa los refrescos concurrentes (CronJob + comando manual)."""
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext('hcd.rollup_atenciones_diarias'))"))
+
+
+def obtener_marca(db: Session, nombre: str = NOMBRE_ROLLUP) -> Optional[datetime]:
+    """Devuelve hasta qué ``created_at`` están consolidados los resúmenes."""
+    return db.execute(
+        text("SELECT procesado_hasta FROM hcd.rollup_marca WHERE nombre = :nombre"),
+        {"nombre": nombre},
+    ).scalar()
+
+
+def _avanzar(db: Session, tabla: str, nombre: str, hasta: datetime) -> int:
+    """Agrega a ``tabla`` las ventanas pendientes desde la marca ``nombre`` hasta ``hasta``."""
+    ventanas = 0
+    while True:
+        _bloquear(db)
+        marca = obtener_marca(db, nombre)
+        if marca is None:
+            # Primera ejecución: empezar desde la atención más antigua
+            marca = db.execute(
+                text("SELECT min(created_at) - interval '1 microsecond' FROM hcd.atencion")
+            ).scalar()
+            if marca is None:
+                db.rollback()
+                return ventanas
+        if marca >= hasta:
+            db.rollback()
+            return ventanas
+
+        limite = min(marca + VENTANA_LOTE, hasta)
+        db.execute(_AGREGAR[tabla], {"desde": marca, "hasta": limite})
+        db.execute(_GUARDAR_MARCA, {"nombre": nombre, "limite": limite})
+        db.commit()
+        ventanas += 1
+
+
+def _limite_refresco(db: Session) -> datetime:
+    hasta = db.execute(text("SELECT now()")).scalar() - RETRASO
+    db.commit()
+    return hasta
+
+
+def refrescar(db: Session, hasta: Optional[datetime] = None) -> int:
+    """
+    Agrega al rollup las atenciones nuevas desde la marca de agua.
+
+    Procesa ventanas de ``VENTANA_LOTE`` en transacciones separadas para que
+    un backfill grande no mantenga bloqueos durante horas; cada ventana
+    actualiza los resúmenes y la marca de forma atómica.
+
+    Returns:
+        Número de ventanas procesadas.
+    """
+    if hasta is None:
+        hasta = _limite_refresco(db)
+    else:
+        db.commit()
+    return _avanzar(db, TABLA_ROLLUP, NOMBRE_ROLLUP, hasta)
+
+
+def reconstruir(db: Session) -> int:
+    """
+    Recalcula los resúmenes desde el inicio sin dejar de servir los actuales.
+
+    Las ventanas se agregan en ``TABLA_RECONSTRUCCION`` con su propia marca,
+    mientras los reportes siguen leyendo el rollup en uso y el refresco
+    incremental lo sigue alimentando. Al final, en una sola transacción y con
+    los refrescos bloqueados, se alcanza la marca del rollup en uso y se
+    reemplaza su contenido por el reconstruido: los lectores ven los
+    resúmenes anteriores o los nuevos completos, nunca una mezcla.
+
+    Returns:
+        Número de ventanas procesadas.
+    """
+    hasta = _limite_refresco(db)
+    _bloquear(db)
+    db.execute(text(f"DELETE FROM {TABLA_RECONSTRUCCION}"))
+    db.execute(text("DELETE FROM hcd.rollup_marca WHERE nombre = :nombre"), {"nombre": NOMBRE_RECONSTRUCCION})
+    db.commit()
+
+    ventanas = _avanzar(db, TABLA_RECONSTRUCCION, NOMBRE_RECONSTRUCCION, hasta)
+
+    _bloquear(db)
+    marca = obtener_marca(db, NOMBRE_ROLLUP)
+    nueva = obtener_marca(db, NOMBRE_RECONSTRUCCION)
+    if nueva is not None and marca is not None and marca > nueva:
+        # Lo que el refresco incremental agregó mientras se reconstruía
+        db.execute(_AGREGAR[TABLA_RECONSTRUCCION], {"desde": nueva, "hasta": marca})
+        nueva = marca
+    db.execute(text(f"DELETE FROM {TABLA_ROLLUP}"))
+    db.execute(text(f"INSERT INTO {TABLA_ROLLUP} SELECT * FROM {TABLA_RECONSTRUCCION}"))
+    if nueva is None:
+        # Sin atenciones: el rollup queda vacío y sin marca
+        db.execute(text("DELETE FROM hcd.rollup_marca WHERE nombre = :nombre"), {"nombre": NOMBRE_ROLLUP})
+    else:
+        db.execute(_GUARDAR_MARCA, {"nombre": NOMBRE_ROLLUP, "limite": nueva})
+    db.execute(text(f"DELETE FROM {TABLA_RECONSTRUCCION}"))
+    db.execute(text("DELETE FROM hcd.rollup_marca WHERE nombre = :nombre"), {"nombre": NOMBRE_RECONSTRUCCION})
+    db.commit()
+    return ventanas
+
+
+def consultar(
+    db: Session,
+    desde: date,
+    hasta: date,
+    agrupar_por: List[str],
+    filtros: Optional[Dict[str, str]] = None,
+) -> List[dict]:
+    """
+    Suma las atenciones del rollup entre ``desde`` y ``hasta`` (inclusive)
+    agrupando por las dimensiones pedidas. No toca las tablas distribuidas.
+
+    Raises:
+        ValueError: Si alguna dimensión no existe.
+    """
+    agrupar_por = list(dict.fromkeys(agrupar_por))
+    invalidas = [d for d in agrupar_por + list(filtros or {}) if d not in DIMENSIONES]
+    if invalidas:
+        raise ValueError(f"Dimensiones inválidas: {', '.join(invalidas)}")
+
+    tabla = models.RollupAtencionDiaria
+    columnas = [getattr(tabla, d) for d in agrupar_por]
+    consulta = db.query(*columnas, func.sum(tabla.atenciones).label("atenciones")).filter(
+        tabla.dia >= desde, tabla.dia <= hasta
+    )
+    for dimension, valor in (filtros or {}).items():
+        consulta = consulta.filter(getattr(tabla, dimension) == valor)
+    if columnas:
+        consulta = consulta.group_by(*columnas).order_by(*columnas)
+
+    return [
+        {**{d: fila[i] for i, d in enumerate(agrupar_por)}, "atenciones": int(fila[-1] or 0)}
+        for fila in consulta.all()
+    ]
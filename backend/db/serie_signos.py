@@ -0,0 +1,99 @@
+"""
+Serie de tiempo de signos vitales por paciente (``hcd.signo_vital``).
+
+Una fila por atención con signos utilizables, con columnas numéricas. Está
+co-localizada con ``hcd.atencion``: se escribe en la misma transacción y shard
+que la atención, y la tendencia de un paciente es una consulta de router que
+lee solo su rango de fechas por la PK ``(documento_id, medido_en, atencion_id)``.
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.core import signos_vitales
+from backend.db import models
+
+
+def registrar(db: Session, atencion: models.Atencion) -> bool:
+    """
+    Agrega la fila de la atención, sin confirmar. Devuelve False si la
+    atención no trae signos utilizables.
+    """
+    valores = signos_vitales.extraer(atencion.signos_vitales)
+    if valores is None:
+        return False
+    db.add(models.SignoVital(
+        documento_id=atencion.documento_id,
+        atencion_id=atencion.atencion_id,
+        medido_en=atencion.fecha_hora_atencion,
+        **valores,
+    ))
+    return True
+
+
+def insertar_lote(db: Session, filas: List[dict]) -> int:
+    """Inserta filas ya extraídas ignorando las existentes (backfill re-ejecutable)."""
+    if not filas:
+        return 0
+    # Un INSERT de varias filas necesita las mismas columnas en todas
+    filas = [{**dict.fromkeys(signos_vitales.VARIABLES), **fila} for fila in filas]
+    sentencia = insert(models.SignoVital).values(filas).on_conflict_do_nothing().returning(
+        models.SignoVital.atencion_id
+    )
+    return len(db.execute(sentencia).all())
+
+
+def tendencia(
+    db: Session,
+    documento_id: int,
+    variables: List[str],
+    desde: datetime,
+    hasta: datetime,
+    puntos: int,
+) -> Dict[str, List[dict]]:
+    """
+    Serie reducida a lo sumo a ``puntos`` intervalos de igual duración entre
+    ``desde`` y ``hasta``. Cada punto agrega las mediciones de su intervalo
+    (promedio, mínimo, máximo y cantidad); un intervalo con una sola medición
+    la devuelve tal cual. La reducción se hace en el worker con ``date_bin``.
+    """
+    ancho = max((hasta - desde).total_seconds() / puntos, 1.0)
+    tabla = models.SignoVital
+    intervalo = func.date_bin(func.make_interval(0, 0, 0, 0, 0, 0, ancho), tabla.medido_en, desde)
+
+    columnas = [intervalo.label("intervalo")]
+    for variable in variables:
+        columna = getattr(tabla, variable)
+        columnas += [
+            func.avg(columna).label(f"{variable}_promedio"),
+            func.min(columna).label(f"{variable}_minimo"),
+            func.max(columna).label(f"{variable}_maximo"),
+            func.count(columna).label(f"{variable}_n"),
+            func.min(tabla.medido_en).filter(columna.isnot(None)).label(f"{variable}_fecha"),
+        ]
+
+    consulta = (
+        select(*columnas)
+        .where(tabla.documento_id == documento_id, tabla.medido_en >= desde, tabla.medido_en < hasta)
+        .group_by(intervalo)
+        .order_by(intervalo)
+    )
+
+    series: Dict[str, List[dict]] = {variable: [] for variable in variables}
+    for fila in db.execute(consulta).mappings():
+        for variable in variables:
+            n = fila[f"{variable}_n"]
+            if not n:
+                continue
+            series[variable].append({
+                "fecha": fila[f"{variable}_fecha"] if n == 1 else fila["intervalo"],
+                "valor": round(float(fila[f"{variable}_promedio"]), 2),
+                "minimo": float(fila[f"{variable}_minimo"]),
+                "maximo": float(fila[f"{variable}_maximo"]),
+                "n": n,
+            })
+    return series
@@ -1,7 +1,26 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
 
 from backend.core.config import settings
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+engine = create_engine(
+    settings.database_url,
+    pool_pre_ping=True,
+    # Fallar pronto si el coordinador no acepta conexiones o el pool está agotado,
+    # en lugar de acumular peticiones esperando
+    pool_timeout=settings.BD_POOL_TIMEOUT_SEGUNDOS,
+    connect_args={"connect_timeout": settings.BD_CONEXION_TIMEOUT_SEGUNDOS},
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def limitar_tiempo(db: Session, milisegundos: int) -> Session:
+    """
+    Aplica ``statement_timeout`` con SET LOCAL al inicio de cada transacción de
+    la sesión. Al ser local, el valor no queda en la conexión devuelta al pool.
+    """
+    @event.listens_for(db, "after_begin")
+    def _aplicar(session, transaction, connection):
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(milisegundos)}")
+
+    return db
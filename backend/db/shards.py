@@ -0,0 +1,76 @@
+"""
+Utilidades para consultar por lotes agrupando las claves por shard de Citus.
+
+Una consulta ``documento_id = ANY(:ids)`` con ids repartidos en muchos shards
+se planifica como multi-shard en el coordinador. Si antes se agrupan los ids
+por shard, cada grupo es una consulta de router (un solo shard, plan simple y
+cacheable) y los grupos pueden ejecutarse en paralelo.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.core.disponibilidad import abrir_sesion, conexiones_libres
+
+T = TypeVar("T")
+
+_SHARD_DE_VALORES = text(
+    """
+    SELECT v AS valor, get_shard_id_for_distribution_column(CAST(:tabla AS regclass), v) AS shard_id
+    FROM unnest(CAST(:valores AS bigint[])) AS v
+    """
+)
+
+
+def agrupar_por_shard(db: Session, tabla: str, valores: Iterable[int]) -> Dict[int, List[int]]:
+    """
+    Agrupa los valores de la columna de distribución por shard de ``tabla``.
+
+    Se resuelve en el coordinador con sus metadatos, sin ir a los workers.
+    """
+    valores = list(dict.fromkeys(valores))
+    grupos: Dict[int, List[int]] = defaultdict(list)
+    if not valores:
+        return grupos
+    for fila in db.execute(_SHARD_DE_VALORES, {"tabla": tabla, "valores": valores}):
+        grupos[fila.shard_id].append(fila.valor)
+    return grupos
+
+
+def ejecutar_por_shard(
+    db: Session,
+    grupos: Dict[int, List[int]],
+    consulta: Callable[[Session, List[int]], List[T]],
+    paralelismo: int,
+    milisegundos: int,
+) -> List[T]:
+    """
+    Ejecuta ``consulta(db, valores)`` para cada grupo y concatena los resultados.
+
+    En secuencia se usa la sesión ``db`` de la petición. En paralelo, cada hilo
+    abre su propia sesión (las sesiones no son seguras entre hilos) con
+    ``abrir_sesion``, que respeta el circuito y el ``statement_timeout`` de
+    ``milisegundos``. Los hilos no pasan de ``paralelismo`` ni de las
+    conexiones libres del pool, para no dejar a otras peticiones esperando una.
+    """
+    def ejecutar(valores: List[int]) -> List[T]:
+        sesion = abrir_sesion(milisegundos)
+        try:
+            return consulta(sesion, valores)
+        finally:
+            sesion.close()
+
+    lotes = list(grupos.values())
+    hilos = min(paralelismo, len(lotes), conexiones_libres())
+    if hilos <= 1:
+        return [fila for valores in lotes for fila in consulta(db, valores)]
+
+    resultados: List[T] = []
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        for filas in pool.map(ejecutar, lotes):
+            resultados.extend(filas)
+    return resultados
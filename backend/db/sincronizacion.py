@@ -0,0 +1,224 @@
+"""
+Sincronización incremental ("cambios desde") para clientes con copia local.
+
+Cada entidad se recorre por su marca de agua ``(fecha, id)`` con paginación
+por clave (keyset), de modo que cada página es una lectura del índice
+``(documento_id, fecha, id)`` a partir del cursor y no depende del tamaño de
+la historia. Las filas eliminadas llegan como lápidas desde
+``hcd.sync_eliminacion`` (las escribe un trigger, ver infra/init.sql).
+
+``updated_at`` se fija al inicio de la transacción: una transacción larga
+puede confirmar filas con una fecha anterior al cursor de un cliente. Por eso
+solo se entregan filas con fecha anterior al horizonte
+``now() - SINCRONIZACION_SOLAPE_SEGUNDOS``; lo posterior llega en la siguiente
+sincronización.
+
+En el panel de un médico, un paciente que entra al panel después de la
+última sincronización ya tiene historia con fechas anteriores al cursor. El
+token guarda ``panel_hasta``, el ``agregado_en`` hasta el que se entregó el
+panel; los pacientes agregados después se recorren en una *incorporación*:
+una segunda pasada por las mismas entidades, limitada a ellos y con sus
+propios cursores desde el principio, que acompaña a las páginas normales
+hasta completarse.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text, tuple_
+from sqlalchemy.orm import Session, undefer_group
+
+from backend.core.config import settings
+from backend.db import models
+
+VERSION_TOKEN = 2
+
+
+@dataclass(frozen=True)
+class Entidad:
+    nombre: str
+    modelo: Any
+    fecha: str
+    clave: str
+    convertir_clave: Any = str
+    opciones: tuple = ()
+
+
+# Orden de entrega: el cliente puede aplicar cada página en este orden
+ENTIDADES = (
+    Entidad("usuarios", models.Usuario, "updated_at", "documento_id", int),
+    Entidad("atenciones", models.Atencion, "updated_at", "atencion_id", uuid.UUID, (undefer_group("detalle"),)),
+    Entidad("diagnosticos", models.Diagnostico, "updated_at", "diagnostico_id", uuid.UUID),
+    Entidad("medicamentos", models.TecnologiaSalud, "updated_at", "tecnologia_id", uuid.UUID),
+    # Append-only: una administración no se modifica después de registrarse
+    Entidad("administraciones", models.AdministracionMedicamento, "created_at", "administracion_id", uuid.UUID),
+    Entidad("egresos", models.Egreso, "updated_at", "egreso_id", uuid.UUID),
+    Entidad("eliminaciones", models.SyncEliminacion, "eliminado_en", "eliminacion_id", uuid.UUID),
+)
+
+
+# Un paciente nuevo en el panel no tiene nada eliminado que propagar
+ENTIDADES_INCORPORACION = tuple(e for e in ENTIDADES if e.nombre != "eliminaciones")
+
+Cursores = Dict[str, Tuple[str, str]]
+
+
+@dataclass
+class Incorporacion:
+    """Pacientes con ``agregado_en`` en [desde, hasta) pendientes de recibir su historia."""
+    desde: datetime
+    hasta: datetime
+    cursores: Cursores = field(default_factory=dict)
+
+
+@dataclass
+class EstadoToken:
+    cursores: Cursores = field(default_factory=dict)
+    panel_hasta: Optional[datetime] = None
+    incorporacion: Optional[Incorporacion] = None
+
+
+class TokenInvalido(ValueError):
+    pass
+
+
+class TokenVencido(ValueError):
+    """El cursor es anterior a la retención de lápidas: hace falta una sincronización completa."""
+
+
+def _firma(contenido: bytes) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), contenido, hashlib.sha256).hexdigest()[:32]
+
+
+def codificar_token(alcance: str, hasta: datetime, estado: EstadoToken) -> str:
+    """
+    Token firmado con el alcance, el horizonte de la última página, el cursor
+    de cada entidad y, en un panel, hasta dónde se incorporaron sus pacientes.
+    Reenviarlo reanuda la sincronización donde quedó.
+    """
+    token_json = {"v": VERSION_TOKEN, "alcance": alcance, "hasta": hasta.isoformat(), "cursores": estado.cursores}
+    if estado.panel_hasta is not None:
+        token_json["panel_hasta"] = estado.panel_hasta.isoformat()
+    if estado.incorporacion is not None:
+        token_json["incorporacion"] = {
+            "desde": estado.incorporacion.desde.isoformat(),
+            "hasta": estado.incorporacion.hasta.isoformat(),
+            "cursores": estado.incorporacion.cursores,
+        }
+    contenido = json.dumps(token_json, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(contenido).decode().rstrip("=") + "." + _firma(contenido)
+
+
+def _cursores(valor: Any) -> Cursores:
+    return {nombre: tuple(cursor) for nombre, cursor in (valor or {}).items()}
+
+
+def decodificar_token(token: str, alcance: str) -> EstadoToken:
+    """Estado guardado en el token. Lanza ``TokenInvalido`` o ``TokenVencido``."""
+    try:
+        datos, firma = token.rsplit(".", 1)
+        contenido = base64.urlsafe_b64decode(datos + "=" * (-len(datos) % 4))
+        valido = hmac.compare_digest(firma, _firma(contenido))
+        token_json = json.loads(contenido) if valido else None
+        hasta = datetime.fromisoformat(token_json["hasta"]) if valido else None
+        if valido and token_json.get("v") == VERSION_TOKEN:
+            panel_hasta = token_json.get("panel_hasta")
+            incorporacion = token_json.get("incorporacion")
+            estado = EstadoToken(
+                cursores=_cursores(token_json.get("cursores")),
+                panel_hasta=datetime.fromisoformat(panel_hasta) if panel_hasta else None,
+                incorporacion=Incorporacion(
+                    desde=datetime.fromisoformat(incorporacion["desde"]),
+                    hasta=datetime.fromisoformat(incorporacion["hasta"]),
+                    cursores=_cursores(incorporacion.get("cursores")),
+                ) if incorporacion else None,
+            )
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise TokenInvalido("Token de sincronización mal formado.") from e
+    if not valido:
+        raise TokenInvalido("Firma del token no válida.")
+    if token_json.get("alcance") != alcance:
+        raise TokenInvalido("El token no corresponde a esta sincronización.")
+    if token_json.get("v") != VERSION_TOKEN:
+        # Los tokens de la versión 1 no registran el panel ni las fechas de
+        # modificación de diagnósticos, medicamentos y egresos
+        raise TokenVencido("El token es de una versión anterior de la sincronización.")
+
+    # Las lápidas anteriores a la retención ya se depuraron: el cliente no
+    # sabría qué se eliminó desde entonces
+    if hasta < datetime.now(hasta.tzinfo) - timedelta(days=settings.SINCRONIZACION_RETENCION_DIAS):
+        raise TokenVencido("El token es anterior a la retención de eliminaciones.")
+    return estado
+
+
+def horizonte(db: Session) -> datetime:
+    return db.execute(
+        text("SELECT now() - make_interval(secs => :solape)"),
+        {"solape": settings.SINCRONIZACION_SOLAPE_SEGUNDOS},
+    ).scalar()
+
+
+def pagina(
+    db: Session,
+    entidad: Entidad,
+    filtro_documentos,
+    cursor: Optional[Tuple[str, str]],
+    hasta: datetime,
+    limite: int,
+) -> Tuple[List[Any], bool]:
+    """
+    Siguiente página de cambios de una entidad, en orden ``(fecha, id)``.
+
+    ``filtro_documentos`` es una condición sobre ``documento_id`` (igualdad
+    para un paciente, ``IN (subconsulta)`` para un panel). Devuelve las filas
+    y si quedan más.
+    """
+    modelo = entidad.modelo
+    fecha = getattr(modelo, entidad.fecha)
+    clave = getattr(modelo, entidad.clave)
+    query = db.query(modelo).options(*entidad.opciones).filter(filtro_documentos(modelo.documento_id), fecha < hasta)
+    if cursor is not None:
+        desde = datetime.fromisoformat(cursor[0])
+        query = query.filter(tuple_(fecha, clave) > tuple_(desde, entidad.convertir_clave(cursor[1])))
+    filas = query.order_by(fecha, clave).limit(limite + 1).all()
+    return filas[:limite], len(filas) > limite
+
+
+def cursor_de(entidad: Entidad, fila: Any) -> Tuple[str, str]:
+    return getattr(fila, entidad.fecha).isoformat(), str(getattr(fila, entidad.clave))
+
+
+def recorrer(
+    db: Session,
+    entidades: Tuple[Entidad, ...],
+    filtro_documentos,
+    cursores: Cursores,
+    hasta: datetime,
+    limite: int,
+) -> Tuple[Dict[str, List[Any]], bool]:
+    """Una página de cada entidad; avanza ``cursores`` y devuelve las filas y si quedan más."""
+    filas_por_entidad = {}
+    hay_mas = False
+    for entidad in entidades:
+        filas, quedan = pagina(db, entidad, filtro_documentos, cursores.get(entidad.nombre), hasta, limite)
+        if filas:
+            cursores[entidad.nombre] = cursor_de(entidad, filas[-1])
+        filas_por_entidad[entidad.nombre] = filas
+        hay_mas = hay_mas or quedan
+    return filas_por_entidad, hay_mas
+
+
+def depurar_eliminaciones(db: Session) -> int:
+    """Elimina las lápidas más antiguas que la retención. Devuelve cuántas se borraron."""
+    borradas = db.query(models.SyncEliminacion).filter(
+        models.SyncEliminacion.eliminado_en
+        < text(f"now() - INTERVAL '{int(settings.SINCRONIZACION_RETENCION_DIAS)} days'")
+    ).delete(synchronize_session=False)
+    db.commit()
+    return borradas
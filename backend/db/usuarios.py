@@ -0,0 +1,180 @@
+"""
+Acceso a usuarios por correo y creación de pacientes en una sola sentencia.
+
+``hcd.usuario`` está distribuida por ``documento_id``; ``hcd.usuario_correo``
+(distribuida por ``correo``) resuelve el correo a su documento con una
+consulta a un único shard y es la que garantiza la unicidad del correo.
+"""
+
+from typing import List, Optional
+
+from sqlalchemy import literal, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.db import models, shards
+
+# Proyección demográfica para consultas por lote (sin contraseña ni datos clínicos)
+COLUMNAS_DEMOGRAFICAS = (
+    "documento_id", "tipo_documento", "primer_apellido", "segundo_apellido",
+    "primer_nombre", "segundo_nombre", "fecha_nacimiento", "sexo", "genero",
+    "municipio_ciudad", "departamento", "telefono", "celular", "correo_electronico",
+    "entidad_afiliacion", "regimen_afiliacion",
+)
+
+_COLUMNAS_SQL = ", ".join(f"u.{c}" for c in COLUMNAS_DEMOGRAFICAS)
+
+_LOTE_PACIENTES = text(
+    f"""
+    SELECT {_COLUMNAS_SQL}
+    FROM hcd.usuario u
+    WHERE u.documento_id = ANY(CAST(:ids AS bigint[]))
+    """
+)
+
+# LATERAL sobre atencion (co-localizada): sigue siendo una consulta de un solo shard
+_LOTE_PACIENTES_ULTIMA_ATENCION = text(
+    f"""
+    SELECT {_COLUMNAS_SQL},
+           ua.atencion_id AS ua_atencion_id,
+           ua.fecha_hora_atencion AS ua_fecha_hora_atencion,
+           ua.tipo_atencion AS ua_tipo_atencion,
+           ua.estado_egreso AS ua_estado_egreso
+    FROM hcd.usuario u
+    LEFT JOIN LATERAL (
+        SELECT a.atencion_id, a.fecha_hora_atencion, a.tipo_atencion, a.estado_egreso
+        FROM hcd.atencion a
+        WHERE a.documento_id = u.documento_id
+        ORDER BY a.fecha_hora_atencion DESC
+        LIMIT 1
+    ) ua ON true
+    WHERE u.documento_id = ANY(CAST(:ids AS bigint[]))
+    """
+)
+
+
+def documento_por_correo(db: Session, correo: str) -> Optional[int]:
+    return db.query(models.UsuarioCorreo.documento_id).filter(
+        models.UsuarioCorreo.correo == correo
+    ).scalar()
+
+
+def buscar_por_correo(db: Session, correo: str, query=None) -> Optional[models.Usuario]:
+    """
+    Usuario con ese correo: índice de correos y luego lectura por PK (dos
+    consultas a un shard cada una). Un correo que no está en el índice no
+    existe: no se busca en todos los shards, ni siquiera para los datos
+    anteriores al índice (se llenan una vez al migrar, ver README).
+    """
+    documento_id = documento_por_correo(db, correo)
+    if documento_id is None:
+        return None
+    query = query if query is not None else db.query(models.Usuario)
+    usuario = query.filter(models.Usuario.documento_id == documento_id).first()
+    if usuario is None or usuario.correo_electronico != correo:
+        return None
+    return usuario
+
+
+def registrar_correo(db: Session, correo: str, documento_id: int) -> None:
+    """Agrega el correo al índice si no estaba (sin confirmar)."""
+    db.execute(
+        insert(models.UsuarioCorreo)
+        .values(correo=correo, documento_id=documento_id)
+        .on_conflict_do_nothing(index_elements=["correo"])
+    )
+
+
+def cambiar_correo(db: Session, documento_id: int, anterior: Optional[str], nuevo: Optional[str]) -> bool:
+    """
+    Mueve el índice al nuevo correo dentro de la transacción del llamador.
+
+    Returns:
+        False si el nuevo correo ya pertenece a otro usuario.
+    """
+    if anterior == nuevo:
+        return True
+    if nuevo:
+        fila = db.execute(
+            insert(models.UsuarioCorreo)
+            .values(correo=nuevo, documento_id=documento_id)
+            .on_conflict_do_nothing(index_elements=["correo"])
+            .returning(models.UsuarioCorreo.documento_id)
+        ).first()
+        if fila is None and documento_por_correo(db, nuevo) != documento_id:
+            return False
+    if anterior:
+        db.query(models.UsuarioCorreo).filter(
+            models.UsuarioCorreo.correo == anterior,
+            models.UsuarioCorreo.documento_id == documento_id,
+        ).delete(synchronize_session=False)
+    return True
+
+
+def crear_usuario(db: Session, datos: dict) -> Optional[dict]:
+    """
+    Inserta el usuario y su correo en una sola sentencia (un viaje al coordinador):
+
+        WITH correo AS (INSERT INTO usuario_correo ... ON CONFLICT DO NOTHING RETURNING ...)
+        INSERT INTO usuario SELECT ... FROM correo ON CONFLICT DO NOTHING RETURNING *
+
+    Si el correo ya existe el CTE no devuelve filas y no se inserta el usuario.
+    No confirma la transacción.
+
+    Returns:
+        La fila creada, o None si hubo conflicto por documento o correo; en ese
+        caso el llamador debe hacer rollback (el correo pudo quedar insertado).
+    """
+    tabla = models.Usuario.__table__
+    columnas = [c for c in tabla.columns if c.name in datos]
+    correo = datos.get("correo_electronico")
+
+    if correo:
+        cte = (
+            insert(models.UsuarioCorreo)
+            .values(correo=correo, documento_id=datos["documento_id"])
+            .on_conflict_do_nothing(index_elements=["correo"])
+            .returning(models.UsuarioCorreo.documento_id)
+            .cte("correo")
+        )
+        origen = select(*[literal(datos[c.name], type_=c.type) for c in columnas]).select_from(cte)
+        sentencia = insert(tabla).from_select([c.name for c in columnas], origen)
+    else:
+        sentencia = insert(tabla).values({c.name: datos[c.name] for c in columnas})
+
+    sentencia = sentencia.on_conflict_do_nothing(index_elements=["documento_id"]).returning(*tabla.columns)
+    fila = db.execute(sentencia).mappings().first()
+    return dict(fila) if fila is not None else None
+
+
+def motivo_conflicto(db: Session, documento_id: int, correo: Optional[str]) -> str:
+    """Mensaje para un ``crear_usuario`` fallido (solo se consulta en el camino de error)."""
+    if db.query(models.Usuario.documento_id).filter(models.Usuario.documento_id == documento_id).first():
+        return "Ya existe un paciente con este documento."
+    if correo and documento_por_correo(db, correo) is not None:
+        return "Ya existe un paciente con este correo."
+    return "Error de integridad al guardar."
+
+
+def buscar_lote(
+    db: Session, documento_ids: List[int], incluir_ultima_atencion: bool, paralelismo: int, milisegundos: int
+) -> List[dict]:
+    """
+    Datos demográficos de varios pacientes, con una consulta por shard.
+
+    Con ``incluir_ultima_atencion`` cada fila trae ``ultima_atencion`` (datos
+    administrativos de la atención más reciente, o None).
+    """
+    sentencia = _LOTE_PACIENTES_ULTIMA_ATENCION if incluir_ultima_atencion else _LOTE_PACIENTES
+
+    def consultar(sesion: Session, ids: List[int]) -> List[dict]:
+        return [dict(f) for f in sesion.execute(sentencia, {"ids": ids}).mappings()]
+
+    grupos = shards.agrupar_por_shard(db, "hcd.usuario", documento_ids)
+    filas = shards.ejecutar_por_shard(db, grupos, consultar, paralelismo, milisegundos)
+
+    if incluir_ultima_atencion:
+        for fila in filas:
+            atencion = {k[3:]: fila.pop(k) for k in list(fila) if k.startswith("ua_")}
+            fila["ultima_atencion"] = atencion if atencion["atencion_id"] is not None else None
+    return filas
@@ -0,0 +1,59 @@
+"""
+Versión de la historia de un paciente para validadores HTTP y cachés.
+
+Una sola consulta con filtro por ``documento_id`` en ``usuario`` y
+``atencion`` (co-localizadas), que Citus enruta a un único shard y resuelve
+con la PK y el índice ``(documento_id, fecha_hora_atencion)``, sin leer las
+columnas de texto de las atenciones.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+_VERSION_PACIENTE = text(
+    """
+    SELECT u.updated_at AS usuario_actualizado,
+           a.atenciones_actualizado,
+           COALESCE(a.atenciones, 0) AS atenciones
+    FROM hcd.usuario u
+    LEFT JOIN (
+        SELECT documento_id, max(updated_at) AS atenciones_actualizado, count(*) AS atenciones
+        FROM hcd.atencion
+        WHERE documento_id = :documento_id
+        GROUP BY documento_id
+    ) a ON a.documento_id = u.documento_id
+    WHERE u.documento_id = :documento_id
+    """
+)
+
+
+@dataclass(frozen=True)
+class VersionPaciente:
+    usuario_actualizado: Optional[datetime]
+    atenciones_actualizado: Optional[datetime]
+    atenciones: int
+
+    @property
+    def ultima_modificacion(self) -> Optional[datetime]:
+        fechas = [f for f in (self.usuario_actualizado, self.atenciones_actualizado) if f]
+        return max(fechas) if fechas else None
+
+    def partes(self) -> tuple:
+        """Componentes que identifican la versión (el conteo detecta borrados)."""
+        return (self.usuario_actualizado, self.atenciones_actualizado, self.atenciones)
+
+
+def version_paciente(db: Session, documento_id: int) -> Optional[VersionPaciente]:
+    """Versión actual del paciente, o None si no existe."""
+    fila = db.execute(_VERSION_PACIENTE, {"documento_id": documento_id}).mappings().first()
+    if fila is None:
+        return None
+    return VersionPaciente(
+        usuario_actualizado=fila["usuario_actualizado"],
+        atenciones_actualizado=fila["atenciones_actualizado"],
+        atenciones=int(fila["atenciones"]),
+    )
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, ConfigDict, Field
 from datetime import date, datetime
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
+import uuid
 
 # Esquema para una atención médica
 class Atencion(BaseModel):
@@ -23,6 +24,37 @@ class Atencion(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+# Atención en listados (historia del paciente): sin el texto clínico, que se
+# pide por atención con el endpoint de detalle
+class AtencionResumen(BaseModel):
+    atencion_id: Any
+    fecha_hora_atencion: datetime
+    tipo_atencion: Optional[str] = None
+    motivo_consulta: Optional[str] = None
+    impresion_diagnostica: Optional[str] = None
+    codigos_cie10: Optional[List[str]] = None
+    estado_egreso: Optional[str] = None
+    profesional_responsable_nombre: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+# Atención completa, con todas las secciones de la historia clínica
+class AtencionDetalle(Atencion):
+    documento_id: int
+    habitos: Optional[Any] = None
+    recomendaciones_paciente: Optional[str] = None
+    medicos_interconsultados: Optional[str] = None
+    procedimientos_realizados: Optional[str] = None
+    resultados_paraclinicos: Optional[Any] = None
+    diagnostico_definitivo: Optional[str] = None
+    evolucion_medica: Optional[str] = None
+    tratamiento_instaurado: Optional[str] = None
+    formulacion_medica: Optional[Any] = None
+    educacion_consejeria: Optional[str] = None
+    referencia_contrarreferencia: Optional[str] = None
+    estado_egreso: Optional[str] = None
+    fecha_hora_cierre: Optional[datetime] = None
+
 # Esquema para la creación de una nueva atención
 class AtencionCreate(BaseModel):
     documento_id: int
@@ -75,7 +107,7 @@ class UsuarioCreate(UsuarioBase):
 
 # Esquema completo para el usuario (para respuestas de API, sin contraseña hash)
 class Usuario(UsuarioBase):
-    atenciones: List[Atencion] = []
+    atenciones: List[AtencionResumen] = []
 
 # Esquema para la actualización de un usuario existente (todos los campos son opcionales)
 class UsuarioUpdate(BaseModel):
@@ -103,6 +135,242 @@ class UsuarioUpdate(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+# Esquemas para consultas epidemiológicas CIE-10
+class PacienteCie10(BaseModel):
+    documento_id: int
+    tipo_documento: Optional[str] = None
+    primer_nombre: Optional[str] = None
+    primer_apellido: Optional[str] = None
+    fecha_nacimiento: Optional[date] = None
+    sexo: Optional[str] = None
+    municipio_ciudad: Optional[str] = None
+    atenciones: int
+    ultima_atencion: datetime
+    codigos: List[str] = []
+
+class FrecuenciaCie10(BaseModel):
+    codigo: str
+    atenciones: int
+    pacientes: int
+
+# Esquema para reportes sobre rollups
+class ReporteAtenciones(BaseModel):
+    actualizado_hasta: Optional[datetime] = None
+    agrupado_por: List[str]
+    filas: List[Dict[str, Any]]
+
+# Esquemas para la consulta de pacientes por lote
+class ConsultaLotePacientes(BaseModel):
+    documento_ids: List[int] = Field(..., min_length=1, max_length=500)
+    incluir_ultima_atencion: bool = False
+
+class UltimaAtencionLote(BaseModel):
+    atencion_id: Any
+    fecha_hora_atencion: datetime
+    tipo_atencion: Optional[str] = None
+    estado_egreso: Optional[str] = None
+
+class PacienteLote(BaseModel):
+    documento_id: int
+    tipo_documento: Optional[str] = None
+    primer_apellido: Optional[str] = None
+    segundo_apellido: Optional[str] = None
+    primer_nombre: Optional[str] = None
+    segundo_nombre: Optional[str] = None
+    fecha_nacimiento: Optional[date] = None
+    edad: Optional[int] = None
+    sexo: Optional[str] = None
+    genero: Optional[str] = None
+    municipio_ciudad: Optional[str] = None
+    departamento: Optional[str] = None
+    telefono: Optional[str] = None
+    celular: Optional[str] = None
+    correo_electronico: Optional[str] = None
+    entidad_afiliacion: Optional[str] = None
+    regimen_afiliacion: Optional[str] = None
+    ultima_atencion: Optional[UltimaAtencionLote] = None
+
+class ResultadoLotePacientes(BaseModel):
+    pacientes: List[PacienteLote]
+    no_encontrados: List[int]
+
+# Esquema para la búsqueda de texto completo en atenciones
+class ResultadoBusquedaAtencion(BaseModel):
+    documento_id: int
+    atencion_id: Any
+    fecha_hora_atencion: datetime
+    tipo_atencion: Optional[str] = None
+    motivo_consulta: Optional[str] = None
+    paciente_nombre: Optional[str] = None
+    relevancia: float
+    fragmento: Optional[str] = None  # HTML escapado con coincidencias en <mark>
+
+# Esquemas para la tendencia de signos vitales
+class PuntoTendencia(BaseModel):
+    fecha: datetime  # inicio del intervalo, o la medición si es la única
+    valor: float     # promedio del intervalo
+    minimo: float
+    maximo: float
+    n: int
+
+class TendenciaSignosVitales(BaseModel):
+    documento_id: int
+    desde: datetime
+    hasta: datetime
+    series: Dict[str, List[PuntoTendencia]]
+
+# Esquemas para el cierre de atenciones y el censo de atenciones abiertas
+class CierreAtencion(BaseModel):
+    estado_egreso: str = Field(..., min_length=1, max_length=80)
+    diagnostico_definitivo: Optional[str] = None
+    fecha_hora_cierre: Optional[datetime] = None  # Por defecto, el momento del cierre
+
+class AtencionAbierta(BaseModel):
+    atencion_id: Any
+    documento_id: int
+    paciente_nombre: Optional[str] = None
+    fecha_hora_atencion: datetime
+    tipo_atencion: Optional[str] = None
+    motivo_consulta: Optional[str] = None
+    profesional_responsable: Optional[Any] = None
+    profesional_nombre: Optional[str] = None
+
+class CensoAtencionesAbiertas(BaseModel):
+    total: int
+    por_tipo: Dict[str, int]
+    atenciones: List[AtencionAbierta]
+
+# Esquemas para la administración de medicamentos
+class AdministracionMedicamentoCreate(BaseModel):
+    administracion_id: Optional[uuid.UUID] = None  # Generado por el cliente: reenviar el lote no duplica dosis
+    tecnologia_id: uuid.UUID
+    unidades: int = Field(..., ge=1, le=10000)
+    administrado_en: Optional[datetime] = None  # Por defecto, el momento del registro
+    dosis: Optional[str] = Field(None, max_length=80)
+    via_administracion: Optional[str] = Field(None, max_length=80)
+    observaciones: Optional[str] = None
+
+class LoteAdministraciones(BaseModel):
+    administraciones: List[AdministracionMedicamentoCreate] = Field(..., min_length=1, max_length=200)
+
+class AdministracionMedicamento(BaseModel):
+    administracion_id: Any
+    documento_id: int
+    tecnologia_id: Any
+    administrado_en: datetime
+    unidades: int
+    dosis: Optional[str] = None
+    via_administracion: Optional[str] = None
+    observaciones: Optional[str] = None
+    responsable_registro: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class TotalMedicamento(BaseModel):
+    tecnologia_id: Any
+    unidades_aplicadas: int
+    administraciones: int
+    ultima_administracion: Optional[datetime] = None
+
+class ResultadoLoteAdministraciones(BaseModel):
+    registradas: int
+    repetidas: int  # administracion_id ya registrados (reintentos)
+    totales: List[TotalMedicamento]
+
+class MedicamentoPaciente(TotalMedicamento):
+    atencion_id: Any
+    descripcion_medicamento: Optional[str] = None
+    dosis: Optional[str] = None
+    via_administracion: Optional[str] = None
+    frecuencia: Optional[str] = None
+    dias_tratamiento: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+# Esquemas para la sincronización incremental
+class AtencionSync(Atencion):
+    documento_id: int
+    estado_egreso: Optional[str] = None
+    fecha_hora_cierre: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class DiagnosticoSync(BaseModel):
+    diagnostico_id: Any
+    documento_id: int
+    atencion_id: Any
+    tipo_diagnostico: Optional[str] = None
+    diagnostico_text: Optional[str] = None
+    codigo_cie10: Optional[str] = None
+    gravedad: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class MedicamentoSync(BaseModel):
+    tecnologia_id: Any
+    documento_id: int
+    atencion_id: Any
+    descripcion_medicamento: Optional[str] = None
+    dosis: Optional[str] = None
+    via_administracion: Optional[str] = None
+    frecuencia: Optional[str] = None
+    dias_tratamiento: Optional[int] = None
+    finalidad_tecnologia: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class EgresoSync(BaseModel):
+    egreso_id: Any
+    documento_id: int
+    atencion_id: Any
+    estado_egreso: Optional[str] = None
+    causas_egreso: Optional[str] = None
+    recomendaciones_al_egreso: Optional[str] = None
+    fecha_egreso: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class AdministracionSync(AdministracionMedicamento):
+    created_at: datetime
+
+class EliminacionSync(BaseModel):
+    documento_id: int
+    entidad: str      # usuarios, atenciones, diagnosticos, medicamentos, administraciones o egresos
+    entidad_id: str
+    eliminado_en: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CambiosSincronizacion(BaseModel):
+    usuarios: List[UsuarioBase] = []
+    atenciones: List[AtencionSync] = []
+    diagnosticos: List[DiagnosticoSync] = []
+    medicamentos: List[MedicamentoSync] = []
+    administraciones: List[AdministracionSync] = []
+    egresos: List[EgresoSync] = []
+    eliminaciones: List[EliminacionSync] = []
+    token: str        # enviar en la siguiente llamada
+    hay_mas: bool     # True: pedir otra página de inmediato con el nuevo token
+
+# Esquema para el informe de auditoría de accesos
+class AccesoAuditoria(BaseModel):
+    documento_id: int
+    accedido_en: datetime
+    accion: str
+    usuario_documento_id: Optional[int] = None
+    usuario_correo: Optional[str] = None
+    usuario_rol: Optional[str] = None
+    recurso: Optional[str] = None
+    ip: Optional[str] = None
+    agente_usuario: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
 # Esquema para el token de autenticación
 class Token(BaseModel):
     access_token: str
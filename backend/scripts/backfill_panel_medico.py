@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Script para llenar hcd.panel_medico con las atenciones ya registradas.
+
+crear_atencion agrega el paciente al panel del médico; este script incorpora
+las atenciones anteriores a la tabla o cargadas por SQL. Se puede ejecutar
+varias veces (ON CONFLICT DO NOTHING).
+
+Uso:
+- Todos los usuarios médicos:
+    python3 backend/scripts/backfill_panel_medico.py
+- Un solo médico:
+    python3 backend/scripts/backfill_panel_medico.py --medico 2000000001
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from backend.db.session import SessionLocal
+from backend.db import models, panel
+
+
+def main():
+    """Incorpora al panel de cada médico los pacientes de sus atenciones históricas."""
+    parser = argparse.ArgumentParser(description="Llena hcd.panel_medico desde hcd.atencion.")
+    parser.add_argument("--medico", type=int, help="documento_id del usuario médico.")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        consulta = db.query(models.Usuario).filter(models.Usuario.tipo_usuario == "medico")
+        if args.medico is not None:
+            consulta = consulta.filter(models.Usuario.documento_id == args.medico)
+        medicos = consulta.all()
+        if not medicos:
+            print("✗ No hay usuarios médicos para procesar")
+            return False
+
+        for medico in medicos:
+            nuevos = panel.incorporar_historico(db, medico)
+            db.commit()
+            aviso = "" if panel.nombre_unico(db, medico) else " (nombre homónimo: solo por profesional_responsable)"
+            print(f"✓ {panel.nombre_registro(medico)} ({medico.documento_id}): {nuevos} pacientes agregados{aviso}")
+        return True
+
+    except Exception as e:
+        print(f"✗ Error al llenar el panel de los médicos: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Script para llenar hcd.signo_vital con las atenciones registradas antes de la
+extracción al escribir.
+
+Recorre las atenciones en orden de fecha con un cursor de servidor, extrae los
+signos de cada una y los inserta por lotes con ON CONFLICT DO NOTHING, así que
+puede interrumpirse y volver a ejecutarse.
+
+Uso:
+    python3 backend/scripts/backfill_signos_vitales.py
+    python3 backend/scripts/backfill_signos_vitales.py --desde 2024-01-01 --lote 2000
+"""
+
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from backend.db.session import SessionLocal
+from backend.db import models, serie_signos
+from backend.core import signos_vitales
+
+
+def main():
+    """Extrae los signos vitales de las atenciones existentes."""
+    parser = argparse.ArgumentParser(description="Llena la serie de signos vitales desde las atenciones.")
+    parser.add_argument("--desde", type=date.fromisoformat, help="Solo atenciones desde esta fecha (AAAA-MM-DD).")
+    parser.add_argument("--lote", type=int, default=1000, help="Filas por INSERT.")
+    args = parser.parse_args()
+
+    lectura = SessionLocal()
+    escritura = SessionLocal()
+    try:
+        query = lectura.query(
+            models.Atencion.documento_id,
+            models.Atencion.atencion_id,
+            models.Atencion.fecha_hora_atencion,
+            models.Atencion.signos_vitales,
+        ).filter(models.Atencion.signos_vitales.isnot(None))
+        if args.desde:
+            query = query.filter(models.Atencion.fecha_hora_atencion >= args.desde)
+        query = query.order_by(models.Atencion.fecha_hora_atencion).execution_options(yield_per=args.lote)
+
+        leidas = insertadas = 0
+        pendientes = []
+        for fila in query:
+            leidas += 1
+            valores = signos_vitales.extraer(fila.signos_vitales)
+            if valores is None:
+                continue
+            pendientes.append({
+                "documento_id": fila.documento_id,
+                "atencion_id": fila.atencion_id,
+                "medido_en": fila.fecha_hora_atencion,
+                **valores,
+            })
+            if len(pendientes) >= args.lote:
+                insertadas += serie_signos.insertar_lote(escritura, pendientes)
+                escritura.commit()
+                pendientes = []
+                print(f"  {leidas} atenciones leídas, {insertadas} filas nuevas")
+
+        insertadas += serie_signos.insertar_lote(escritura, pendientes)
+        escritura.commit()
+
+        print(f"✓ Serie de signos vitales actualizada")
+        print(f"  Atenciones leídas: {leidas}")
+        print(f"  Filas nuevas: {insertadas}")
+        return True
+
+    except Exception as e:
+        print(f"✗ Error al llenar la serie de signos vitales: {e}")
+        escritura.rollback()
+        return False
+    finally:
+        lectura.close()
+        escritura.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark del almacenamiento particionado de atenciones.
+
+Reporta:
+1. Tamaño en disco (sumado en todos los shards) por tabla y método de acceso
+   (heap vs columnar), junto con bytes por fila para comparar la compresión.
+2. Latencia de la consulta de historia clínica completa y de la historia
+   reciente (últimos 90 días, con poda de particiones) para una muestra de
+   pacientes.
+
+Uso:
+    python3 backend/scripts/benchmark_particiones.py --pacientes 20 --repeticiones 5
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from sqlalchemy import text
+
+from backend.db.session import SessionLocal
+from backend.db import particiones
+
+CONSULTA_HISTORIA = text(
+    """
+    SELECT * FROM hcd.atencion
+    WHERE documento_id = :documento_id
+    ORDER BY fecha_hora_atencion DESC
+    """
+)
+
+CONSULTA_RECIENTE = text(
+    """
+    SELECT * FROM hcd.atencion
+    WHERE documento_id = :documento_id
+      AND fecha_hora_atencion >= now() - INTERVAL '90 days'
+    ORDER BY fecha_hora_atencion DESC
+    """
+)
+
+
+def _formatear_bytes(valor):
+    for unidad in ("B", "KB", "MB", "GB"):
+        if valor < 1024:
+            return f"{valor:.1f} {unidad}"
+        valor /= 1024
+    return f"{valor:.1f} TB"
+
+
+def reportar_almacenamiento(db):
+    """Imprime tamaño y bytes por fila agrupados por tabla y método de acceso."""
+    print("Almacenamiento por método de acceso")
+    print("-" * 60)
+    for tabla in (particiones.TABLA_ATENCION,) + particiones.TABLAS_HIJAS:
+        totales = {}
+        for particion in particiones.listar_particiones(db, tabla):
+            tamano, filas = db.execute(
+                text(
+                    f"SELECT citus_total_relation_size(CAST(:p AS regclass)), "
+                    f"(SELECT count(*) FROM {particion['particion']})"
+                ),
+                {"p": particion["particion"]},
+            ).one()
+            acumulado = totales.setdefault(particion["access_method"], [0, 0, 0])
+            acumulado[0] += 1
+            acumulado[1] += tamano
+            acumulado[2] += filas
+
+        for metodo, (cantidad, tamano, filas) in sorted(totales.items()):
+            por_fila = f"{tamano / filas:.0f} B/fila" if filas else "sin filas"
+            print(f"  {tabla:<24} {metodo:<9} {cantidad:>3} particiones  "
+                  f"{_formatear_bytes(tamano):>10}  {filas:>9} filas  {por_fila}")
+    print()
+
+
+def medir_latencia(db, nombre, consulta, documentos, repeticiones):
+    """Ejecuta la consulta para cada paciente y reporta percentiles en ms."""
+    tiempos = []
+    for documento_id in documentos:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            db.execute(consulta, {"documento_id": documento_id}).fetchall()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    tiempos.sort()
+    p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+    print(f"  {nombre:<20} n={len(tiempos):<5} p50={statistics.median(tiempos):7.2f} ms  "
+          f"p95={p95:7.2f} ms  max={tiempos[-1]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de particiones de atenciones.")
+    parser.add_argument("--pacientes", type=int, default=20, help="Pacientes de la muestra (los de más atenciones).")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print("=" * 60)
+        print("BENCHMARK DE PARTICIONES DE ATENCIÓN")
+        print("=" * 60)
+        print()
+        reportar_almacenamiento(db)
+
+        documentos = db.execute(
+            text(
+                """
+                SELECT documento_id FROM hcd.atencion
+                GROUP BY documento_id
+                ORDER BY count(*) DESC
+                LIMIT :limite
+                """
+            ),
+            {"limite": args.pacientes},
+        ).scalars().all()
+        if not documentos:
+            print("✗ No hay atenciones para medir latencia")
+            return False
+
+        print(f"Latencia de consultas de historia ({len(documentos)} pacientes)")
+        print("-" * 60)
+        medir_latencia(db, "historia completa", CONSULTA_HISTORIA, documentos, args.repeticiones)
+        medir_latencia(db, "últimos 90 días", CONSULTA_RECIENTE, documentos, args.repeticiones)
+        return True
+
+    except Exception as e:
+        print(f"✗ Error en el benchmark: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark de throughput del middleware (un proceso vs. varios workers).
+
+Lanza ``--concurrencia`` clientes durante ``--duracion`` segundos contra un
+escenario y reporta peticiones por segundo, latencias (p50/p95/p99) y errores.
+Solo usa la biblioteca estándar, para poder ejecutarse desde cualquier equipo.
+
+Escenarios:
+    login     POST /token (dominado por Argon2, CPU)
+    historia  GET /api/pacientes/{documento_id} (BD + serialización)
+    pdf       GET /exportar_pdf/{documento_id} (WeasyPrint, CPU)
+    hash      GET /hash-password/{password} (Argon2, CPU, sin BD ni sesión)
+
+Uso:
+    python3 backend/scripts/benchmark_servidor.py --url http://localhost:8000 \\
+        --escenario historia --documento-id 1001 --concurrencia 16 --duracion 30
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def iniciar_sesion(url, correo, password):
+    """Devuelve la cookie de sesión (hce_access_token=...)."""
+    datos = urllib.parse.urlencode({"username": correo, "password": password}).encode()
+    with urllib.request.urlopen(urllib.request.Request(f"{url}/token", data=datos), timeout=30) as r:
+        for cabecera in r.headers.get_all("Set-Cookie") or []:
+            if cabecera.startswith("hce_access_token="):
+                return cabecera.split(";", 1)[0]
+    raise RuntimeError("El login no devolvió la cookie hce_access_token")
+
+
+def construir_peticion(args, cookie):
+    if args.escenario == "login":
+        datos = urllib.parse.urlencode({"username": args.correo, "password": args.password}).encode()
+        return lambda: urllib.request.Request(f"{args.url}/token", data=datos)
+    if args.escenario == "hash":
+        ruta = f"/hash-password/{urllib.parse.quote(args.password)}"
+        return lambda: urllib.request.Request(f"{args.url}{ruta}", headers={"Accept-Encoding": "identity"})
+    ruta = {
+        "historia": f"/api/pacientes/{args.documento_id}",
+        "pdf": f"/exportar_pdf/{args.documento_id}",
+    }[args.escenario]
+    cabeceras = {"Cookie": cookie, "Accept-Encoding": "identity"}
+    return lambda: urllib.request.Request(f"{args.url}{ruta}", headers=cabeceras)
+
+
+def cliente(nueva_peticion, fin, latencias, errores, candado):
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(nueva_peticion(), timeout=120) as r:
+                r.read()
+            duracion = time.perf_counter() - inicio
+            with candado:
+                latencias.append(duracion)
+        except (urllib.error.URLError, OSError):
+            with candado:
+                errores[0] += 1
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de throughput del middleware HCE")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--escenario", choices=["login", "historia", "pdf", "hash"], default="historia")
+    parser.add_argument("--documento-id", type=int, default=1001)
+    parser.add_argument("--correo", default="medico@hce.com")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--duracion", type=int, default=30, help="Segundos de medición")
+    parser.add_argument("--calentamiento", type=int, default=5, help="Segundos previos sin medir")
+    args = parser.parse_args()
+
+    cookie = None if args.escenario in ("login", "hash") else iniciar_sesion(args.url, args.correo, args.password)
+    nueva_peticion = construir_peticion(args, cookie)
+
+    for fase, segundos in (("calentamiento", args.calentamiento), ("medición", args.duracion)):
+        latencias, errores, candado = [], [0], threading.Lock()
+        fin = time.perf_counter() + segundos
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+            for _ in range(args.concurrencia):
+                pool.submit(cliente, nueva_peticion, fin, latencias, errores, candado)
+        transcurrido = time.perf_counter() - inicio
+
+    print(f"Escenario: {args.escenario}  URL: {args.url}  Concurrencia: {args.concurrencia}")
+    print("-" * 60)
+    print(f"  Peticiones OK : {len(latencias)}  ({len(latencias) / transcurrido:.1f} req/s)")
+    print(f"  Errores       : {errores[0]}")
+    if latencias:
+        print(f"  Latencia media: {statistics.mean(latencias) * 1000:.1f} ms")
+        for p in (50, 95, 99):
+            print(f"  p{p:<13}: {percentil(latencias, p) * 1000:.1f} ms")
+    return 0 if latencias else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Administración del clúster Citus: agregar workers, rebalancear los shards de
+hcd y verificar las tablas de referencia.
+
+Uso:
+- Estado (workers, shards por worker y desbalance):
+    python3 backend/scripts/citus_cluster.py estado
+- Registrar workers nuevos tras escalar el StatefulSet a 4 réplicas:
+    python3 backend/scripts/citus_cluster.py agregar --statefulset 4
+    python3 backend/scripts/citus_cluster.py agregar --host 10.0.0.7 --puerto 5432
+- Ver el plan y rebalancear en línea mostrando el progreso:
+    python3 backend/scripts/citus_cluster.py rebalancear --simular
+    python3 backend/scripts/citus_cluster.py rebalancear
+- Verificar que las tablas de referencia (profesional_salud) están en todos los nodos:
+    python3 backend/scripts/citus_cluster.py verificar-referencias --reparar
+"""
+
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from backend.db.session import SessionLocal
+from backend.db import cluster
+
+# Tablas de referencia que la aplicación necesita en cada nodo
+REFERENCIAS_REQUERIDAS = ("hcd.profesional_salud",)
+
+ESTADOS_MOVIMIENTO = {0: "en espera", 1: "moviendo", 2: "terminados"}
+
+
+def mostrar_distribucion(db) -> None:
+    filas = cluster.distribucion(db)
+    print("  Worker                                              Shards        MB")
+    for fila in filas:
+        nodo = f"{fila['nodename']}:{fila['nodeport']}"
+        print(f"  {nodo:<50} {fila['shards']:>7} {fila['bytes'] / 1024 / 1024:>9.1f}")
+    for campo, nombre in (("shards", "shards"), ("bytes", "tamaño")):
+        valor = cluster.desbalance(filas, campo)
+        if valor is not None:
+            print(f"  Desbalance por {nombre}: {valor:.2f} (máximo / promedio; 1.00 = uniforme)")
+
+
+def verificar_referencias(db, reparar: bool, modo: str) -> bool:
+    existentes = set(cluster.tablas_referencia(db))
+    correcto = True
+    for tabla in REFERENCIAS_REQUERIDAS:
+        if tabla not in existentes:
+            print(f"✗ {tabla} no es tabla de referencia")
+            correcto = False
+    for tabla in sorted(existentes):
+        faltantes = cluster.nodos_sin_copia(db, tabla)
+        if faltantes:
+            print(f"✗ {tabla} sin copia en: {', '.join(faltantes)}")
+            correcto = False
+        else:
+            print(f"✓ {tabla} replicada en todos los nodos")
+
+    if not correcto and reparar:
+        print("Replicando tablas de referencia...")
+        cluster.replicar_referencias(db, modo)
+        return verificar_referencias(db, reparar=False, modo=modo)
+    return correcto
+
+
+def informar_progreso(progreso) -> None:
+    conteo = Counter(ESTADOS_MOVIMIENTO.get(fila["progress"], "otros") for fila in progreso)
+    moviendo = [f"{f['shardid']} ({f['sourcename']} → {f['targetname']})" for f in progreso if f["progress"] == 1]
+    resumen = ", ".join(f"{n} {estado}" for estado, n in conteo.items())
+    print(f"  Movimientos: {resumen}" + (f" | en curso: {', '.join(moviendo)}" if moviendo else ""))
+
+
+def main():
+    """Ejecuta el subcomando indicado contra el coordinador."""
+    parser = argparse.ArgumentParser(description="Administración del clúster Citus.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    subcomandos.add_parser("estado", help="Workers, shards por worker y desbalance.")
+
+    agregar = subcomandos.add_parser("agregar", help="Registra workers nuevos en el coordinador.")
+    agregar.add_argument("--statefulset", type=int, metavar="REPLICAS",
+                         help="Registra citus-worker-0 .. citus-worker-(REPLICAS-1).")
+    agregar.add_argument("--host", action="append", default=[], help="Host de un worker (repetible).")
+    agregar.add_argument("--puerto", type=int, default=5432)
+    agregar.add_argument("--rebalancear", action="store_true", help="Rebalancea al terminar.")
+
+    rebalancear = subcomandos.add_parser("rebalancear", help="Mueve shards de hcd a los workers menos cargados.")
+    rebalancear.add_argument("--simular", action="store_true", help="Solo muestra el plan de movimientos.")
+
+    referencias = subcomandos.add_parser("verificar-referencias", help="Comprueba las copias de las tablas de referencia.")
+    referencias.add_argument("--reparar", action="store_true", help="Replica las que falten.")
+
+    for sub in (agregar, rebalancear, referencias):
+        sub.add_argument("--modo-transferencia", choices=cluster.MODOS_TRANSFERENCIA, default="auto",
+                         help="auto o force_logical mantienen las escrituras durante el movimiento.")
+    for sub in (agregar, rebalancear):
+        sub.add_argument("--estrategia", choices=cluster.ESTRATEGIAS, default="by_disk_size")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.comando == "estado":
+            print("Nodos registrados:")
+            for nodo in cluster.nodos(db):
+                activo = "activo" if nodo["isactive"] else "inactivo"
+                print(f"  [{nodo['groupid']}] {nodo['nodename']}:{nodo['nodeport']} ({nodo['noderole']}, {activo})")
+            print("Distribución de shards de hcd:")
+            mostrar_distribucion(db)
+            return verificar_referencias(db, reparar=False, modo="auto")
+
+        if args.comando == "verificar-referencias":
+            return verificar_referencias(db, args.reparar, args.modo_transferencia)
+
+        if args.comando == "agregar":
+            hosts = list(args.host)
+            if args.statefulset:
+                hosts += [cluster.DNS_WORKER.format(indice=i) for i in range(args.statefulset)]
+            if not hosts:
+                print("✗ Indique --statefulset o --host")
+                return False
+            for host in hosts:
+                if cluster.agregar_worker(db, host, args.puerto):
+                    print(f"✓ Worker agregado: {host}:{args.puerto}")
+                else:
+                    print(f"  Ya registrado: {host}:{args.puerto}")
+            if not verificar_referencias(db, reparar=True, modo=args.modo_transferencia):
+                return False
+            if not args.rebalancear:
+                print("Los workers nuevos no tienen shards hasta rebalancear (subcomando 'rebalancear').")
+                return True
+
+        # rebalancear (o agregar --rebalancear)
+        print("Distribución antes del rebalanceo:")
+        mostrar_distribucion(db)
+        for tabla in cluster.grupos_hcd(db):
+            plan = cluster.plan_rebalanceo(db, tabla, args.estrategia)
+            print(f"Grupo de co-localización de {tabla}: {len(plan)} movimientos de shards")
+            if getattr(args, "simular", False):
+                for mov in plan:
+                    print(f"  shard {mov['shardid']} ({mov['table_name']}): "
+                          f"{mov['sourcename']}:{mov['sourceport']} → {mov['targetname']}:{mov['targetport']}")
+                continue
+            if plan:
+                db.commit()  # No retener la transacción de lectura durante el movimiento
+                cluster.rebalancear(tabla, args.estrategia, args.modo_transferencia, informar_progreso)
+                print(f"✓ Grupo de {tabla} rebalanceado")
+        if not getattr(args, "simular", False):
+            print("Distribución después del rebalanceo:")
+            mostrar_distribucion(db)
+        return True
+
+    except Exception as e:
+        print(f"✗ Error en la administración del clúster: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Script para crear un usuario de prueba con rol de ADMINISTRADOR
+(consulta la auditoría de accesos a las historias clínicas).
+
+Crea usuario administrador con credenciales:
+- Email: administrador@hce.com
+- Contraseña: password123
+- Documento: 4000000001
+- Rol: administrador
+"""
+
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from backend.db.session import SessionLocal
+from backend.db import models, usuarios
+from backend.core.security import get_password_hash
+
+
+def create_administrador_user():
+    """Crea un usuario administrador de prueba en la base de datos."""
+    db = SessionLocal()
+    
+    try:
+        # Verificar si el usuario ya existe
+        email = "administrador@hce.com"
+        existing = db.query(models.Usuario).filter(
+            models.Usuario.correo_electronico == email
+        ).first()
+        
+        if existing:
+            # Asegurar que el correo esté en el índice hcd.usuario_correo
+            usuarios.registrar_correo(db, existing.correo_electronico, existing.documento_id)
+            db.commit()
+            print(f"✓ Usuario {email} ya existe")
+            db.close()
+            return True
+        
+        # Crear nuevo usuario
+        administrador_user = models.Usuario(
+            documento_id=4000000001,
+            correo_electronico=email,
+            hashed_password=get_password_hash("password123"),
+            primer_nombre="Administrador",
+            primer_apellido="HCE",
+            tipo_usuario="administrador", # Rol específico
+        )
+        
+        db.add(administrador_user)
+        usuarios.registrar_correo(db, administrador_user.correo_electronico, administrador_user.documento_id)
+        db.commit()
+        
+        print("✓ Usuario ADMINISTRADOR de prueba creado exitosamente")
+        print(f"  Email: {email}")
+        print(f"  Contraseña: password123")
+        print(f"  Rol: administrador")
+        
+        db.close()
+        return True
+        
+    except Exception as e:
+        print(f"✗ Error al crear usuario administrador: {e}")
+        db.rollback()
+        db.close()
+        return False
+
+
+if __name__ == "__main__":
+    success = create_administrador_user()
+    sys.exit(0 if success else 1)
@@ -16,7 +16,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
 from backend.db.session import SessionLocal
-from backend.db import models
+from backend.db import models, usuarios
 from backend.core.security import get_password_hash
 
 
@@ -32,6 +32,9 @@ def create_admisionista_user():
         ).first()
         
         if existing:
+            # Asegurar que el correo esté en el índice hcd.usuario_correo
+            usuarios.registrar_correo(db, existing.correo_electronico, existing.documento_id)
+            db.commit()
             print(f"✓ Usuario {email} ya existe")
             db.close()
             return True
@@ -47,6 +50,7 @@ def create_admisionista_user():
         )
         
         db.add(admisionista_user)
+        usuarios.registrar_correo(db, admisionista_user.correo_electronico, admisionista_user.documento_id)
         db.commit()
         
         print("✓ Usuario ADMISIONISTA de prueba creado exitosamente")
@@ -16,7 +16,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
 from backend.db.session import SessionLocal
-from backend.db import models
+from backend.db import models, panel, usuarios
 from backend.core.security import get_password_hash
 
 
@@ -32,6 +32,10 @@ def create_medico_user():
         ).first()
         
         if existing:
+            # Asegurar que el correo esté en el índice hcd.usuario_correo
+            usuarios.registrar_correo(db, existing.correo_electronico, existing.documento_id)
+            panel.incorporar_historico(db, existing)
+            db.commit()
             print(f"✓ Usuario {email} ya existe")
             db.close()
             return True
@@ -47,6 +51,10 @@ def create_medico_user():
         )
         
         db.add(medico_user)
+        usuarios.registrar_correo(db, medico_user.correo_electronico, medico_user.documento_id)
+        db.flush()
+        # Pacientes de las atenciones de prueba ya cargadas a nombre del médico
+        panel.incorporar_historico(db, medico_user)
         db.commit()
         
         print("✓ Usuario MÉDICO de prueba creado exitosamente")
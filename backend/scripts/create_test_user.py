@@ -15,7 +15,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
 from backend.db.session import SessionLocal
-from backend.db import models
+from backend.db import models, usuarios
 from backend.core.security import get_password_hash
 
 
@@ -30,6 +30,9 @@ def create_test_user():
         ).first()
         
         if existing:
+            # Asegurar que el correo esté en el índice hcd.usuario_correo
+            usuarios.registrar_correo(db, existing.correo_electronico, existing.documento_id)
+            db.commit()
             print("✓ Usuario test@hce.com ya existe")
             print(f"  Documento: {existing.documento_id}")
             print(f"  Email: {existing.correo_electronico}")
@@ -47,6 +50,7 @@ def create_test_user():
         )
         
         db.add(test_user)
+        usuarios.registrar_correo(db, test_user.correo_electronico, test_user.documento_id)
         db.commit()
         
         print("✓ Usuario de prueba creado exitosamente")
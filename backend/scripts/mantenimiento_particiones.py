@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Script de mantenimiento de las particiones de atenciones.
+
+- Crea las particiones mensuales de los próximos PARTICION_MESES_FUTUROS meses.
+- Mueve a particiones mensuales las filas que cayeron en las particiones DEFAULT.
+- Informa las filas de diagnostico, tecnologia_salud y egreso sin atención.
+- Convierte a almacenamiento columnar las particiones cerradas con más de
+  PARTICION_MESES_COLUMNAR meses de antigüedad.
+- Depura las claves de idempotencia vencidas (IDEMPOTENCIA_RETENCION_HORAS).
+- Depura las lápidas de sincronización vencidas (SINCRONIZACION_RETENCION_DIAS).
+- Concilia el censo de atenciones abiertas con las atenciones (backend/db/censo.py).
+
+Lo ejecuta diariamente el CronJob infra/k8s/particiones-cronjob.yaml.
+
+Antes de borrar o corregir un paciente con historia en particiones columnares:
+    python3 backend/scripts/mantenimiento_particiones.py --descomprimir-paciente 1000000001
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from sqlalchemy import text
+
+from backend.core.config import settings
+from backend.db.session import SessionLocal
+from backend.db import particiones, idempotencia, sincronizacion, censo
+
+
+def main():
+    """Crea particiones futuras y comprime las antiguas."""
+    parser = argparse.ArgumentParser(description="Mantenimiento de particiones de atenciones.")
+    parser.add_argument("--meses-futuros", type=int, default=settings.PARTICION_MESES_FUTUROS)
+    parser.add_argument("--meses-columnar", type=int, default=settings.PARTICION_MESES_COLUMNAR)
+    parser.add_argument(
+        "--sin-compresion",
+        action="store_true",
+        help="Solo crea particiones futuras, sin convertir las antiguas a columnar.",
+    )
+    parser.add_argument(
+        "--descomprimir-paciente",
+        type=int,
+        action="append",
+        metavar="DOCUMENTO_ID",
+        help="Solo devuelve a heap las particiones columnares con filas del paciente, para poder "
+             "borrarlo o corregirlo (repetible). El mantenimiento siguiente las vuelve a comprimir.",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.descomprimir_paciente:
+            for documento_id in args.descomprimir_paciente:
+                convertidas = particiones.descomprimir_paciente(db, documento_id)
+                print(f"✓ Paciente {documento_id}: {len(convertidas)} particiones devueltas a heap")
+                for nombre in convertidas:
+                    print(f"  - {nombre}")
+            return True
+
+        particiones.crear_particiones_futuras(db, args.meses_futuros)
+        print(f"✓ Particiones garantizadas hasta {args.meses_futuros} meses adelante")
+        for tabla, filas in particiones.reubicar_default(db).items():
+            print(f"✓ {filas} filas de {tabla}_default movidas a particiones mensuales")
+        for tabla, filas in particiones.contar_huerfanas(db).items():
+            if filas:
+                print(f"[ADVERTENCIA] {tabla}: {filas} filas sin atención en hcd.atencion")
+
+        if not args.sin_compresion:
+            antes_de = db.execute(
+                text("SELECT date_trunc('month', now()) - make_interval(months => :meses)"),
+                {"meses": args.meses_columnar},
+            ).scalar()
+            db.commit()
+            convertidas = particiones.comprimir_particiones_antiguas(db, antes_de)
+            print(f"✓ Particiones convertidas a columnar: {len(convertidas)}")
+            for nombre in convertidas:
+                print(f"  - {nombre}")
+
+        print(f"✓ Claves de idempotencia vencidas eliminadas: {idempotencia.depurar(db)}")
+        print(f"✓ Lápidas de sincronización vencidas eliminadas: {sincronizacion.depurar_eliminaciones(db)}")
+        agregadas, eliminadas = censo.conciliar(db)
+        print(f"✓ Censo de atenciones abiertas conciliado ({agregadas} agregadas, {eliminadas} eliminadas)")
+        return True
+
+    except Exception as e:
+        print(f"✗ Error en el mantenimiento de particiones: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
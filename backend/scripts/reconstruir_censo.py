@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Script para conciliar el censo de atenciones abiertas (hcd.censo_atencion_abierta).
+
+Uso:
+- Conciliación (agrega las abiertas que faltan y quita las ya cerradas; el
+  mantenimiento diario la ejecuta también):
+    python3 backend/scripts/reconstruir_censo.py
+- Solo verificar, sin escribir (falla si hay diferencias):
+    python3 backend/scripts/reconstruir_censo.py --verificar
+- Reconstrucción completa (vacía el censo y lo vuelve a llenar):
+    python3 backend/scripts/reconstruir_censo.py --completo
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from backend.db.session import SessionLocal
+from backend.db import censo
+
+
+def main():
+    """Concilia, verifica o reconstruye el censo de atenciones abiertas."""
+    parser = argparse.ArgumentParser(description="Concilia el censo de atenciones abiertas.")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--verificar", action="store_true", help="Solo informa las diferencias.")
+    modo.add_argument("--completo", action="store_true", help="Vacía el censo y lo recalcula.")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.verificar:
+            faltantes, sobrantes = censo.diferencias(db)
+            if faltantes or sobrantes:
+                print(f"✗ Censo desfasado: {len(faltantes)} abiertas faltan, {len(sobrantes)} sobran")
+                return False
+            print("✓ El censo coincide con las atenciones abiertas")
+        elif args.completo:
+            print(f"✓ Censo reconstruido ({censo.reconstruir(db)} atenciones abiertas)")
+        else:
+            agregadas, eliminadas = censo.conciliar(db)
+            print(f"✓ Censo conciliado ({agregadas} agregadas, {eliminadas} eliminadas)")
+        return True
+
+    except Exception as e:
+        print(f"✗ Error al conciliar el censo: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Script para refrescar los rollups de atenciones usados por los reportes.
+
+Uso:
+- Refresco incremental (lo ejecuta el CronJob infra/k8s/rollup-cronjob.yaml):
+    python3 backend/scripts/rollup_atenciones.py
+- Backfill completo (recalcula los resúmenes desde el inicio y los reemplaza
+  al terminar; mientras tanto los reportes siguen viendo los anteriores):
+    python3 backend/scripts/rollup_atenciones.py --backfill
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from backend.db.session import SessionLocal
+from backend.db import rollups
+
+
+def main():
+    """Ejecuta el refresco incremental o el backfill de los rollups."""
+    parser = argparse.ArgumentParser(description="Refresca los rollups de atenciones.")
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Recalcula los rollups desde cero en lugar de continuar desde la marca de agua.",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.backfill:
+            print("Reconstruyendo rollups desde el inicio...")
+            ventanas = rollups.reconstruir(db)
+        else:
+            ventanas = rollups.refrescar(db)
+
+        print(f"✓ Rollups actualizados ({ventanas} ventanas procesadas)")
+        print(f"  Consolidado hasta: {rollups.obtener_marca(db)}")
+        return True
+
+    except Exception as e:
+        print(f"✗ Error al refrescar rollups: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Verificación del enrutamiento Citus de las consultas de cada endpoint.
+
+Ejecuta la aplicación en proceso (TestClient) contra una base Citus local,
+recorre los escenarios de ``escenarios()`` con los usuarios de prueba, captura
+cada sentencia SQL que emiten los endpoints (incluida la autenticación de
+security.py) y la clasifica con EXPLAIN:
+
+- local:        no toca tablas distribuidas (coordinador, tablas locales).
+- router:       un solo shard (o una tabla de referencia).
+- multi_shard:  se reparte entre varios shards.
+- subplanes:    Citus la resuelve en varios pasos (planificación recursiva).
+- repartition:  reparticiona datos entre workers o los trae al coordinador.
+
+La clase de un escenario es la peor de sus sentencias. El login (también con
+un correo que no existe) y los escenarios de DEBEN_SER_ROUTER tienen que ser
+``router`` siempre, tenga lo que tenga la línea base. Antes de conectarse,
+el script comprueba que cada ruta de la aplicación tenga al menos un
+escenario o figure en RUTAS_SIN_ESCENARIO con su motivo. Falla si una ruta
+queda sin cubrir, si un escenario no puede ejecutarse, si no tiene línea base
+en ``enrutamiento_base.json`` o si empeora respecto a ella. La línea base la
+genera este mismo script: ``--actualizar`` guarda las clases medidas.
+
+Requiere los usuarios de prueba (create_*_user.py) y escribe datos (una
+atención cerrada, un medicamento, una dosis y un paciente por ejecución): use
+una base de prueba, nunca la de producción.
+
+Uso:
+    python3 backend/scripts/verificar_enrutamiento.py
+    python3 backend/scripts/verificar_enrutamiento.py --detalle
+    python3 backend/scripts/verificar_enrutamiento.py --actualizar
+"""
+
+import argparse
+import fnmatch
+import json
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from sqlalchemy import event
+
+from backend.core.config import settings
+from backend.db import models, outbox
+from backend.db.session import SessionLocal, engine
+
+LINEA_BASE = Path(__file__).resolve().parent / "enrutamiento_base.json"
+
+CLASES = ("local", "router", "multi_shard", "subplanes", "repartition")
+
+# Escenarios que deben ir a un solo shard aunque la línea base diga otra cosa:
+# ni la medición ni --actualizar los aceptan con otra clase
+DEBEN_SER_ROUTER = ("login", "login.correo_desconocido", "*.paciente", "*.historia", "*.historia_flujo")
+
+USUARIOS = {
+    "paciente": "test@hce.com",
+    "medico": "medico@hce.com",
+    "admisionista": "admisionista@hce.com",
+    "administrador": "administrador@hce.com",
+}
+CONTRASENA = "password123"
+PACIENTE = 1000000001
+MEDICO = 2000000001
+
+
+# Rutas que no se verifican, con el motivo. Toda ruta que toque tablas
+# distribuidas debe tener escenario
+RUTAS_SIN_ESCENARIO = {
+    ("GET", "/healthz"): "no consulta la BD",
+    ("GET", "/readyz"): "SELECT 1 en el coordinador",
+    ("GET", "/metrics"): "no consulta la BD",
+    ("GET", "/"): "redirección, no consulta la BD",
+    ("GET", "/login"): "página estática",
+    ("GET", "/logout"): "no consulta la BD",
+    ("GET", "/hash-password/{password}"): "no consulta la BD",
+    ("POST", "/api/admin/perfilador/token"): "solo autenticación (escenario login)",
+    ("POST", "/api/admin/perfilador/ventana"): "solo autenticación (escenario login)",
+    ("GET", "/api/admin/perfilador/perfiles"): "solo autenticación (escenario login)",
+    ("GET", "/api/admin/perfilador/perfiles/{perfil_id}"): "solo autenticación (escenario login)",
+    ("GET", "/api/eventos/atenciones"): (
+        "flujo SSE sin fin; autentica (escenario login) y lee de la outbox que "
+        "consulta el despachador (escenario eventos.despachador)"
+    ),
+}
+
+
+@dataclass
+class Escenario:
+    """
+    Una petición a la aplicación, o una consulta directa (``consulta``) para lo
+    que no se puede pedir por HTTP. ``ruta`` y ``cuerpo`` admiten marcadores
+    ``{nombre}`` que se llenan con lo que devuelve ``guardar`` de un escenario
+    anterior; ``ajustes`` cambia settings solo durante la petición.
+    """
+    nombre: str
+    rol: Optional[str]
+    metodo: str
+    ruta: str
+    cuerpo: Any = None
+    guardar: Optional[Callable[[Any, Any], Dict[str, Any]]] = None
+    ajustes: Dict[str, Any] = field(default_factory=dict)
+    consulta: Optional[Callable[[Any], Any]] = None
+
+
+def _medicamento_de_prueba(cliente, respuesta) -> Dict[str, Any]:
+    """Id de la atención creada y de un medicamento nuevo en ella (no hay endpoint que los cree)."""
+    atencion_id = respuesta.json()["atencion_id"]
+    db = SessionLocal()
+    try:
+        tecnologia = models.TecnologiaSalud(
+            documento_id=PACIENTE, atencion_id=uuid.UUID(atencion_id),
+            descripcion_medicamento="Acetaminofén 500 mg", dosis="500 mg", via_administracion="Oral",
+        )
+        db.add(tecnologia)
+        db.commit()
+        return {"atencion_id": atencion_id, "tecnologia_id": str(tecnologia.tecnologia_id)}
+    finally:
+        db.close()
+
+
+def _exportacion_terminada(cliente, respuesta, espera_segundos=300) -> Dict[str, Any]:
+    """Espera a que termine la exportación iniciada y toma su primer archivo del manifiesto."""
+    estado = respuesta.headers["Content-Location"]
+    limite = time.monotonic() + espera_segundos
+    while True:
+        consulta = cliente.get(estado)
+        if consulta.status_code != 202 or time.monotonic() > limite:
+            break
+        time.sleep(1)
+    if consulta.status_code != 200:
+        raise RuntimeError(f"la exportación FHIR terminó con {consulta.status_code}")
+    salida = consulta.json()["output"]
+    if not salida:
+        raise RuntimeError("la exportación FHIR no generó archivos")
+    return {
+        "exportacion_id": estado.rstrip("/").rsplit("/", 1)[1],
+        "archivo": salida[0]["url"].rsplit("/", 1)[1],
+    }
+
+
+def escenarios():
+    """Escenarios en orden de ejecución: las escrituras van primero."""
+    hoy = date.today()
+    nuevo = 9000000000 + int(time.time()) % 100000000
+    return [
+        Escenario("medico.crear_atencion", "medico", "POST", "/api/atenciones/", {
+            "documento_id": PACIENTE, "tipo_atencion": "Consulta externa",
+            "motivo_consulta": "Control", "enfermedad_actual": "Dolor torácico leve",
+            "signos_vitales": {"ta": "120/80", "fc": 72}, "impresion_diagnostica": "Dolor torácico",
+            "conducta_plan_manejo": "Observación", "codigos_cie10": ["R07.4"],
+        }, guardar=_medicamento_de_prueba),
+        Escenario("medico.administrar", "medico", "POST", f"/api/pacientes/{PACIENTE}/medicamentos/administraciones", {
+            "administraciones": [{"tecnologia_id": "{tecnologia_id}", "unidades": 1, "dosis": "500 mg"}],
+        }),
+        Escenario("admisionista.crear_paciente", "admisionista", "POST", "/api/pacientes/", {
+            "documento_id": nuevo, "primer_nombre": "Enrutamiento", "primer_apellido": "Prueba",
+            "correo_electronico": f"enrutamiento{nuevo}@hce.com", "password": CONTRASENA,
+        }),
+        Escenario("admisionista.actualizar_paciente", "admisionista", "PUT", f"/api/pacientes/{PACIENTE}", {
+            "telefono": "6010000000",
+        }),
+        Escenario("admisionista.paciente", "admisionista", "GET", f"/api/admision/pacientes/{PACIENTE}"),
+        Escenario("admisionista.lote", "admisionista", "POST", "/api/admision/pacientes/lote", {
+            "documento_ids": [PACIENTE, MEDICO], "incluir_ultima_atencion": True,
+        }),
+        Escenario("admisionista.pagina", "admisionista", "GET", "/admisionista"),
+        # Antes de medico.historia: la historia en caché no vuelve a consultar la BD
+        Escenario("medico.historia_flujo", "medico", "GET", f"/api/pacientes/{PACIENTE}",
+                  ajustes={"HISTORIA_STREAMING_MIN_ATENCIONES": 1}),
+        Escenario("medico.historia", "medico", "GET", f"/api/pacientes/{PACIENTE}"),
+        Escenario("medico.detalle_atencion", "medico", "GET", f"/api/pacientes/{PACIENTE}/atenciones/{{atencion_id}}"),
+        Escenario("medico.tendencia", "medico", "GET", f"/api/pacientes/{PACIENTE}/signos-vitales/tendencia"),
+        Escenario("medico.medicamentos", "medico", "GET", f"/api/pacientes/{PACIENTE}/medicamentos"),
+        Escenario("medico.administraciones", "medico", "GET", f"/api/pacientes/{PACIENTE}/medicamentos/administraciones"),
+        Escenario("medico.buscar_paciente", "medico", "GET", f"/api/atenciones/buscar?q=dolor&documento_id={PACIENTE}"),
+        Escenario("medico.buscar_panel", "medico", "GET", "/api/atenciones/buscar?q=dolor"),
+        Escenario("medico.sincronizar_paciente", "medico", "GET", f"/api/sincronizacion/cambios?documento_id={PACIENTE}"),
+        Escenario("medico.sincronizar_panel", "medico", "GET", "/api/sincronizacion/cambios"),
+        Escenario("medico.epidemiologia_pacientes", "medico", "GET", "/api/epidemiologia/cie10/pacientes?codigos=R07"),
+        Escenario("medico.epidemiologia_ranking", "medico", "GET", "/api/epidemiologia/cie10/ranking"),
+        Escenario("medico.censo", "medico", "GET", "/api/censo/atenciones-abiertas"),
+        Escenario("medico.cerrar_atencion", "medico", "POST", f"/api/pacientes/{PACIENTE}/atenciones/{{atencion_id}}/cierre", {
+            "estado_egreso": "Vivo", "diagnostico_definitivo": "Dolor torácico",
+        }),
+        Escenario("medico.reporte", "medico", "GET", f"/api/reportes/atenciones?desde={hoy.replace(day=1)}&hasta={hoy}"),
+        Escenario("medico.pagina", "medico", "GET", "/medico"),
+        Escenario("paciente.dashboard", "paciente", "GET", "/dashboard"),
+        Escenario("paciente.vista", "paciente", "GET", "/paciente/me"),
+        Escenario("paciente.sincronizar", "paciente", "GET", "/api/sincronizacion/cambios"),
+        Escenario("paciente.pdf", "paciente", "GET", f"/exportar_pdf/{PACIENTE}"),
+        Escenario("administrador.auditoria_paciente", "administrador", "GET", f"/api/auditoria/accesos?documento_id={PACIENTE}"),
+        Escenario("administrador.auditoria_usuario", "administrador", "GET", f"/api/auditoria/accesos?usuario_documento_id={MEDICO}"),
+        # El trabajo de exportación (en su propio hilo) no es una petición: la
+        # espera hasta que termina queda fuera de la captura
+        Escenario("administrador.fhir_exportar", "administrador", "GET", "/fhir/$export",
+                  guardar=_exportacion_terminada),
+        Escenario("administrador.fhir_estado", "administrador", "GET", "/fhir/$export-status/{exportacion_id}"),
+        Escenario("administrador.fhir_archivo", "administrador", "GET", "/fhir/$export-files/{exportacion_id}/{archivo}"),
+        Escenario("administrador.fhir_eliminar", "administrador", "DELETE", "/fhir/$export-status/{exportacion_id}"),
+        Escenario("eventos.despachador", None, "SQL", "outbox.leer_eventos",
+                  consulta=lambda db: outbox.leer_eventos(db, datetime.now(timezone.utc) - timedelta(minutes=5))),
+    ]
+
+
+def _llenar(valor, valores):
+    """Reemplaza los marcadores {nombre} de la ruta o del cuerpo (KeyError si falta alguno)."""
+    if isinstance(valor, str):
+        return valor.format_map(valores)
+    if isinstance(valor, dict):
+        return {clave: _llenar(v, valores) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [_llenar(v, valores) for v in valor]
+    return valor
+
+
+def rutas_sin_cubrir(app, lista):
+    """(método, ruta) de la aplicación sin escenario ni motivo en RUTAS_SIN_ESCENARIO."""
+    from fastapi.routing import APIRoute
+
+    pedidas = [(e.metodo, e.ruta.split("?", 1)[0]) for e in lista if e.consulta is None]
+    pedidas.append(("POST", "/token"))  # Escenario login
+    faltantes = []
+    for ruta in app.routes:
+        if not isinstance(ruta, APIRoute):
+            continue
+        for metodo in sorted(ruta.methods - {"HEAD"}):
+            if (metodo, ruta.path) in RUTAS_SIN_ESCENARIO:
+                continue
+            # Los marcadores sin llenar también calzan con los parámetros de ruta
+            if not any(m == metodo and ruta.path_regex.match(r) for m, r in pedidas):
+                faltantes.append((metodo, ruta.path))
+    return faltantes
+
+
+class Captura:
+    """Sentencias emitidas por el motor, agrupadas por escenario."""
+
+    def __init__(self):
+        self.escenario = None
+        self.sentencias = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        # Los hilos del exportador FHIR trabajan en segundo plano, fuera de la
+        # petición que se esté midiendo
+        if self.escenario is None or threading.current_thread().name.startswith("exportacion-fhir"):
+            return
+        if executemany and parameters:
+            parameters = parameters[0]
+        sql = cursor.mogrify(statement, parameters).decode()
+        if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            # Las lecturas de las sesiones de un lote (hilos) también cuentan: los
+            # escenarios se ejecutan de a uno
+            self.sentencias.setdefault(self.escenario, {}).setdefault(" ".join(sql.split()), None)
+
+
+def _recorrer(nodo):
+    if isinstance(nodo, dict):
+        yield nodo
+        for valor in nodo.values():
+            yield from _recorrer(valor)
+    elif isinstance(nodo, list):
+        for valor in nodo:
+            yield from _recorrer(valor)
+
+
+def clasificar(plan) -> str:
+    """Clase de enrutamiento a partir de EXPLAIN (FORMAT JSON) de Citus."""
+    clase = "local"
+    for nodo in _recorrer(plan):
+        if str(nodo.get("Custom Plan Provider", "")).startswith("Citus"):
+            clase = max(clase, "router", key=CLASES.index)
+        metodo = str(nodo.get("INSERT/SELECT method", ""))
+        if "Dependent Jobs" in nodo or metodo in ("repartition", "pull to coordinator"):
+            return "repartition"
+        if "Subplans" in nodo or any(k.startswith("Distributed Subplan") for k in nodo):
+            clase = max(clase, "subplanes", key=CLASES.index)
+        if isinstance(nodo.get("Task Count"), int) and nodo["Task Count"] > 1:
+            clase = max(clase, "multi_shard", key=CLASES.index)
+    return clase
+
+
+def explicar(sql: str) -> str:
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        plan = cursor.fetchone()[0]
+        return clasificar(plan)
+    except Exception as e:
+        return f"error: {str(e).splitlines()[0]}"
+    finally:
+        conexion.rollback()
+        conexion.close()
+
+
+def main():
+    """Recorre los escenarios, clasifica sus sentencias y compara con la línea base."""
+    parser = argparse.ArgumentParser(description="Verifica el enrutamiento Citus de las consultas de cada endpoint.")
+    parser.add_argument("--actualizar", action="store_true", help="Guarda las clases actuales como línea base.")
+    parser.add_argument("--detalle", action="store_true", help="Muestra cada sentencia con su clase.")
+    parser.add_argument("--escenario", action="append", help="Solo estos escenarios (repetible).")
+    args = parser.parse_args()
+
+    try:
+        from fastapi.testclient import TestClient  # Requiere httpx
+    except ImportError as e:
+        print(f"✗ Falta una dependencia del cliente de pruebas: {e}")
+        return False
+    from backend.app import app
+
+    lista = escenarios()
+    faltantes = rutas_sin_cubrir(app, lista)
+    if faltantes:
+        print("✗ Rutas sin escenario (agréguelo a escenarios() o, si no toca tablas distribuidas, a RUTAS_SIN_ESCENARIO):")
+        for metodo, ruta in faltantes:
+            print(f"    {metodo} {ruta}")
+        return False
+
+    captura = Captura()
+    event.listen(engine, "before_cursor_execute", captura)
+    clientes = {}
+    valores: Dict[str, Any] = {}
+    fallidos = []
+    try:
+        if not args.escenario or "login.correo_desconocido" in args.escenario:
+            # Un correo inexistente se rechaza con el índice de correos, sin recorrer los shards
+            captura.escenario = "login.correo_desconocido"
+            respuesta = TestClient(app).post(
+                "/token", data={"username": f"no-existe-{uuid.uuid4().hex}@hce.com", "password": CONTRASENA}
+            )
+            captura.escenario = None
+            if respuesta.status_code != 401:
+                print(f"  ✗ login.correo_desconocido: respondió {respuesta.status_code} en lugar de 401")
+                fallidos.append("login.correo_desconocido")
+
+        for escenario in lista:
+            if args.escenario and escenario.nombre not in args.escenario:
+                continue
+            if escenario.consulta is not None:
+                db = SessionLocal()
+                try:
+                    captura.escenario = escenario.nombre
+                    escenario.consulta(db)
+                finally:
+                    captura.escenario = None
+                    db.close()
+                continue
+
+            rol = escenario.rol
+            if rol not in clientes:
+                # Sin "with": no se inician las tareas de fondo de la aplicación
+                clientes[rol] = TestClient(app)
+                captura.escenario = "login"
+                respuesta = clientes[rol].post("/token", data={"username": USUARIOS[rol], "password": CONTRASENA})
+                captura.escenario = None
+                if respuesta.status_code != 200:
+                    print(f"✗ No se pudo iniciar sesión como {rol} ({USUARIOS[rol]}): {respuesta.status_code}")
+                    return False
+            try:
+                ruta = _llenar(escenario.ruta, valores)
+                cuerpo = _llenar(escenario.cuerpo, valores)
+            except KeyError as e:
+                print(f"  ✗ {escenario.nombre}: falta {e} (falló un escenario anterior)")
+                fallidos.append(escenario.nombre)
+                continue
+
+            anteriores = {clave: getattr(settings, clave) for clave in escenario.ajustes}
+            for clave, valor in escenario.ajustes.items():
+                setattr(settings, clave, valor)
+            captura.escenario = escenario.nombre
+            try:
+                respuesta = clientes[rol].request(escenario.metodo, ruta, json=cuerpo)
+            finally:
+                captura.escenario = None
+                for clave, valor in anteriores.items():
+                    setattr(settings, clave, valor)
+            if respuesta.status_code >= 400:
+                print(f"  ✗ {escenario.nombre}: {escenario.metodo} {ruta} respondió {respuesta.status_code}")
+                fallidos.append(escenario.nombre)
+                continue
+            if escenario.guardar is not None:
+                try:
+                    valores.update(escenario.guardar(clientes[rol], respuesta))
+                except Exception as e:
+                    print(f"  ✗ {escenario.nombre}: {e}")
+                    fallidos.append(escenario.nombre)
+    finally:
+        event.remove(engine, "before_cursor_execute", captura)
+
+    resultados = {}
+    for nombre, sentencias in captura.sentencias.items():
+        for sql in sentencias:
+            sentencias[sql] = explicar(sql)
+        clases = [c for c in sentencias.values() if c in CLASES]
+        resultados[nombre] = max(clases, key=CLASES.index) if clases else "local"
+
+    if not LINEA_BASE.exists() and not args.actualizar:
+        print(f"✗ No existe la línea base {LINEA_BASE}: genérela con --actualizar")
+        return False
+    base = json.loads(LINEA_BASE.read_text(encoding="utf-8")) if LINEA_BASE.exists() else {}
+    peores = []
+    nuevos = []
+    no_router = []
+    print(f"{'Escenario':<38} {'Sentencias':>10}  {'Clase':<12} Línea base")
+    for nombre, clase in resultados.items():
+        esperada = base.get(nombre)
+        marca = ""
+        if esperada is None:
+            marca = "(sin línea base)"
+            nuevos.append(nombre)
+        elif CLASES.index(clase) > CLASES.index(esperada):
+            marca = "✗ EMPEORÓ"
+            peores.append(nombre)
+        elif CLASES.index(clase) < CLASES.index(esperada):
+            marca = "(mejoró)"
+        if clase != "router" and any(fnmatch.fnmatch(nombre, patron) for patron in DEBEN_SER_ROUTER):
+            marca = "✗ DEBE SER router"
+            no_router.append(nombre)
+        print(f"{nombre:<38} {len(captura.sentencias[nombre]):>10}  {clase:<12} {esperada or '-'} {marca}")
+        if args.detalle or nombre in peores or nombre in no_router:
+            for sql, clase_sql in captura.sentencias[nombre].items():
+                print(f"    [{clase_sql}] {sql[:160]}")
+        errores = [c for c in captura.sentencias[nombre].values() if c not in CLASES]
+        for error in errores:
+            print(f"    ADVERTENCIA EXPLAIN {error}")
+
+    if fallidos:
+        # Una línea base sin estos escenarios no los protegería
+        print(f"✗ Escenarios que no se pudieron ejecutar: {', '.join(fallidos)}")
+        return False
+    if no_router:
+        # Tampoco con --actualizar: la línea base no debe fijar un enrutamiento peor
+        print(f"✗ Deben consultar un solo shard: {', '.join(no_router)}")
+        return False
+    if args.actualizar:
+        vigentes = {e.nombre for e in lista} | {"login", "login.correo_desconocido"}
+        base = {nombre: clase for nombre, clase in base.items() if nombre in vigentes}
+        base.update(resultados)
+        LINEA_BASE.write_text(json.dumps(base, indent=2, ensure_ascii=False, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"✓ Línea base actualizada: {LINEA_BASE}")
+        return True
+    if nuevos:
+        print(f"✗ Escenarios sin línea base (ejecute con --actualizar): {', '.join(nuevos)}")
+        return False
+    if peores:
+        print(f"✗ Enrutamiento empeorado en: {', '.join(peores)}")
+        return False
+    print("✓ Ningún escenario empeoró su enrutamiento")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,121 @@
+"""
+Punto de entrada del servidor de producción: Gunicorn con workers Uvicorn.
+
+    python -m backend.server
+
+- Número de workers a partir de las CPU realmente disponibles para el
+  contenedor (límite de cgroup v1/v2 y afinidad de CPU), no las del nodo.
+- ``preload_app``: la aplicación se importa una vez en el proceso maestro y
+  los workers la heredan al hacer fork (arranque más rápido, memoria compartida).
+- Reciclaje de workers tras ``SERVIDOR_MAX_PETICIONES`` (+ jitter para que no
+  se reinicien todos a la vez), acotando el crecimiento de memoria.
+- Apagado ordenado: ante SIGTERM los workers dejan de aceptar conexiones y
+  tienen ``SERVIDOR_TIMEOUT_GRACIA`` segundos para terminar las peticiones en
+  curso (p. ej. exportaciones PDF).
+
+El tamaño puede forzarse con ``SERVIDOR_WORKERS`` o ``WEB_CONCURRENCY``.
+"""
+
+import math
+import os
+from pathlib import Path
+
+from gunicorn.app.base import BaseApplication
+
+from backend.core.config import settings
+
+
+def _cpus_cgroup():
+    """Cuota de CPU del cgroup (v2 o v1) en número de CPU, o None si no hay límite."""
+    cpu_max = Path("/sys/fs/cgroup/cpu.max")
+    if cpu_max.exists():
+        cuota, periodo = cpu_max.read_text().split()[:2]
+        if cuota != "max":
+            return int(cuota) / int(periodo)
+        return None
+
+    cuota_v1 = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    periodo_v1 = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if cuota_v1.exists() and periodo_v1.exists():
+        cuota = int(cuota_v1.read_text())
+        if cuota > 0:
+            return cuota / int(periodo_v1.read_text())
+    return None
+
+
+def cpus_disponibles() -> int:
+    """CPU utilizables por el proceso: el menor entre afinidad y cuota del cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        cuota = _cpus_cgroup()
+    except (OSError, ValueError):
+        cuota = None
+    if cuota:
+        cpus = min(cpus, math.ceil(cuota))
+    return max(cpus, 1)
+
+
+def calcular_workers() -> int:
+    """
+    ``2 * CPU + 1`` (al menos 2) acotado a ``SERVIDOR_WORKERS_MAX``. Los workers
+    pasan buena parte del tiempo esperando a la BD, pero Argon2 y WeasyPrint
+    ocupan CPU, de ahí que no se use un múltiplo mayor. El tope se aplica al
+    final: ``SERVIDOR_WORKERS_MAX=1`` deja un solo worker.
+    """
+    forzado = settings.SERVIDOR_WORKERS or int(os.environ.get("WEB_CONCURRENCY", "0"))
+    if forzado > 0:
+        return forzado
+    return max(1, min(max(2, 2 * cpus_disponibles() + 1), settings.SERVIDOR_WORKERS_MAX))
+
+
+def post_fork(server, worker):
+    # Las conexiones del pool no se comparten entre procesos: cada worker abre las suyas
+    from backend.db.session import engine
+    engine.dispose(close=False)
+
+
+def opciones() -> dict:
+    return {
+        "bind": f"{settings.SERVIDOR_HOST}:{settings.SERVIDOR_PUERTO}",
+        "workers": calcular_workers(),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "max_requests": settings.SERVIDOR_MAX_PETICIONES,
+        "max_requests_jitter": settings.SERVIDOR_MAX_PETICIONES_JITTER,
+        "graceful_timeout": settings.SERVIDOR_TIMEOUT_GRACIA,
+        "timeout": settings.SERVIDOR_TIMEOUT,
+        "keepalive": 5,
+        "post_fork": post_fork,
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+
+class ServidorHCE(BaseApplication):
+    def __init__(self, opciones_servidor: dict):
+        self.opciones_servidor = opciones_servidor
+        super().__init__()
+
+    def load_config(self):
+        for clave, valor in self.opciones_servidor.items():
+            self.cfg.set(clave, valor)
+
+    def load(self):
+        from backend.app import app
+        return app
+
+
+def main():
+    config = opciones()
+    print(
+        f"Iniciando {config['workers']} workers "
+        f"({cpus_disponibles()} CPU disponibles) en {config['bind']}"
+    )
+    ServidorHCE(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,55 @@
 -- 1) Extensiones necesarias
 CREATE EXTENSION IF NOT EXISTS citus;
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS unaccent;
 
 -- 2) Schema
 CREATE SCHEMA IF NOT EXISTS hcd;
 
+-- 2.1) Normalización de códigos CIE-10 (mayúsculas, sin punto: 'e11.9' -> 'E119')
+-- Son IMMUTABLE para poder usarse en índices de expresión; Citus las propaga
+-- a los workers como dependencia al distribuir las tablas.
+CREATE OR REPLACE FUNCTION hcd.cie10_codigo(codigo TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+  SELECT NULLIF(upper(regexp_replace(codigo, '[^A-Za-z0-9]', '', 'g')), '')
+$$;
+
+CREATE OR REPLACE FUNCTION hcd.cie10_normalizar(codigos TEXT[])
+RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+  SELECT COALESCE(array_agg(DISTINCT n), '{}')
+  FROM unnest(codigos) AS c, hcd.cie10_codigo(c) AS n
+  WHERE n IS NOT NULL
+$$;
+
+-- Expande cada código a todos sus prefijos desde la categoría (E119 -> {E11, E119})
+-- para resolver búsquedas jerárquicas con el operador && sobre un índice GIN.
+CREATE OR REPLACE FUNCTION hcd.cie10_jerarquia(codigos TEXT[])
+RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+  SELECT COALESCE(array_agg(DISTINCT left(n, l)), '{}')
+  FROM unnest(hcd.cie10_normalizar(codigos)) AS n,
+       generate_series(3, greatest(length(n), 3)) AS l
+$$;
+
+-- 2.2) Búsqueda de texto completo en español sin tildes ('torácico' = 'toracico')
+-- Citus propaga la configuración a los workers al distribuir hcd.atencion.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_ts_config c JOIN pg_namespace n ON n.oid = c.cfgnamespace
+    WHERE n.nspname = 'hcd' AND c.cfgname = 'es_clinico'
+  ) THEN
+    CREATE TEXT SEARCH CONFIGURATION hcd.es_clinico (COPY = pg_catalog.spanish);
+    ALTER TEXT SEARCH CONFIGURATION hcd.es_clinico
+      ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+  END IF;
+END $$;
+
 -- 3) Tabla usuario: datos de identificación del paciente
 CREATE TABLE IF NOT EXISTS hcd.usuario (
   documento_id BIGINT PRIMARY KEY,
@@ -41,6 +86,31 @@ COMMENT ON TABLE hcd.usuario IS 'Tabla de identificación del paciente (Resoluci
 CREATE INDEX IF NOT EXISTS idx_usuario_correo ON hcd.usuario (correo_electronico);
 CREATE INDEX IF NOT EXISTS idx_usuario_celular ON hcd.usuario (celular);
 
+-- 3.1) Tabla de búsqueda correo -> documento (será distribuida por correo)
+-- hcd.usuario está distribuida por documento_id, así que buscar por correo
+-- consulta todos los shards. Esta tabla lleva cada correo a su documento con una
+-- consulta a un único shard y garantiza que el correo sea único.
+CREATE TABLE IF NOT EXISTS hcd.usuario_correo (
+  correo VARCHAR(255) PRIMARY KEY,
+  documento_id BIGINT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+COMMENT ON TABLE hcd.usuario_correo IS 'Índice global de correos de usuario (unicidad y login en un solo shard)';
+
+-- 3.2) Claves de idempotencia de operaciones de escritura (será distribuida por clave)
+CREATE TABLE IF NOT EXISTS hcd.idempotencia (
+  clave VARCHAR(120) PRIMARY KEY,
+  operacion VARCHAR(60) NOT NULL,
+  huella CHAR(64) NOT NULL,
+  documento_id BIGINT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+COMMENT ON TABLE hcd.idempotencia IS 'Resultado de peticiones con Idempotency-Key para responder reintentos sin repetirlas';
+
+CREATE INDEX IF NOT EXISTS idx_idempotencia_created_at ON hcd.idempotencia (created_at);
+
 -- 4) Tabla profesional_salud (será tabla de referencia)
 CREATE TABLE IF NOT EXISTS hcd.profesional_salud (
   id_personal_salud UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -55,8 +125,11 @@ CREATE TABLE IF NOT EXISTS hcd.profesional_salud (
 
 COMMENT ON TABLE hcd.profesional_salud IS 'Datos del profesional que atiende';
 
--- 5) Tabla atencion: CLAVE COMPUESTA (documento_id, atencion_id)
--- Para cumplir con requisito de Citus: PK debe incluir columna de distribución
+-- 5) Tabla atencion: CLAVE COMPUESTA (documento_id, atencion_id, fecha_hora_atencion)
+-- Para cumplir con requisito de Citus: PK debe incluir columna de distribución.
+-- Particionada por rango mensual de fecha_hora_atencion: la PK debe incluir además
+-- la columna de partición. Las particiones antiguas y cerradas se convierten a
+-- almacenamiento columnar (ver backend/scripts/mantenimiento_particiones.py).
 CREATE TABLE IF NOT EXISTS hcd.atencion (
   atencion_id UUID DEFAULT uuid_generate_v4(),
   documento_id BIGINT NOT NULL,
@@ -92,8 +165,8 @@ CREATE TABLE IF NOT EXISTS hcd.atencion (
   responsable_registro VARCHAR(120),
   created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-  PRIMARY KEY (documento_id, atencion_id)  -- Clave compuesta incluyendo columna de distribución
-);
+  PRIMARY KEY (documento_id, atencion_id, fecha_hora_atencion)  -- Clave compuesta incluyendo columna de distribución y de partición
+) PARTITION BY RANGE (fecha_hora_atencion);
 
 COMMENT ON TABLE hcd.atencion IS 'Tabla con datos administrativos y clínicos por episodio de atención';
 
@@ -101,6 +174,23 @@ COMMENT ON TABLE hcd.atencion IS 'Tabla con datos administrativos y clínicos po
 CREATE INDEX IF NOT EXISTS idx_atencion_atencion_id ON hcd.atencion (atencion_id);
 CREATE INDEX IF NOT EXISTS idx_atencion_fecha ON hcd.atencion (documento_id, fecha_hora_atencion);
 CREATE INDEX IF NOT EXISTS idx_atencion_estado_egreso ON hcd.atencion (estado_egreso);
+CREATE INDEX IF NOT EXISTS idx_atencion_fecha_hora ON hcd.atencion (fecha_hora_atencion);
+CREATE INDEX IF NOT EXISTS idx_atencion_created_at ON hcd.atencion (created_at);
+
+-- Documento de búsqueda sobre la narrativa clínica (ver backend/db/busqueda.py).
+-- Pesos: A motivo e impresión diagnóstica, B enfermedad actual y medicamentos, C plan.
+ALTER TABLE hcd.atencion ADD COLUMN IF NOT EXISTS busqueda_tsv TSVECTOR
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('hcd.es_clinico', coalesce(motivo_consulta, '')), 'A') ||
+    setweight(to_tsvector('hcd.es_clinico', coalesce(impresion_diagnostica, '')), 'A') ||
+    setweight(to_tsvector('hcd.es_clinico', coalesce(enfermedad_actual, '')), 'B') ||
+    setweight(to_tsvector('hcd.es_clinico', coalesce(medicamentos_actuales, '')), 'B') ||
+    setweight(to_tsvector('hcd.es_clinico', coalesce(conducta_plan_manejo, '')), 'C')
+  ) STORED;
+
+-- Los índices GIN (CIE-10 y texto completo) no son compatibles con el almacenamiento columnar, así que
+-- no se definen en la tabla padre: se crean por partición mientras esta sea heap
+-- (hcd.asegurar_indices_particion) y se eliminan antes de comprimirla.
 
 -- 6) Tabla diagnostico: CLAVE COMPUESTA
 CREATE TABLE IF NOT EXISTS hcd.diagnostico (
@@ -112,11 +202,13 @@ CREATE TABLE IF NOT EXISTS hcd.diagnostico (
   codigo_cie10 VARCHAR(30),
   gravedad VARCHAR(50),
   registro_medico JSONB,
-  created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-  PRIMARY KEY (documento_id, diagnostico_id)
-);
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, diagnostico_id, created_at)
+) PARTITION BY RANGE (created_at);
 
 CREATE INDEX IF NOT EXISTS idx_diag_atencion ON hcd.diagnostico (atencion_id);
+CREATE INDEX IF NOT EXISTS idx_diag_cie10 ON hcd.diagnostico (hcd.cie10_codigo(codigo_cie10) text_pattern_ops);
 
 -- 7) Tabla tecnologia_salud: CLAVE COMPUESTA
 CREATE TABLE IF NOT EXISTS hcd.tecnologia_salud (
@@ -132,9 +224,10 @@ CREATE TABLE IF NOT EXISTS hcd.tecnologia_salud (
   id_personal_salud UUID,
   finalidad_tecnologia TEXT,
   registro_administracion JSONB,
-  created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-  PRIMARY KEY (documento_id, tecnologia_id)
-);
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, tecnologia_id, created_at)
+) PARTITION BY RANGE (created_at);
 
 CREATE INDEX IF NOT EXISTS idx_tec_atencion ON hcd.tecnologia_salud (atencion_id);
 
@@ -147,24 +240,408 @@ CREATE TABLE IF NOT EXISTS hcd.egreso (
   causas_egreso TEXT,
   recomendaciones_al_egreso TEXT,
   fecha_egreso TIMESTAMP WITH TIME ZONE,
-  created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-  PRIMARY KEY (documento_id, egreso_id)
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, egreso_id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- 8.0) Particiones por tiempo
+-- Las tablas hijas de atencion no tienen fecha_hora_atencion; se particionan por
+-- created_at, que coincide en la práctica con el episodio que las origina.
+
+-- Índices que solo existen en particiones heap (no soportados por columnar)
+CREATE OR REPLACE FUNCTION hcd.asegurar_indices_particion(particion REGCLASS)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  nombre TEXT := (SELECT relname FROM pg_class WHERE oid = particion);
+  padre REGCLASS := (SELECT inhparent::regclass FROM pg_inherits WHERE inhrelid = particion);
+BEGIN
+  IF padre = 'hcd.atencion'::regclass THEN
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %s USING GIN (codigos_cie10)',
+                   nombre || '_cie10_gin', particion);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %s USING GIN (hcd.cie10_jerarquia(codigos_cie10))',
+                   nombre || '_cie10_jerarquia', particion);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %s USING GIN (busqueda_tsv)',
+                   nombre || '_busqueda_gin', particion);
+    -- Atenciones abiertas (censo): pocas filas, el índice parcial se mantiene pequeño
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %s (documento_id, fecha_hora_atencion) '
+                   'WHERE fecha_hora_cierre IS NULL AND COALESCE(estado_egreso, '''') = ''''',
+                   nombre || '_abiertas', particion);
+  END IF;
+END $$;
+
+-- Elimina los índices no soportados por columnar antes de convertir una partición
+CREATE OR REPLACE FUNCTION hcd.eliminar_indices_heap_particion(particion REGCLASS)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  indice REGCLASS;
+BEGIN
+  FOR indice IN
+    SELECT i.indexrelid::regclass
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_am am ON am.oid = c.relam
+    WHERE i.indrelid = particion
+      AND (am.amname NOT IN ('btree', 'hash') OR i.indpred IS NOT NULL)
+      AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+  LOOP
+    EXECUTE format('DROP INDEX %s', indice);
+  END LOOP;
+END $$;
+
+-- Particiones iniciales: 2 años hacia atrás y 3 meses hacia adelante. Solo aplica
+-- a instalaciones nuevas; una base existente con tablas heap se migra con
+-- infra/particionar_atencion.sql.
+-- Cada tabla tiene además una partición DEFAULT (<tabla>_default) para las filas
+-- fuera de ese rango (cargas históricas por SQL, o si el mantenimiento deja de
+-- crear las particiones futuras): sin ella el INSERT fallaría. El mantenimiento
+-- diario crea las particiones mensuales que faltan y mueve allí esas filas
+-- (backend/db/particiones.py, reubicar_default).
+DO $$
+DECLARE
+  tabla TEXT;
+  particion REGCLASS;
+BEGIN
+  FOREACH tabla IN ARRAY ARRAY['hcd.atencion', 'hcd.diagnostico', 'hcd.tecnologia_salud', 'hcd.egreso'] LOOP
+    IF (SELECT relkind FROM pg_class WHERE oid = tabla::regclass) = 'p' THEN
+      PERFORM create_time_partitions(
+        table_name := tabla::regclass,
+        partition_interval := INTERVAL '1 month',
+        end_at := date_trunc('month', now()) + INTERVAL '4 months',
+        start_from := date_trunc('month', now()) - INTERVAL '2 years'
+      );
+      EXECUTE format('CREATE TABLE IF NOT EXISTS %s_default PARTITION OF %s DEFAULT', tabla, tabla);
+    END IF;
+  END LOOP;
+  IF to_regclass('hcd.atencion_default') IS NOT NULL THEN
+    PERFORM hcd.asegurar_indices_particion('hcd.atencion_default'::regclass);
+  END IF;
+
+  FOR particion IN
+    SELECT partition FROM time_partitions
+    WHERE parent_table = 'hcd.atencion'::regclass AND access_method = 'heap' AND from_value IS NOT NULL
+  LOOP
+    PERFORM hcd.asegurar_indices_particion(particion);
+  END LOOP;
+END $$;
+
+-- Sin FK hacia atencion (ver sección 11), el borrado en cascada que hacían
+-- fk_diag_atencion, fk_tec_atencion y fk_egreso_atencion lo hace este trigger. Corre
+-- en el shard de la atención, donde están también sus filas hijas (co-localizadas).
+-- Las filas hijas sin atención (cargas por SQL) las informa el mantenimiento
+-- diario (backend/db/particiones.py, contar_huerfanas). En particiones columnares
+-- el DELETE falla: antes, mantenimiento_particiones.py --descomprimir-paciente.
+CREATE OR REPLACE FUNCTION hcd.eliminar_hijas_atencion() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM hcd.diagnostico WHERE documento_id = OLD.documento_id AND atencion_id = OLD.atencion_id;
+  DELETE FROM hcd.tecnologia_salud WHERE documento_id = OLD.documento_id AND atencion_id = OLD.atencion_id;
+  DELETE FROM hcd.egreso WHERE documento_id = OLD.documento_id AND atencion_id = OLD.atencion_id;
+  RETURN OLD;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_atencion_hijas ON hcd.atencion;
+CREATE TRIGGER trg_atencion_hijas AFTER DELETE ON hcd.atencion
+  FOR EACH ROW EXECUTE FUNCTION hcd.eliminar_hijas_atencion();
+
+-- 8.1) Rollups para reportes (serán tablas de referencia)
+-- Se alimentan de forma incremental con backend/scripts/rollup_atenciones.py
+CREATE TABLE IF NOT EXISTS hcd.rollup_atenciones_diarias (
+  dia DATE NOT NULL,
+  tipo_atencion VARCHAR(80) NOT NULL,
+  municipio_ciudad VARCHAR(120) NOT NULL,
+  departamento VARCHAR(120) NOT NULL,
+  grupo_edad VARCHAR(20) NOT NULL,
+  regimen_afiliacion VARCHAR(80) NOT NULL,
+  atenciones BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (dia, tipo_atencion, municipio_ciudad, departamento, grupo_edad, regimen_afiliacion)
+);
+
+COMMENT ON TABLE hcd.rollup_atenciones_diarias IS 'Atenciones por día y dimensiones demográficas, agregadas incrementalmente';
+
+-- rollup_atenciones.py --backfill recalcula aquí y reemplaza el contenido de
+-- rollup_atenciones_diarias en una transacción; fuera de eso queda vacía
+CREATE TABLE IF NOT EXISTS hcd.rollup_atenciones_diarias_reconstruccion (
+  LIKE hcd.rollup_atenciones_diarias INCLUDING ALL
+);
+
+COMMENT ON TABLE hcd.rollup_atenciones_diarias_reconstruccion IS 'Reconstrucción en curso de rollup_atenciones_diarias';
+
+CREATE TABLE IF NOT EXISTS hcd.rollup_marca (
+  nombre VARCHAR(80) PRIMARY KEY,
+  procesado_hasta TIMESTAMP WITH TIME ZONE NOT NULL,
+  actualizado_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+COMMENT ON TABLE hcd.rollup_marca IS 'Marca de agua (created_at) hasta la que se consolidó cada rollup';
+
+-- 8.2) Outbox transaccional de eventos (será distribuida y co-localizada con atencion)
+-- Se escribe en la misma transacción que la atención; backend/core/eventos.py lo
+-- lee por created_at y difunde los eventos a las sesiones suscritas (SSE).
+CREATE TABLE IF NOT EXISTS hcd.outbox_evento (
+  evento_id UUID DEFAULT uuid_generate_v4(),
+  documento_id BIGINT NOT NULL,
+  tipo VARCHAR(60) NOT NULL,
+  payload JSONB NOT NULL,
+  responsable_registro VARCHAR(120),
+  medico_documento_id BIGINT,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, evento_id)
+);
+
+-- Las suscripciones de los médicos se filtran por documento, no por nombre
+ALTER TABLE hcd.outbox_evento ADD COLUMN IF NOT EXISTS medico_documento_id BIGINT;
+
+COMMENT ON TABLE hcd.outbox_evento IS 'Eventos pendientes de difundir; se depuran tras EVENTOS_RETENCION_HORAS';
+
+CREATE INDEX IF NOT EXISTS idx_outbox_evento_created_at ON hcd.outbox_evento (created_at);
+
+-- 8.3) Serie de tiempo de signos vitales (será distribuida y co-localizada con atencion)
+-- Una fila por atención, extraída de atencion.signos_vitales al registrarla
+-- (backend/db/serie_signos.py). La PK sirve las consultas de tendencia por rango.
+CREATE TABLE IF NOT EXISTS hcd.signo_vital (
+  documento_id BIGINT NOT NULL,
+  medido_en TIMESTAMP WITH TIME ZONE NOT NULL,
+  atencion_id UUID NOT NULL,
+  ta_sistolica SMALLINT,
+  ta_diastolica SMALLINT,
+  fc SMALLINT,
+  fr SMALLINT,
+  temperatura NUMERIC(4,1),
+  saturacion SMALLINT,
+  peso NUMERIC(5,1),
+  talla NUMERIC(3,2),
+  PRIMARY KEY (documento_id, medido_en, atencion_id)
+);
+
+COMMENT ON TABLE hcd.signo_vital IS 'Signos vitales tipados por atención para graficar tendencias';
+
+-- 8.4) Auditoría de accesos a la historia clínica (Ley 1581 de 2012)
+-- Distribuida por documento_id y co-localizada con usuario. Solo se inserta, en
+-- lotes con COPY desde el buffer de cada proceso (backend/core/auditoria.py).
+CREATE TABLE IF NOT EXISTS hcd.auditoria_acceso (
+  auditoria_id UUID DEFAULT uuid_generate_v4(),
+  documento_id BIGINT NOT NULL,
+  accedido_en TIMESTAMP WITH TIME ZONE NOT NULL,
+  accion VARCHAR(40) NOT NULL,
+  usuario_documento_id BIGINT,
+  usuario_correo VARCHAR(255),
+  usuario_rol VARCHAR(80),
+  recurso VARCHAR(255),
+  ip VARCHAR(64),
+  agente_usuario VARCHAR(255),
+  PRIMARY KEY (documento_id, auditoria_id)
 );
 
+COMMENT ON TABLE hcd.auditoria_acceso IS 'Quién consultó o exportó cada historia clínica y cuándo';
+
+CREATE INDEX IF NOT EXISTS idx_auditoria_acceso_documento ON hcd.auditoria_acceso (documento_id, accedido_en DESC);
+CREATE INDEX IF NOT EXISTS idx_auditoria_acceso_usuario ON hcd.auditoria_acceso (usuario_documento_id, accedido_en DESC);
+
+-- 8.5) Trabajos de exportación masiva FHIR ($export)
+-- Tabla local del coordinador (no se distribuye): pocas filas, las lee y
+-- actualiza backend/core/exportacion_fhir.py.
+CREATE TABLE IF NOT EXISTS hcd.exportacion_fhir (
+  exportacion_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  estado VARCHAR(20) NOT NULL,
+  solicitante VARCHAR(255),
+  solicitud TEXT,
+  tipos TEXT[],
+  desde TIMESTAMP WITH TIME ZONE,
+  segmentos_total INTEGER NOT NULL DEFAULT 0,
+  segmentos_listos INTEGER NOT NULL DEFAULT 0,
+  archivos JSONB,
+  error TEXT,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  finalizada_en TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE hcd.exportacion_fhir IS 'Estado y manifiesto de las exportaciones FHIR bulk data';
+
+-- Latido del proceso que ejecuta el trabajo: sin él, el trabajo quedó huérfano
+-- (p. ej. el pod se reinició) y pasa a error
+ALTER TABLE hcd.exportacion_fhir ADD COLUMN IF NOT EXISTS latido_en TIMESTAMP WITH TIME ZONE;
+
+-- 8.6) Sincronización incremental (backend/db/sincronizacion.py)
+-- Índices (documento_id, fecha, id): cada página de cambios de un paciente es
+-- un recorrido del índice desde el cursor del cliente.
+-- Diagnósticos, medicamentos y egresos se corrigen tras crearse: su marca de
+-- agua es updated_at, como en usuario y atencion. En una base existente la
+-- columna se agrega sin reescribir la tabla (el DEFAULT estable se guarda una
+-- vez) y todas las filas toman la hora del ALTER: cada cliente las recibe una
+-- vez más en su siguiente sincronización.
+ALTER TABLE hcd.diagnostico ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+ALTER TABLE hcd.tecnologia_salud ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+ALTER TABLE hcd.egreso ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+DROP INDEX IF EXISTS hcd.idx_diag_sync;
+DROP INDEX IF EXISTS hcd.idx_tec_sync;
+DROP INDEX IF EXISTS hcd.idx_egreso_sync;
+CREATE INDEX IF NOT EXISTS idx_atencion_sync ON hcd.atencion (documento_id, updated_at, atencion_id);
+CREATE INDEX IF NOT EXISTS idx_diag_cambios ON hcd.diagnostico (documento_id, updated_at, diagnostico_id);
+CREATE INDEX IF NOT EXISTS idx_tec_cambios ON hcd.tecnologia_salud (documento_id, updated_at, tecnologia_id);
+CREATE INDEX IF NOT EXISTS idx_egreso_cambios ON hcd.egreso (documento_id, updated_at, egreso_id);
+
+-- Lápidas de filas eliminadas (será distribuida y co-localizada con atencion)
+CREATE TABLE IF NOT EXISTS hcd.sync_eliminacion (
+  eliminacion_id UUID DEFAULT uuid_generate_v4(),
+  documento_id BIGINT NOT NULL,
+  entidad VARCHAR(30) NOT NULL,
+  entidad_id TEXT NOT NULL,
+  eliminado_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, eliminacion_id)
+);
+
+COMMENT ON TABLE hcd.sync_eliminacion IS 'Filas eliminadas, para propagar el borrado a las copias locales; se depuran tras SINCRONIZACION_RETENCION_DIAS';
+
+CREATE INDEX IF NOT EXISTS idx_sync_eliminacion ON hcd.sync_eliminacion (documento_id, eliminado_en, eliminacion_id);
+
+CREATE OR REPLACE FUNCTION hcd.registrar_eliminacion() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  -- TG_ARGV: nombre de la entidad en la API de sincronización y columna clave
+  INSERT INTO hcd.sync_eliminacion (documento_id, entidad, entidad_id)
+  VALUES (OLD.documento_id, TG_ARGV[0], to_jsonb(OLD) ->> TG_ARGV[1]);
+  RETURN OLD;
+END $$;
+
+-- updated_at también avanza con actualizaciones hechas fuera del ORM
+CREATE OR REPLACE FUNCTION hcd.tocar_updated_at() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_usuario_eliminacion ON hcd.usuario;
+CREATE TRIGGER trg_usuario_eliminacion AFTER DELETE ON hcd.usuario
+  FOR EACH ROW EXECUTE FUNCTION hcd.registrar_eliminacion('usuarios', 'documento_id');
+DROP TRIGGER IF EXISTS trg_atencion_eliminacion ON hcd.atencion;
+CREATE TRIGGER trg_atencion_eliminacion AFTER DELETE ON hcd.atencion
+  FOR EACH ROW EXECUTE FUNCTION hcd.registrar_eliminacion('atenciones', 'atencion_id');
+DROP TRIGGER IF EXISTS trg_diagnostico_eliminacion ON hcd.diagnostico;
+CREATE TRIGGER trg_diagnostico_eliminacion AFTER DELETE ON hcd.diagnostico
+  FOR EACH ROW EXECUTE FUNCTION hcd.registrar_eliminacion('diagnosticos', 'diagnostico_id');
+DROP TRIGGER IF EXISTS trg_tecnologia_eliminacion ON hcd.tecnologia_salud;
+CREATE TRIGGER trg_tecnologia_eliminacion AFTER DELETE ON hcd.tecnologia_salud
+  FOR EACH ROW EXECUTE FUNCTION hcd.registrar_eliminacion('medicamentos', 'tecnologia_id');
+DROP TRIGGER IF EXISTS trg_egreso_eliminacion ON hcd.egreso;
+CREATE TRIGGER trg_egreso_eliminacion AFTER DELETE ON hcd.egreso
+  FOR EACH ROW EXECUTE FUNCTION hcd.registrar_eliminacion('egresos', 'egreso_id');
+
+DROP TRIGGER IF EXISTS trg_usuario_updated_at ON hcd.usuario;
+CREATE TRIGGER trg_usuario_updated_at BEFORE UPDATE ON hcd.usuario
+  FOR EACH ROW EXECUTE FUNCTION hcd.tocar_updated_at();
+DROP TRIGGER IF EXISTS trg_atencion_updated_at ON hcd.atencion;
+CREATE TRIGGER trg_atencion_updated_at BEFORE UPDATE ON hcd.atencion
+  FOR EACH ROW EXECUTE FUNCTION hcd.tocar_updated_at();
+DROP TRIGGER IF EXISTS trg_diagnostico_updated_at ON hcd.diagnostico;
+CREATE TRIGGER trg_diagnostico_updated_at BEFORE UPDATE ON hcd.diagnostico
+  FOR EACH ROW EXECUTE FUNCTION hcd.tocar_updated_at();
+DROP TRIGGER IF EXISTS trg_tecnologia_updated_at ON hcd.tecnologia_salud;
+CREATE TRIGGER trg_tecnologia_updated_at BEFORE UPDATE ON hcd.tecnologia_salud
+  FOR EACH ROW EXECUTE FUNCTION hcd.tocar_updated_at();
+DROP TRIGGER IF EXISTS trg_egreso_updated_at ON hcd.egreso;
+CREATE TRIGGER trg_egreso_updated_at BEFORE UPDATE ON hcd.egreso
+  FOR EACH ROW EXECUTE FUNCTION hcd.tocar_updated_at();
+
+-- 8.7) Censo de atenciones abiertas (será tabla de referencia)
+-- Una fila por atención sin fecha_hora_cierre ni estado_egreso, mantenida por la
+-- aplicación al crear y cerrar atenciones y conciliada a diario con el índice
+-- parcial <partición>_abiertas (backend/scripts/reconstruir_censo.py).
+CREATE TABLE IF NOT EXISTS hcd.censo_atencion_abierta (
+  atencion_id UUID PRIMARY KEY,
+  documento_id BIGINT NOT NULL,
+  fecha_hora_atencion TIMESTAMP WITH TIME ZONE NOT NULL,
+  tipo_atencion VARCHAR(80),
+  motivo_consulta TEXT,
+  profesional_responsable UUID,
+  paciente_nombre VARCHAR(255),
+  registrado_en TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+COMMENT ON TABLE hcd.censo_atencion_abierta IS 'Atenciones abiertas de todos los pacientes, para los tableros de servicio';
+
+CREATE INDEX IF NOT EXISTS idx_censo_tipo ON hcd.censo_atencion_abierta (tipo_atencion, fecha_hora_atencion);
+CREATE INDEX IF NOT EXISTS idx_censo_profesional ON hcd.censo_atencion_abierta (profesional_responsable, fecha_hora_atencion);
+
+-- 8.8) Administración de medicamentos (será distribuida y co-localizada con atencion)
+-- Una fila por dosis, solo se inserta: registrar una dosis no reescribe
+-- tecnologia_salud (registro_administracion/unidades_aplicadas quedan como
+-- históricos) y el total aplicado se suma desde estos eventos
+-- (backend/db/administraciones.py).
+CREATE TABLE IF NOT EXISTS hcd.administracion_medicamento (
+  administracion_id UUID DEFAULT uuid_generate_v4(),
+  documento_id BIGINT NOT NULL,
+  tecnologia_id UUID NOT NULL,
+  administrado_en TIMESTAMP WITH TIME ZONE NOT NULL,
+  unidades INT NOT NULL CHECK (unidades > 0),
+  dosis VARCHAR(80),
+  via_administracion VARCHAR(80),
+  observaciones TEXT,
+  id_personal_salud UUID,
+  responsable_registro VARCHAR(120),
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, administracion_id)
+);
+
+COMMENT ON TABLE hcd.administracion_medicamento IS 'Dosis administradas de cada medicamento (tecnologia_salud), solo inserción';
+
+-- Totales y listado por medicamento, listado del paciente y sincronización
+CREATE INDEX IF NOT EXISTS idx_adm_med_tecnologia ON hcd.administracion_medicamento (documento_id, tecnologia_id, administrado_en);
+CREATE INDEX IF NOT EXISTS idx_adm_med_fecha ON hcd.administracion_medicamento (documento_id, administrado_en);
+CREATE INDEX IF NOT EXISTS idx_adm_med_sync ON hcd.administracion_medicamento (documento_id, created_at, administracion_id);
+
+DROP TRIGGER IF EXISTS trg_administracion_eliminacion ON hcd.administracion_medicamento;
+CREATE TRIGGER trg_administracion_eliminacion AFTER DELETE ON hcd.administracion_medicamento
+  FOR EACH ROW EXECUTE FUNCTION hcd.registrar_eliminacion('administraciones', 'administracion_id');
+
+-- 8.9) Panel de pacientes de cada médico (será distribuida y co-localizada con atencion)
+-- Una fila por (paciente, usuario médico), insertada en la transacción de cada
+-- atención que registra el médico. Las atenciones cargadas por SQL con
+-- profesional_responsable se incorporan con backend/scripts/backfill_panel_medico.py.
+-- agregado_en permite a la sincronización detectar pacientes nuevos del panel.
+CREATE TABLE IF NOT EXISTS hcd.panel_medico (
+  documento_id BIGINT NOT NULL,
+  medico_documento_id BIGINT NOT NULL,
+  agregado_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  PRIMARY KEY (documento_id, medico_documento_id)
+);
+
+COMMENT ON TABLE hcd.panel_medico IS 'Pacientes atendidos por cada usuario médico';
+
+CREATE INDEX IF NOT EXISTS idx_panel_medico ON hcd.panel_medico (medico_documento_id, agregado_en);
+
 -- 9) PRIMERO: Crear tabla de referencia (debe hacerse ANTES de distribuir otras tablas)
 -- SELECT create_reference_table('hcd.profesional_salud');
+-- SELECT create_reference_table('hcd.censo_atencion_abierta');
 
 -- 10) DISTRIBUIR TABLAS CON CITUS
 -- COMENTADAS: Se ejecutarán después de registrar los workers
 -- SELECT create_distributed_table('hcd.usuario', 'documento_id');
+-- SELECT create_distributed_table('hcd.usuario_correo', 'correo');
+-- SELECT create_distributed_table('hcd.idempotencia', 'clave');
 -- SELECT create_distributed_table('hcd.atencion', 'documento_id');
+-- SELECT create_distributed_table('hcd.auditoria_acceso', 'documento_id', colocate_with => 'hcd.usuario');
 
 -- Co-localizar tablas relacionadas (todas por documento_id para mantener datos juntos)
 -- SELECT create_distributed_table('hcd.diagnostico', 'documento_id', colocate_with => 'hcd.atencion');
 -- SELECT create_distributed_table('hcd.tecnologia_salud', 'documento_id', colocate_with => 'hcd.atencion');
 -- SELECT create_distributed_table('hcd.egreso', 'documento_id', colocate_with => 'hcd.atencion');
+-- SELECT create_distributed_table('hcd.outbox_evento', 'documento_id', colocate_with => 'hcd.atencion');
+-- SELECT create_distributed_table('hcd.signo_vital', 'documento_id', colocate_with => 'hcd.atencion');
+-- SELECT create_distributed_table('hcd.sync_eliminacion', 'documento_id', colocate_with => 'hcd.atencion');
+-- SELECT create_distributed_table('hcd.administracion_medicamento', 'documento_id', colocate_with => 'hcd.atencion');
+-- SELECT create_distributed_table('hcd.panel_medico', 'documento_id', colocate_with => 'hcd.atencion');
 
 -- 11) AGREGAR FOREIGN KEYS (después de distribuir)
+-- diagnostico, tecnologia_salud y egreso no tienen FK hacia atencion: con la tabla
+-- particionada, la clave referenciada tendría que incluir fecha_hora_atencion, que
+-- las hijas no tienen. Los reemplazan el trigger trg_atencion_hijas (borrado en
+-- cascada) y el conteo de huérfanas del mantenimiento diario.
 DO $$
 BEGIN
   IF NOT EXISTS (
@@ -178,32 +655,6 @@ BEGIN
   END IF;
 END $$;
 
-DO $$
-BEGIN
-  IF NOT EXISTS (
-    SELECT 1 FROM pg_constraint WHERE conname = 'fk_diag_atencion'
-  ) THEN
-    ALTER TABLE hcd.diagnostico
-      ADD CONSTRAINT fk_diag_atencion 
-      FOREIGN KEY (documento_id, atencion_id) 
-      REFERENCES hcd.atencion(documento_id, atencion_id) 
-      ON DELETE CASCADE;
-  END IF;
-END $$;
-
-DO $$
-BEGIN
-  IF NOT EXISTS (
-    SELECT 1 FROM pg_constraint WHERE conname = 'fk_tec_atencion'
-  ) THEN
-    ALTER TABLE hcd.tecnologia_salud
-      ADD CONSTRAINT fk_tec_atencion 
-      FOREIGN KEY (documento_id, atencion_id) 
-      REFERENCES hcd.atencion(documento_id, atencion_id) 
-      ON DELETE CASCADE;
-  END IF;
-END $$;
-
 DO $$
 BEGIN
   IF NOT EXISTS (
@@ -228,19 +679,6 @@ BEGIN
   END IF;
 END $$;
 
-DO $$
-BEGIN
-  IF NOT EXISTS (
-    SELECT 1 FROM pg_constraint WHERE conname = 'fk_egreso_atencion'
-  ) THEN
-    ALTER TABLE hcd.egreso
-      ADD CONSTRAINT fk_egreso_atencion 
-      FOREIGN KEY (documento_id, atencion_id) 
-      REFERENCES hcd.atencion(documento_id, atencion_id) 
-      ON DELETE CASCADE;
-  END IF;
-END $$;
-
 -- 12) Privilegios
 GRANT USAGE ON SCHEMA hcd TO public;
 GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA hcd TO public;
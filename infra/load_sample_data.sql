@@ -305,4 +305,20 @@ SELECT
   'Síndrome coronario agudo en estudio',
   ARRAY['I20.0'],
   'Hospitalizado',
-  (SELECT id_personal_salud FROM hcd.profesional_salud WHERE tipo_profesional = 'Médico Internista' LIMIT 1);
\ No newline at end of file
+  (SELECT id_personal_salud FROM hcd.profesional_salud WHERE tipo_profesional = 'Médico Internista' LIMIT 1);
+
+-- Índice de correos (hcd.usuario_correo) para los usuarios cargados
+INSERT INTO hcd.usuario_correo (correo, documento_id)
+SELECT correo_electronico, documento_id FROM hcd.usuario
+WHERE correo_electronico IS NOT NULL
+ON CONFLICT (correo) DO NOTHING;
+
+-- Censo de atenciones abiertas (hcd.censo_atencion_abierta) para las atenciones cargadas
+INSERT INTO hcd.censo_atencion_abierta (atencion_id, documento_id, fecha_hora_atencion, tipo_atencion,
+                                        motivo_consulta, profesional_responsable, paciente_nombre)
+SELECT a.atencion_id, a.documento_id, a.fecha_hora_atencion, a.tipo_atencion, a.motivo_consulta,
+       a.profesional_responsable, concat_ws(' ', u.primer_nombre, u.primer_apellido, u.segundo_apellido)
+FROM hcd.atencion a
+JOIN hcd.usuario u ON u.documento_id = a.documento_id
+WHERE a.fecha_hora_cierre IS NULL AND COALESCE(a.estado_egreso, '') = ''
+ON CONFLICT (atencion_id) DO NOTHING;
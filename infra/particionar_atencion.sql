@@ -0,0 +1,86 @@
+-- particionar_atencion.sql
+-- Migra una instalación existente (atencion y tablas hijas como tablas heap sin
+-- particionar) al esquema particionado por tiempo de infra/init.sql.
+--
+-- Ejecutar UNA sola vez en el coordinador, con la aplicación detenida:
+--   psql -v ON_ERROR_STOP=1 -U postgres -d interop_db -f /tmp/init.sql                 -- funciones nuevas
+--   psql -v ON_ERROR_STOP=1 -U postgres -d interop_db -f /tmp/particionar_atencion.sql
+--   psql -v ON_ERROR_STOP=1 -U postgres -d interop_db -f /tmp/init.sql                 -- índices y FKs
+--
+-- La segunda ejecución de init.sql crea los índices, las particiones DEFAULT, el
+-- trigger de borrado en cascada y las llaves foráneas sobre las tablas nuevas
+-- (es idempotente).
+
+-- 1) Apartar las tablas actuales
+ALTER TABLE hcd.atencion RENAME TO atencion_heap;
+ALTER TABLE hcd.diagnostico RENAME TO diagnostico_heap;
+ALTER TABLE hcd.tecnologia_salud RENAME TO tecnologia_salud_heap;
+ALTER TABLE hcd.egreso RENAME TO egreso_heap;
+
+UPDATE hcd.diagnostico_heap SET created_at = now() WHERE created_at IS NULL;
+UPDATE hcd.tecnologia_salud_heap SET created_at = now() WHERE created_at IS NULL;
+UPDATE hcd.egreso_heap SET created_at = now() WHERE created_at IS NULL;
+
+-- 2) Tablas padre particionadas con las mismas columnas
+CREATE TABLE hcd.atencion (LIKE hcd.atencion_heap INCLUDING DEFAULTS INCLUDING GENERATED)
+  PARTITION BY RANGE (fecha_hora_atencion);
+ALTER TABLE hcd.atencion ADD PRIMARY KEY (documento_id, atencion_id, fecha_hora_atencion);
+
+CREATE TABLE hcd.diagnostico (LIKE hcd.diagnostico_heap INCLUDING DEFAULTS INCLUDING GENERATED)
+  PARTITION BY RANGE (created_at);
+ALTER TABLE hcd.diagnostico ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE hcd.diagnostico ADD PRIMARY KEY (documento_id, diagnostico_id, created_at);
+
+CREATE TABLE hcd.tecnologia_salud (LIKE hcd.tecnologia_salud_heap INCLUDING DEFAULTS INCLUDING GENERATED)
+  PARTITION BY RANGE (created_at);
+ALTER TABLE hcd.tecnologia_salud ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE hcd.tecnologia_salud ADD PRIMARY KEY (documento_id, tecnologia_id, created_at);
+
+CREATE TABLE hcd.egreso (LIKE hcd.egreso_heap INCLUDING DEFAULTS INCLUDING GENERATED)
+  PARTITION BY RANGE (created_at);
+ALTER TABLE hcd.egreso ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE hcd.egreso ADD PRIMARY KEY (documento_id, egreso_id, created_at);
+
+-- 3) Particiones mensuales desde el dato más antiguo hasta 3 meses adelante
+DO $$
+DECLARE
+  tabla TEXT;
+  columna TEXT;
+  inicio TIMESTAMPTZ;
+BEGIN
+  FOR tabla, columna IN
+    VALUES ('atencion', 'fecha_hora_atencion'), ('diagnostico', 'created_at'),
+           ('tecnologia_salud', 'created_at'), ('egreso', 'created_at')
+  LOOP
+    EXECUTE format('SELECT min(%I) FROM hcd.%I', columna, tabla || '_heap') INTO inicio;
+    PERFORM create_time_partitions(
+      table_name := format('hcd.%I', tabla)::regclass,
+      partition_interval := INTERVAL '1 month',
+      end_at := date_trunc('month', now()) + INTERVAL '4 months',
+      start_from := date_trunc('month', least(COALESCE(inicio, now()), now() - INTERVAL '2 years'))
+    );
+  END LOOP;
+END $$;
+
+-- 4) Distribuir con la misma colocación que usuario
+SELECT create_distributed_table('hcd.atencion', 'documento_id', colocate_with => 'hcd.usuario');
+SELECT create_distributed_table('hcd.diagnostico', 'documento_id', colocate_with => 'hcd.atencion');
+SELECT create_distributed_table('hcd.tecnologia_salud', 'documento_id', colocate_with => 'hcd.atencion');
+SELECT create_distributed_table('hcd.egreso', 'documento_id', colocate_with => 'hcd.atencion');
+
+-- 5) Copiar los datos (INSERT ... SELECT colocado: se ejecuta shard a shard en los workers)
+INSERT INTO hcd.atencion SELECT * FROM hcd.atencion_heap;
+INSERT INTO hcd.diagnostico SELECT * FROM hcd.diagnostico_heap;
+INSERT INTO hcd.tecnologia_salud SELECT * FROM hcd.tecnologia_salud_heap;
+INSERT INTO hcd.egreso SELECT * FROM hcd.egreso_heap;
+
+-- 6) Eliminar las tablas anteriores (libera los nombres de índices para init.sql)
+DROP TABLE hcd.diagnostico_heap, hcd.tecnologia_salud_heap, hcd.egreso_heap;
+DROP TABLE hcd.atencion_heap CASCADE;
+
+-- 7) Índices GIN de las particiones heap
+SELECT hcd.asegurar_indices_particion(partition)
+FROM time_partitions
+WHERE parent_table = 'hcd.atencion'::regclass AND access_method = 'heap' AND from_value IS NOT NULL;
+
+SELECT 'Tablas particionadas. Ejecute nuevamente infra/init.sql para crear índices y llaves foráneas.' AS status;
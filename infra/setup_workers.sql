@@ -4,6 +4,7 @@
 -- Crear la extensión Citus en cada worker
 CREATE EXTENSION IF NOT EXISTS citus;
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS unaccent;
 
 -- Verificar que las extensiones están creadas
-SELECT extname FROM pg_extension WHERE extname IN ('citus', 'uuid-ossp');
+SELECT extname FROM pg_extension WHERE extname IN ('citus', 'uuid-ossp', 'unaccent');
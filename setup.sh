@@ -69,8 +69,12 @@ print_step "Imagen construida y disponible en Minikube ✓"
 print_step "Aplicando configuración de Kubernetes (Citus y FastAPI)..."
 kubectl apply -f infra/k8s/citus-coordinator.yaml
 kubectl apply -f infra/k8s/citus-worker.yaml
+kubectl apply -f infra/k8s/redis.yaml
+kubectl apply -f infra/k8s/fastapi-compartido.yaml
 kubectl apply -f infra/k8s/fastapi-deployment.yaml
 kubectl apply -f infra/k8s/fastapi-service.yaml
+kubectl apply -f infra/k8s/rollup-cronjob.yaml
+kubectl apply -f infra/k8s/particiones-cronjob.yaml
 
 # 5. Dar tiempo para que Kubernetes cree los recursos
 print_step "Esperando a que Kubernetes cree los recursos..."
@@ -252,6 +256,7 @@ for WPOD in "${WORKER_PODS[@]}"; do
     PGPASSWORD=postgres kubectl exec "$WPOD" -- psql -U postgres -d postgres -c "CREATE DATABASE interop_db;" >/dev/null 2>&1 || true
     # Crear extensiones (ignorar error si ya existen)
     PGPASSWORD=postgres kubectl exec "$WPOD" -- psql -U postgres -d interop_db -c "CREATE EXTENSION IF NOT EXISTS citus;" >/dev/null 2>&1 || true
+    PGPASSWORD=postgres kubectl exec "$WPOD" -- psql -U postgres -d interop_db -c "CREATE EXTENSION IF NOT EXISTS unaccent;" >/dev/null 2>&1 || true
     echo "Worker $WPOD verificado ✓"
 done
 
@@ -278,6 +283,8 @@ if [ "$WORKERS_COUNT" -eq 0 ] && [ "${#WORKER_PODS[@]}" -gt 0 ]; then
     done
 else
     print_step "Los workers ya están registrados o no se detectaron pods de worker. ✓"
+    # Para workers agregados después de la instalación (registro y rebalanceo):
+    #   python3 backend/scripts/citus_cluster.py agregar --statefulset <réplicas> --rebalancear
 fi
 
 # Mostrar workers registrados (informativo)
@@ -299,12 +306,26 @@ if [ "$DIST_TABLE_COUNT" -eq 0 ] && [ "$FINAL_WORKER_COUNT" -gt 0 ]; then
     
     set +e # Desactivar exit on error temporalmente para capturar fallos
     
+    # Triggers de sincronización (lápidas y updated_at) en tablas distribuidas
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "ALTER DATABASE interop_db SET citus.enable_unsafe_triggers = on;"
     kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_reference_table('hcd.profesional_salud');"
     kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.usuario', 'documento_id');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.usuario_correo', 'correo');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.idempotencia', 'clave');"
     kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.atencion', 'documento_id');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.auditoria_acceso', 'documento_id', colocate_with => 'hcd.usuario');"
     kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.diagnostico', 'documento_id', colocate_with => 'hcd.atencion');"
     kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.tecnologia_salud', 'documento_id', colocate_with => 'hcd.atencion');"
     kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.egreso', 'documento_id', colocate_with => 'hcd.atencion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.outbox_evento', 'documento_id', colocate_with => 'hcd.atencion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.signo_vital', 'documento_id', colocate_with => 'hcd.atencion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.sync_eliminacion', 'documento_id', colocate_with => 'hcd.atencion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.administracion_medicamento', 'documento_id', colocate_with => 'hcd.atencion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_distributed_table('hcd.panel_medico', 'documento_id', colocate_with => 'hcd.atencion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_reference_table('hcd.rollup_atenciones_diarias');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_reference_table('hcd.rollup_atenciones_diarias_reconstruccion');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_reference_table('hcd.rollup_marca');"
+    kubectl exec "$COORDINATOR_POD" -- psql -U postgres -d interop_db -c "SELECT create_reference_table('hcd.censo_atencion_abierta');"
     
     set -e # Reactivar exit on error
 